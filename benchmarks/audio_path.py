@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Cost and quality of the voiceover's way into the final MP4.
+
+Renders the same scenes with a synthetic speech-like voiceover three ways:
+
+    transcode   MP3 decoded and re-encoded to AAC 128k (the old path)
+    copy        MP3 stream-copied into the MP4 (the default now)
+    loudnorm    one decode, single-pass EBU R128 normalization, one AAC encode
+
+Scene clips are encoded once up front, so the timings cover only the final
+mux run where the audio is handled. Quality is the SNR of the audio decoded
+from the MP4 against the voiceover decoded directly ("identical" when the
+samples match exactly), plus integrated loudness and true peak of each result.
+
+    python benchmarks/audio_path.py
+    python benchmarks/audio_path.py --seconds 120 --bitrate 48k --sample-rate 24000   # edge-tts-like input
+"""
+
+import sys
+import math
+import array
+import asyncio
+import argparse
+import logging
+import re
+import statistics
+import subprocess
+import tempfile
+from pathlib import Path
+from typing import Dict, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from common import Stopwatch, environment_info, have_ffmpeg, save_report
+from PIL import Image
+
+from services.video_service import VideoService
+
+MODES = ("transcode", "copy", "loudnorm")
+
+# Voiced band-limited tones with syllable-rate envelopes and a little noise
+SPEECH_LIKE = (
+    "0.25*sin(2*PI*180*t)*(0.55+0.45*sin(2*PI*4*t))"
+    "+0.12*sin(2*PI*720*t+sin(2*PI*3*t))*(0.5+0.5*sin(2*PI*5.5*t))"
+    "+0.05*sin(2*PI*2600*t)*(0.5+0.5*sin(2*PI*7*t))"
+    "+0.01*(random(0)-0.5)"
+)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=int, default=60, help="voiceover length")
+    parser.add_argument("--bitrate", default="128k", help="voiceover MP3 bitrate (ElevenLabs default: 128k)")
+    parser.add_argument("--sample-rate", type=int, default=44100, help="voiceover sample rate")
+    parser.add_argument("--scenes", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per mode; the median is reported")
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--output", default=None)
+    return parser.parse_args()
+
+
+def make_voiceover(path: Path, args) -> Path:
+    cmd = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"aevalsrc={SPEECH_LIKE}:s={args.sample_rate}:d={args.seconds}",
+        "-ac", "1", "-c:a", "libmp3lame", "-b:a", args.bitrate, "-y", str(path)
+    ]
+    subprocess.run(cmd, check=True, capture_output=True, timeout=300)
+    return path
+
+
+def make_images(directory: Path, count: int):
+    paths = []
+    for i in range(count):
+        path = directory / f"image_{i + 1:02d}.png"
+        Image.new("RGB", (512, 512), (40 * i % 256, 90, 160)).save(path)
+        paths.append(path)
+    return paths
+
+
+def decode_pcm(path: Path, sample_rate: int) -> array.array:
+    """Audio of path as mono signed 16-bit samples"""
+    cmd = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-i", str(path),
+        "-map", "0:a", "-ac", "1", "-ar", str(sample_rate), "-f", "s16le", "-"
+    ]
+    samples = array.array("h")
+    samples.frombytes(subprocess.run(cmd, check=True, capture_output=True, timeout=300).stdout)
+    return samples
+
+
+def snr_db(reference: array.array, test: array.array) -> Optional[float]:
+    """SNR of test against reference over their common length; None when identical"""
+    length = min(len(reference), len(test))
+    signal = noise = 0
+    for ref, sample in zip(reference[:length], test[:length]):
+        signal += ref * ref
+        noise += (ref - sample) * (ref - sample)
+    if noise == 0:
+        return None
+    return round(10 * math.log10(signal / noise), 2)
+
+
+def loudness(path: Path) -> Dict[str, Optional[float]]:
+    """Integrated loudness (LUFS) and true peak (dBTP) from ffmpeg's EBU R128 scanner"""
+    cmd = ["ffmpeg", "-hide_banner", "-nostats", "-i", str(path), "-map", "0:a",
+           "-af", "ebur128=peak=true", "-f", "null", "-"]
+    stderr = subprocess.run(cmd, capture_output=True, text=True, timeout=300).stderr
+    summary = stderr[stderr.rfind("Summary:"):]
+    integrated = re.search(r"I:\s+(-?[\d.]+) LUFS", summary)
+    peak = re.search(r"Peak:\s+(-?[\d.]+) dBFS", summary)
+    return {
+        "integrated_lufs": float(integrated.group(1)) if integrated else None,
+        "true_peak_dbtp": float(peak.group(1)) if peak else None
+    }
+
+
+def configure(video_service: VideoService, mode: str):
+    video_service.audio_copy = mode == "copy"
+    video_service.loudnorm = mode == "loudnorm"
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    if not have_ffmpeg():
+        print("ffmpeg not found")
+        sys.exit(1)
+
+    video_service = VideoService()
+    results = []
+    with tempfile.TemporaryDirectory(prefix="runhistory-audio-") as tmp:
+        workdir = Path(tmp)
+        voiceover = make_voiceover(workdir / "voiceover.mp3", args)
+        images = make_images(workdir, args.scenes)
+        output = workdir / "final_video.mp4"
+        reference = decode_pcm(voiceover, 44100)
+        source_loudness = loudness(voiceover)
+
+        def render():
+            asyncio.run(video_service._create_video_with_ffmpeg(
+                image_paths=images,
+                voiceover_path=voiceover,
+                output_path=output,
+                audio_duration=float(args.seconds)
+            ))
+
+        # Fill the scene clip cache; every timed run below is only the mux
+        render()
+
+        for mode in args.modes.split(","):
+            configure(video_service, mode)
+            walls, cpus = [], []
+            for _ in range(args.repeat):
+                with Stopwatch() as watch:
+                    render()
+                walls.append(watch.wall)
+                cpus.append(watch.cpu)
+            snr = snr_db(reference, decode_pcm(output, 44100))
+            result = {
+                "mode": mode,
+                "wall_s": round(statistics.median(walls), 4),
+                "cpu_s": round(statistics.median(cpus), 4),
+                "runs": [round(w, 4) for w in walls],
+                "output_bytes": output.stat().st_size,
+                # Gain changes make SNR meaningless for the normalized output
+                "snr_db": None if mode == "loudnorm" else (snr if snr is not None else "identical"),
+                **loudness(output)
+            }
+            results.append(result)
+            snr = result["snr_db"]
+            quality = "SNR n/a" if snr is None else ("samples identical" if snr == "identical" else f"SNR {snr} dB")
+            print(f"{mode:>9}: mux {result['wall_s']:.3f} s wall, {result['cpu_s']:.3f} s cpu; "
+                  f"{quality}; {result['integrated_lufs']} LUFS, "
+                  f"{result['true_peak_dbtp']} dBTP; {result['output_bytes']} bytes")
+
+    report = {
+        "benchmark": "audio_path",
+        "config": vars(args),
+        "environment": environment_info(),
+        "source": source_loudness,
+        "results": results
+    }
+    path = save_report(report, args.output, "audio_path")
+    print(f"Report written to {path}")
+
+
+if __name__ == "__main__":
+    main()
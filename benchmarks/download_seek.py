@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Seek-heavy playback against /download.
+
+Serves one finished session from a real uvicorn server and plays it back the
+way a browser video element does: an open request (Range: bytes=0-) that is
+abandoned once enough is buffered, a series of seeks to random offsets (each
+a new open-ended range, abandoned after --read-kib), one multi-range request,
+and finally a replay of the whole file. Every viewer is run twice:
+
+    plain       the old handler: a FileResponse without validators, so a
+                replay downloads everything again
+    validated   /download with its content ETag: the replay is conditional
+                (If-None-Match) and answered with 304, and seeks carry If-Range
+
+Then checks that a three-range request comes back as a well-formed
+multipart/byteranges body with the right bytes. Reports latency
+percentiles per request kind, bytes moved, and full-download
+throughput for a few DownloadResponse chunk sizes.
+
+    python benchmarks/download_seek.py
+    python benchmarks/download_seek.py --megabytes 200 --viewers 16 --seeks 40
+"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import logging
+import tempfile
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+import aiohttp
+import uvicorn
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from common import REPO_ROOT, environment_info, free_port, save_report, summarize
+
+SESSION_ID = "00000000-0000-4000-8000-00000000bench"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--megabytes", type=int, default=64, help="size of the served video")
+    parser.add_argument("--viewers", type=int, default=8, help="concurrent playback sessions")
+    parser.add_argument("--seeks", type=int, default=20, help="seeks per viewer")
+    parser.add_argument("--read-kib", type=int, default=512, help="bytes buffered per seek before it is abandoned")
+    parser.add_argument("--chunk-sizes", default="65536,262144,1048576", help="DownloadResponse chunk sizes to compare")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default=None)
+    return parser.parse_args()
+
+
+def prepare_session(megabytes: int):
+    """A completed session whose video is random bytes (serving does not look inside)"""
+    import main
+    from models.models import GenerationStatus
+    from utils.checkpoint import SessionCheckpoint
+
+    session_dir = Path("generated") / SESSION_ID
+    session_dir.mkdir(parents=True, exist_ok=True)
+    video_path = session_dir / "final_video.mp4"
+    with open(video_path, 'wb') as f:
+        for _ in range(megabytes):
+            f.write(os.urandom(1 << 20))
+    checkpoint = SessionCheckpoint.create(session_dir, SESSION_ID, "benchmark")
+    checkpoint.record_video(video_path, [], {"landscape": video_path})
+    checkpoint.record_digests([video_path])
+    main.generation_status[SESSION_ID] = GenerationStatus(
+        session_id=SESSION_ID, status="completed", progress=100, video_path=str(video_path)
+    )
+    return video_path
+
+
+def add_plain_route(app, video_path: Path):
+    """The handler as it was: no validators, no cache headers"""
+    from fastapi.responses import FileResponse
+
+    async def plain_download(session_id: str):
+        return FileResponse(video_path, media_type="video/mp4", filename=f"history_{session_id}.mp4")
+
+    app.add_api_route("/plain-download/{session_id}", plain_download)
+
+
+async def timed_get(http: aiohttp.ClientSession, url: str, headers: Dict[str, str],
+                    limit: Optional[int] = None) -> Dict[str, Any]:
+    """GET url, reading at most limit body bytes before dropping the connection"""
+    started = time.perf_counter()
+    async with http.get(url, headers=headers) as response:
+        first_byte = time.perf_counter() - started
+        received = 0
+        async for chunk in response.content.iter_chunked(64 * 1024):
+            received += len(chunk)
+            if limit is not None and received >= limit:
+                response.close()
+                break
+        return {
+            "status": response.status,
+            "etag": response.headers.get("ETag"),
+            "cache_control": response.headers.get("Cache-Control"),
+            "ttfb": first_byte,
+            "total": time.perf_counter() - started,
+            "bytes": received
+        }
+
+
+async def viewer(http: aiohttp.ClientSession, url: str, size: int, args, rng: random.Random,
+                 validated: bool) -> Dict[str, List[Dict[str, Any]]]:
+    limit = args.read_kib * 1024
+    kinds: Dict[str, List[Dict[str, Any]]] = {"open": [], "seek": [], "multirange": [], "replay": []}
+
+    opened = await timed_get(http, url, {"Range": "bytes=0-"}, limit)
+    kinds["open"].append(opened)
+    etag = opened["etag"] if validated else None
+
+    for _ in range(args.seeks):
+        start = rng.randrange(0, size - limit)
+        headers = {"Range": f"bytes={start}-"}
+        if etag:
+            headers["If-Range"] = etag
+        kinds["seek"].append(await timed_get(http, url, headers, limit))
+
+    # e.g. an MP4 demuxer fetching the moov box at the end and a few sample tables
+    spans = sorted(rng.randrange(0, size - 65536) for _ in range(3))
+    ranges = ",".join(f"{start}-{start + 65535}" for start in spans) + ",-65536"
+    kinds["multirange"].append(await timed_get(http, url, {"Range": f"bytes={ranges}"}))
+
+    kinds["replay"].append(await timed_get(http, url, {"If-None-Match": etag} if etag else {}))
+    return kinds
+
+
+def summarize_kind(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    statuses: Dict[str, int] = {}
+    for result in results:
+        statuses[str(result["status"])] = statuses.get(str(result["status"]), 0) + 1
+    return {
+        "statuses": statuses,
+        "ttfb_ms": summarize([r["ttfb"] for r in results], 1000, 2),
+        "total_ms": summarize([r["total"] for r in results], 1000, 2),
+        "bytes": sum(r["bytes"] for r in results)
+    }
+
+
+async def playback(base_url: str, path: str, size: int, args, validated: bool) -> Dict[str, Any]:
+    rng = random.Random(args.seed)
+    url = f"{base_url}{path}"
+    started = time.perf_counter()
+    async with aiohttp.ClientSession() as http:
+        viewers = await asyncio.gather(*(
+            viewer(http, url, size, args, random.Random(rng.random()), validated) for _ in range(args.viewers)
+        ))
+    wall = time.perf_counter() - started
+    merged: Dict[str, List[Dict[str, Any]]] = {}
+    for kinds in viewers:
+        for kind, results in kinds.items():
+            merged.setdefault(kind, []).extend(results)
+    return {
+        "wall_s": round(wall, 3),
+        "bytes": sum(r["bytes"] for results in merged.values() for r in results),
+        "kinds": {kind: summarize_kind(results) for kind, results in merged.items()},
+        "cache_control": merged["open"][0]["cache_control"]
+    }
+
+
+async def check_multirange(base_url: str, path: str, video_path: Path) -> Dict[str, Any]:
+    """Request three ranges and check the answer is a parseable multipart/byteranges body with the right bytes"""
+    data = video_path.read_bytes()
+    size = len(data)
+    wanted = [(0, 9), (100, 109), (size - 10, size - 1)]
+    header = "bytes=" + ",".join(f"{start}-{end}" for start, end in wanted)
+    async with aiohttp.ClientSession() as http:
+        async with http.get(base_url + path, headers={"Range": header}) as response:
+            status = response.status
+            content_type = response.headers.get("Content-Type", "")
+            body = await response.read()
+    problems = []
+    if status != 206:
+        problems.append(f"status {status}")
+    if not content_type.startswith("multipart/byteranges; boundary="):
+        problems.append(f"Content-Type {content_type!r}")
+    else:
+        delimiter = b"--" + content_type.split("boundary=", 1)[1].encode()
+        parts = [part for part in body.split(delimiter)[1:] if not part.startswith(b"--")]
+        if len(parts) != len(wanted):
+            problems.append(f"{len(parts)} parts for {len(wanted)} ranges")
+        for part, (start, end) in zip(parts, wanted):
+            head, _, payload = part.partition(b"\r\n\r\n")
+            if f"Content-Range: bytes {start}-{end}/{size}".encode() not in head:
+                problems.append(f"part header {head!r}")
+            if payload.removesuffix(b"\r\n") != data[start:end + 1]:
+                problems.append(f"wrong bytes for {start}-{end}")
+    return {"status": status, "content_type": content_type, "ok": not problems, "problems": problems}
+
+
+async def throughput(base_url: str, path: str, size: int, chunk_size: int, repeat: int = 3) -> Dict[str, Any]:
+    from utils.http_cache import DownloadResponse
+
+    DownloadResponse.chunk_size = chunk_size
+    walls = []
+    async with aiohttp.ClientSession() as http:
+        for _ in range(repeat):
+            result = await timed_get(http, f"{base_url}{path}", {})
+            walls.append(result["total"])
+    best = min(walls)
+    return {"chunk_size": chunk_size, "best_s": round(best, 4), "mb_per_s": round(size / best / 1e6, 1)}
+
+
+async def drive(args, video_path: Path) -> Dict[str, Any]:
+    import main
+    from utils.http_cache import DownloadResponse
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+    base_url = f"http://127.0.0.1:{port}"
+    size = video_path.stat().st_size
+
+    results: Dict[str, Any] = {}
+    default_chunk = DownloadResponse.chunk_size
+    for mode, path in (("plain", f"/plain-download/{SESSION_ID}"), ("validated", f"/download/{SESSION_ID}")):
+        results[mode] = await playback(base_url, path, size, args, validated=mode == "validated")
+        kinds = results[mode]["kinds"]
+        print(f"{mode:>9}: {results[mode]['bytes'] / 1e6:.1f} MB moved in {results[mode]['wall_s']} s; "
+              f"seek ttfb p50 {kinds['seek']['ttfb_ms'].get('p50')} ms p95 {kinds['seek']['ttfb_ms'].get('p95')} ms; "
+              f"multirange {kinds['multirange']['statuses']}; replay {kinds['replay']['statuses']} "
+              f"p50 {kinds['replay']['total_ms'].get('p50')} ms")
+
+    results["multirange_check"] = await check_multirange(base_url, f"/download/{SESSION_ID}", video_path)
+    check = results["multirange_check"]
+    print(f"multirange: {'ok' if check['ok'] else 'BROKEN ' + '; '.join(check['problems'])} "
+          f"({check['status']}, {check['content_type']})")
+
+    results["throughput"] = []
+    for chunk_size in (int(c) for c in args.chunk_sizes.split(",")):
+        result = await throughput(base_url, f"/download/{SESSION_ID}", size, chunk_size)
+        results["throughput"].append(result)
+        print(f"chunk {chunk_size:>8}: full download {result['best_s']} s ({result['mb_per_s']} MB/s)")
+    DownloadResponse.chunk_size = default_chunk
+
+    server.should_exit = True
+    await server_task
+    return results
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ.setdefault("WARMUP_ON_STARTUP", "false")
+
+    # Sessions live in generated/ relative to the working directory
+    workdir = tempfile.mkdtemp(prefix="runhistory-download-")
+    os.symlink(REPO_ROOT / "static", Path(workdir) / "static")
+    os.chdir(workdir)
+
+    import main as app_module
+    video_path = prepare_session(args.megabytes)
+    add_plain_route(app_module.app, video_path)
+    results = asyncio.run(drive(args, video_path))
+
+    report = {
+        "benchmark": "download_seek",
+        "config": vars(args),
+        "environment": environment_info(),
+        "results": results
+    }
+    path = save_report(report, args.output, "download_seek")
+    print(f"Report written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+End-to-end throughput benchmark.
+
+Starts local fake OpenAI/ElevenLabs backends, runs the FastAPI app in-process
+and drives /generate + /status with N concurrent sessions. Reports sessions per
+minute, end-to-end latency percentiles, event-loop lag and peak RSS, and saves
+the report as JSON so releases can be compared.
+
+    python benchmarks/e2e_throughput.py --sessions 20 --concurrency 5
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import logging
+import tempfile
+from pathlib import Path
+
+import aiohttp
+import uvicorn
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from common import (
+    REPO_ROOT, LoopLagProbe, summarize, peak_rss_mb, environment_info, save_report, free_port
+)
+from fake_backends import BackendConfig, FakeBackends
+
+logger = logging.getLogger("e2e_throughput")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=10, help="total sessions to run")
+    parser.add_argument("--concurrency", type=int, default=5, help="sessions in flight at once")
+    parser.add_argument("--poll-interval", type=float, default=0.5, help="seconds between /status polls")
+    parser.add_argument("--timeout", type=float, default=900, help="per-session timeout in seconds")
+    parser.add_argument("--chat-latency", type=float, default=2.0)
+    parser.add_argument("--image-latency", type=float, default=8.0)
+    parser.add_argument("--tts-latency", type=float, default=3.0)
+    parser.add_argument("--jitter", type=float, default=0.2, help="latency jitter as a fraction of the base")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of backend calls answered with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of backend calls answered with 429")
+    parser.add_argument("--image-px", type=int, default=1024, help="edge length of the fake images")
+    parser.add_argument("--audio-seconds", type=float, default=20.0, help="length of the fake voiceover")
+    parser.add_argument("--scenes", type=int, default=12, help="image prompts per fake script")
+    parser.add_argument("--output", help="report path (default benchmarks/results/e2e_<timestamp>.json)")
+    return parser.parse_args()
+
+
+async def run_session(http: aiohttp.ClientSession, base_url: str, index: int, args) -> dict:
+    started = time.perf_counter()
+    # One client per concurrency lane, so per-client caps do not throttle the run
+    headers = {"X-API-Key": f"bench-{index % args.concurrency}"}
+    async with http.post(f"{base_url}/generate", json={"topic": f"Benchmark topic {index}"},
+                         headers=headers) as response:
+        response.raise_for_status()
+        session_id = (await response.json())["session_id"]
+
+    status = {}
+    while time.perf_counter() - started < args.timeout:
+        await asyncio.sleep(args.poll_interval)
+        async with http.get(f"{base_url}/status/{session_id}") as response:
+            status = await response.json()
+        if status.get("status") in ("completed", "error", "cancelled"):
+            break
+
+    return {
+        "session_id": session_id,
+        "status": status.get("status", "timeout"),
+        "message": status.get("message"),
+        "latency": time.perf_counter() - started
+    }
+
+
+async def drive(args, backends: FakeBackends) -> dict:
+    import main
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+    base_url = f"http://127.0.0.1:{port}"
+
+    probe = LoopLagProbe()
+    probe.start()
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def bounded(http, index):
+        async with semaphore:
+            return await run_session(http, base_url, index, args)
+
+    wall_start = time.perf_counter()
+    async with aiohttp.ClientSession() as http:
+        results = await asyncio.gather(*(bounded(http, i) for i in range(args.sessions)))
+    wall = time.perf_counter() - wall_start
+
+    loop_lag = await probe.stop()
+    server.should_exit = True
+    await server_task
+
+    completed = [r for r in results if r["status"] == "completed"]
+    failures = {}
+    for r in results:
+        if r["status"] != "completed":
+            failures[r["message"] or r["status"]] = failures.get(r["message"] or r["status"], 0) + 1
+
+    return {
+        "sessions": args.sessions,
+        "completed": len(completed),
+        "failed": args.sessions - len(completed),
+        "failure_messages": failures,
+        "wall_seconds": round(wall, 3),
+        "sessions_per_minute": round(len(completed) / wall * 60, 3) if wall else None,
+        "latency_seconds": summarize([r["latency"] for r in completed]),
+        "event_loop_lag_ms": loop_lag,
+        "peak_rss_mb": peak_rss_mb(),
+        "backend_calls": dict(backends.counters)
+    }
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+
+    config = BackendConfig(
+        chat_latency=args.chat_latency,
+        image_latency=args.image_latency,
+        tts_latency=args.tts_latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        image_px=args.image_px,
+        audio_seconds=args.audio_seconds,
+        scenes=args.scenes
+    )
+    backends = FakeBackends(config).start()
+    os.environ.update(backends.environment())
+    os.environ.setdefault("RENDER_SLOTS", str(args.concurrency))
+    os.environ.setdefault("API_KEYS", ",".join(f"bench-{index}" for index in range(args.concurrency)))
+
+    # Sessions write to generated/ relative to the working directory, so run in
+    # a scratch directory that only borrows the static frontend.
+    workdir = tempfile.mkdtemp(prefix="runhistory-bench-")
+    os.symlink(REPO_ROOT / "static", Path(workdir) / "static")
+    os.chdir(workdir)
+
+    try:
+        results = asyncio.run(drive(args, backends))
+    finally:
+        backends.stop()
+
+    report = {
+        "benchmark": "e2e_throughput",
+        "environment": environment_info(),
+        "config": {
+            **vars(config),
+            "sessions": args.sessions,
+            "concurrency": args.concurrency,
+            "poll_interval": args.poll_interval
+        },
+        "results": results,
+        "workdir": workdir
+    }
+    path = save_report(report, args.output, "e2e")
+
+    print(f"completed {results['completed']}/{results['sessions']} sessions in {results['wall_seconds']}s "
+          f"({results['sessions_per_minute']} sessions/min)")
+    print(f"latency p50={results['latency_seconds'].get('p50')}s p95={results['latency_seconds'].get('p95')}s; "
+          f"loop lag p95={results['event_loop_lag_ms'].get('p95')}ms; peak rss={results['peak_rss_mb']}")
+    print(f"report: {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Fair-share scheduling under a flooding client.
+
+Starts the fake OpenAI/ElevenLabs backends and the app in-process. One bulk
+client submits --flood generations at once; shortly after, an interactive
+client submits --interactive generations one after another, each waiting for
+the previous to finish (a person using the page). Runs twice:
+
+    unscheduled   slots, per-client caps and quotas out of the way: every
+                  generation starts on arrival, as before the scheduler
+    fair          the default scheduler, the flood sent as priority "bulk"
+
+Reports the interactive client's queue wait and end-to-end latency, and the
+time the whole flood took.
+
+    python benchmarks/fair_share.py
+    python benchmarks/fair_share.py --flood 24 --interactive 4 --slots 4
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import logging
+import tempfile
+from pathlib import Path
+from typing import Dict, Any
+
+import aiohttp
+import uvicorn
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from common import REPO_ROOT, environment_info, free_port, save_report, summarize
+from fake_backends import BackendConfig, FakeBackends
+
+MODES = {
+    "unscheduled": {"RENDER_SLOTS": "10000", "CLIENT_MAX_RUNNING": "10000", "CLIENT_MAX_QUEUED": "10000"},
+    "fair": {}
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--flood", type=int, default=16, help="generations the bulk client submits at once")
+    parser.add_argument("--interactive", type=int, default=3, help="generations the interactive client runs in turn")
+    parser.add_argument("--slots", type=int, default=4, help="RENDER_SLOTS in fair mode")
+    parser.add_argument("--chat-latency", type=float, default=0.5)
+    parser.add_argument("--image-latency", type=float, default=1.0)
+    parser.add_argument("--tts-latency", type=float, default=0.5)
+    parser.add_argument("--scenes", type=int, default=6)
+    parser.add_argument("--audio-seconds", type=float, default=10.0)
+    parser.add_argument("--poll-interval", type=float, default=0.1)
+    parser.add_argument("--output", default=None)
+    return parser.parse_args()
+
+
+async def generate(http: aiohttp.ClientSession, base_url: str, topic: str, api_key: str, priority: str,
+                   poll_interval: float) -> Dict[str, Any]:
+    """Submit one generation and poll it to the end; returns its queue wait and latency"""
+    started = time.perf_counter()
+    async with http.post(f"{base_url}/generate", json={"topic": topic, "priority": priority},
+                         headers={"X-API-Key": api_key}) as response:
+        if response.status == 429:
+            return {"status": "rejected", "wait": 0.0, "latency": time.perf_counter() - started}
+        response.raise_for_status()
+        session_id = (await response.json())["session_id"]
+    waited = None
+    while True:
+        await asyncio.sleep(poll_interval)
+        async with http.get(f"{base_url}/status/{session_id}") as response:
+            status = await response.json()
+        if waited is None and status["status"] != "queued":
+            waited = time.perf_counter() - started
+        if status["status"] in ("completed", "error", "cancelled"):
+            return {"status": status["status"], "wait": waited, "latency": time.perf_counter() - started}
+
+
+async def run_mode(args, mode: str) -> Dict[str, Any]:
+    import main
+    import utils.scheduler
+
+    os.environ.update({"RENDER_SLOTS": str(args.slots), **MODES[mode]})
+    utils.scheduler._scheduler = None
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+    base_url = f"http://127.0.0.1:{port}"
+
+    async with aiohttp.ClientSession() as http:
+        async def interactive_user():
+            await asyncio.sleep(1.0)
+            results = []
+            for index in range(args.interactive):
+                results.append(await generate(http, base_url, f"{mode} interactive {index}", "person", "interactive",
+                                              args.poll_interval))
+            return results
+
+        started = time.perf_counter()
+        flood = asyncio.gather(*(
+            generate(http, base_url, f"{mode} flood {index}", "script", "bulk", args.poll_interval)
+            for index in range(args.flood)
+        ))
+        interactive = await interactive_user()
+        bulk = await flood
+        flood_wall = time.perf_counter() - started
+        async with http.get(f"{base_url}/debug/scheduler") as response:
+            scheduler = await response.json()
+
+    server.should_exit = True
+    await server_task
+    return {
+        "interactive_wait_s": summarize([r["wait"] for r in interactive]),
+        "interactive_latency_s": summarize([r["latency"] for r in interactive]),
+        "interactive_statuses": [r["status"] for r in interactive],
+        "bulk_completed": sum(1 for r in bulk if r["status"] == "completed"),
+        "bulk_latency_s": summarize([r["latency"] for r in bulk]),
+        "flood_wall_s": round(flood_wall, 2),
+        "scheduler": scheduler
+    }
+
+
+async def drive(args) -> Dict[str, Any]:
+    results = {}
+    for mode in MODES:
+        results[mode] = await run_mode(args, mode)
+        result = results[mode]
+        print(f"{mode:>11}: interactive wait p50 {result['interactive_wait_s'].get('p50')} s, "
+              f"latency p50 {result['interactive_latency_s'].get('p50')} s max "
+              f"{result['interactive_latency_s'].get('max')} s; flood of {args.flood} done in "
+              f"{result['flood_wall_s']} s ({result['bulk_completed']} completed)")
+    return results
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ.setdefault("WARMUP_ON_STARTUP", "false")
+    # Identical topics would share pipelines and hide the queueing
+    os.environ["COALESCE_REQUESTS"] = "false"
+    # Both clients connect from 127.0.0.1: only known keys tell them apart
+    os.environ["API_KEYS"] = "person,script"
+
+    config = BackendConfig(
+        chat_latency=args.chat_latency,
+        image_latency=args.image_latency,
+        tts_latency=args.tts_latency,
+        audio_seconds=args.audio_seconds,
+        scenes=args.scenes
+    )
+    backends = FakeBackends(config).start()
+    os.environ.update(backends.environment())
+
+    workdir = tempfile.mkdtemp(prefix="runhistory-fair-")
+    os.symlink(REPO_ROOT / "static", Path(workdir) / "static")
+    os.chdir(workdir)
+
+    try:
+        results = asyncio.run(drive(args))
+    finally:
+        backends.stop()
+
+    report = {
+        "benchmark": "fair_share",
+        "config": {**vars(args), **vars(config)},
+        "environment": environment_info(),
+        "results": results
+    }
+    path = save_report(report, args.output, "fair_share")
+    print(f"Report written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""
+Local stand-ins for the OpenAI chat/image API and the ElevenLabs TTS API.
+
+The server runs on its own event loop in a background thread so that it does
+not distort event-loop measurements taken in the process under test.
+"""
+
+import io
+import json
+import time
+import random
+import asyncio
+import threading
+import subprocess
+import logging
+from dataclasses import dataclass
+from typing import Optional
+
+from aiohttp import web
+from PIL import Image
+
+from common import free_port
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BackendConfig:
+    chat_latency: float = 2.0
+    image_latency: float = 8.0
+    tts_latency: float = 3.0
+    jitter: float = 0.2
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    image_px: int = 1024
+    audio_seconds: float = 20.0
+    scenes: int = 12
+    seed: int = 1
+
+
+def make_png(size: int, seed: int) -> bytes:
+    """Noisy PNG; noise keeps the compressed size close to a real DALL-E image"""
+    rng = random.Random(seed)
+    img = Image.frombytes("RGB", (size, size), rng.randbytes(size * size * 3))
+    buffer = io.BytesIO()
+    img.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def make_mp3(seconds: float) -> bytes:
+    """Tone MP3 via ffmpeg; falls back to filler bytes when ffmpeg is missing"""
+    cmd = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"sine=frequency=440:sample_rate=44100:duration={seconds}",
+        "-ac", "2", "-b:a", "128k", "-f", "mp3", "-"
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True, timeout=60)
+        if result.returncode == 0:
+            return result.stdout
+    except (FileNotFoundError, subprocess.TimeoutExpired):
+        pass
+    logger.warning("ffmpeg not available, fake TTS returns non-audio filler bytes")
+    return bytes(int(seconds * 16000))
+
+
+class FakeBackends:
+    """OpenAI- and ElevenLabs-compatible HTTP server with configurable behaviour"""
+
+    def __init__(self, config: BackendConfig):
+        self.config = config
+        self.port = free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        self.rng = random.Random(config.seed)
+        self.image_bytes = make_png(config.image_px, config.seed)
+        self.audio_bytes = make_mp3(config.audio_seconds)
+        self.counters = {"chat": 0, "image": 0, "tts": 0, "download": 0, "errors": 0, "rate_limited": 0}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._runner: Optional[web.AppRunner] = None
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+
+    # -- behaviour -------------------------------------------------------
+
+    async def _delay(self, base: float):
+        if base > 0:
+            spread = base * self.config.jitter
+            await asyncio.sleep(max(0.0, base + self.rng.uniform(-spread, spread)))
+
+    def _failure(self) -> Optional[web.Response]:
+        roll = self.rng.random()
+        if roll < self.config.rate_limit_rate:
+            self.counters["rate_limited"] += 1
+            return web.json_response(
+                {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                status=429, headers={"retry-after": "1"}
+            )
+        if roll < self.config.rate_limit_rate + self.config.error_rate:
+            self.counters["errors"] += 1
+            return web.json_response({"error": {"message": "Injected failure", "type": "server_error"}}, status=500)
+        return None
+
+    def _script(self, topic: str) -> dict:
+        scenes = self.config.scenes
+        return {
+            "script": " ".join(
+                f"Sentence {i + 1} of the story about {topic}, told with some dramatic detail."
+                for i in range(scenes)
+            ),
+            "image_prompts": [f"Scene {i + 1} of {topic}, wide establishing shot" for i in range(scenes)],
+            "text_overlays": [f"{topic}, part {i + 1}" for i in range(scenes)],
+            "duration": int(self.config.audio_seconds)
+        }
+
+    # -- handlers --------------------------------------------------------
+
+    async def chat_completions(self, request: web.Request) -> web.StreamResponse:
+        self.counters["chat"] += 1
+        body = await request.json()
+        topic = body["messages"][-1]["content"].split(":", 1)[-1].split("\n", 1)[0].strip()
+        content = json.dumps(self._script(topic))
+        if body.get("stream"):
+            return await self._stream_chat(request, body, content)
+        await self._delay(self.config.chat_latency)
+        failure = self._failure()
+        if failure:
+            return failure
+        return web.json_response({
+            "id": f"chatcmpl-{self.counters['chat']}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-4o"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": 300, "completion_tokens": len(content) // 4, "total_tokens": 300 + len(content) // 4}
+        })
+
+    async def _stream_chat(self, request: web.Request, body: dict, content: str) -> web.StreamResponse:
+        """Server-sent chunks spread over chat_latency, like a model emitting tokens"""
+        await self._delay(self.config.chat_latency * 0.1)
+        failure = self._failure()
+        if failure:
+            return failure
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        pieces = [content[i:i + 16] for i in range(0, len(content), 16)]
+        pause = self.config.chat_latency * 0.9 / max(len(pieces), 1)
+        created = int(time.time())
+
+        def event(delta: dict, finish_reason=None) -> bytes:
+            chunk = {
+                "id": f"chatcmpl-{self.counters['chat']}",
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": body.get("model", "gpt-4o"),
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            }
+            return f"data: {json.dumps(chunk)}\n\n".encode()
+
+        await response.write(event({"role": "assistant", "content": ""}))
+        for piece in pieces:
+            await asyncio.sleep(pause)
+            await response.write(event({"content": piece}))
+        await response.write(event({}, "stop"))
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def image_generations(self, request: web.Request) -> web.Response:
+        self.counters["image"] += 1
+        await request.json()
+        await self._delay(self.config.image_latency)
+        failure = self._failure()
+        if failure:
+            return failure
+        return web.json_response({
+            "created": int(time.time()),
+            "data": [{"url": f"{self.base_url}/files/image_{self.counters['image']}.png"}]
+        })
+
+    async def image_file(self, request: web.Request) -> web.Response:
+        self.counters["download"] += 1
+        return web.Response(body=self.image_bytes, content_type="image/png")
+
+    async def text_to_speech(self, request: web.Request) -> web.Response:
+        self.counters["tts"] += 1
+        await request.json()
+        await self._delay(self.config.tts_latency)
+        failure = self._failure()
+        if failure:
+            return failure
+        return web.Response(body=self.audio_bytes, content_type="audio/mpeg")
+
+    # -- lifecycle -------------------------------------------------------
+
+    def _build_app(self) -> web.Application:
+        app = web.Application(client_max_size=16 * 1024 * 1024)
+        app.router.add_post("/v1/chat/completions", self.chat_completions)
+        app.router.add_post("/v1/images/generations", self.image_generations)
+        app.router.add_get("/files/{name}", self.image_file)
+        app.router.add_post("/v1/text-to-speech/{voice_id}", self.text_to_speech)
+        return app
+
+    def _serve(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._runner = web.AppRunner(self._build_app(), access_log=None)
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, "127.0.0.1", self.port)
+        self._loop.run_until_complete(site.start())
+        self._ready.set()
+        self._loop.run_forever()
+        self._loop.run_until_complete(self._runner.cleanup())
+        self._loop.close()
+
+    def start(self) -> "FakeBackends":
+        self._thread = threading.Thread(target=self._serve, name="fake-backends", daemon=True)
+        self._thread.start()
+        self._ready.wait(timeout=30)
+        logger.info(f"Fake backends listening on {self.base_url}")
+        return self
+
+    def stop(self):
+        if self._loop:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._thread:
+            self._thread.join(timeout=10)
+
+    def environment(self) -> dict:
+        """Environment variables that point the services at this server"""
+        return {
+            "OPENAI_API_KEY": "benchmark",
+            "OPENAI_BASE_URL": f"{self.base_url}/v1",
+            "ELEVENLABS_API_KEY": "benchmark",
+            "ELEVENLABS_BASE_URL": f"{self.base_url}/v1"
+        }
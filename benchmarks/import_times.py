@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Cold-start measurements: how long `import main` takes in a fresh interpreter,
+which modules dominate it (python -X importtime), how long each service takes
+to build on first use, and how long `python main.py` takes to answer /health.
+
+    python benchmarks/import_times.py                       # measure this checkout
+    python benchmarks/import_times.py --repo /path/to/other/checkout --label before
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+import urllib.request
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from common import REPO_ROOT, RESULTS_DIR, environment_info, free_port
+
+DEFAULT_OUTPUT = RESULTS_DIR / "import_times.json"
+
+BUILD_SERVICES = """
+import json, time
+import main
+registry = getattr(main, "registry", None)
+if registry is None:
+    print(json.dumps(None))
+else:
+    registry.warm_up()
+    print(json.dumps(registry.status()))
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repo", default=str(REPO_ROOT), help="checkout to measure")
+    parser.add_argument("--label", default="current")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=12, help="slowest direct imports of main to list")
+    parser.add_argument("--output", default=str(DEFAULT_OUTPUT),
+                        help="JSON file the measurement is merged into, keyed by label")
+    return parser.parse_args()
+
+
+def child_env() -> dict:
+    env = dict(os.environ)
+    # The pre-registry app refused to import without a key; give both a dummy one
+    env.setdefault("OPENAI_API_KEY", "import-benchmark")
+    env["WARMUP_ON_STARTUP"] = "false"
+    return env
+
+
+def import_seconds(repo: Path) -> float:
+    code = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+    result = subprocess.run([sys.executable, "-c", code], cwd=repo, env=child_env(),
+                            capture_output=True, text=True, timeout=120, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(repo: Path, top: int) -> list:
+    """Modules imported directly by main, by cumulative import time"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=repo,
+                            env=child_env(), capture_output=True, text=True, timeout=120, check=True)
+    totals = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, raw_name = line[len("import time:"):].split("|")
+        # importtime indents nested imports by two spaces per level; main's own imports are level 1
+        depth = (len(raw_name) - len(raw_name.lstrip()) - 1) // 2
+        if depth == 1:
+            name = raw_name.strip()
+            totals[name] = totals.get(name, 0) + int(cumulative)
+    ordered = sorted(totals.items(), key=lambda item: item[1], reverse=True)[:top]
+    return [{"module": name, "cumulative_ms": round(us / 1000, 1)} for name, us in ordered]
+
+
+def service_build_times(repo: Path):
+    result = subprocess.run([sys.executable, "-c", BUILD_SERVICES], cwd=repo, env=child_env(),
+                            capture_output=True, text=True, timeout=120)
+    try:
+        return json.loads(result.stdout.strip().splitlines()[-1])
+    except (IndexError, ValueError):
+        return {"error": result.stderr[-500:]}
+
+
+def time_to_first_health(repo: Path) -> float:
+    port = free_port()
+    env = child_env()
+    env["PORT"] = str(port)
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "main.py"], cwd=repo, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - start < 60:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.02)
+        raise RuntimeError("server did not answer /health within 60 s")
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def main():
+    args = parse_args()
+    repo = Path(args.repo).resolve()
+
+    imports = [import_seconds(repo) for _ in range(args.runs)]
+    health = [time_to_first_health(repo) for _ in range(args.runs)]
+    measurement = {
+        "environment": environment_info(),
+        "repo": str(repo),
+        "import_main_ms": {
+            "median": round(statistics.median(imports) * 1000, 1),
+            "min": round(min(imports) * 1000, 1)
+        },
+        "first_health_response_ms": {
+            "median": round(statistics.median(health) * 1000, 1),
+            "min": round(min(health) * 1000, 1)
+        },
+        "slowest_imports": slowest_imports(repo, args.top),
+        "service_build": service_build_times(repo)
+    }
+
+    output = Path(args.output)
+    report = {}
+    if output.exists():
+        with open(output) as f:
+            report = json.load(f)
+    report[args.label] = measurement
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"[{args.label}] import main: {measurement['import_main_ms']['median']} ms, "
+          f"first /health: {measurement['first_health_response_ms']['median']} ms")
+    for entry in measurement["slowest_imports"][:5]:
+        print(f"  {entry['module']:30s} {entry['cumulative_ms']} ms")
+    print(f"report: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Event-loop lag caused by logging: the same simulated pipeline traffic (many
+sessions logging per-image, per-download and per-overlay messages) is run with
+logging off, with the old synchronous stdout + app.log handlers, and with the
+queue-based setup from utils/logging_setup.py, with and without its
+per-session sampling.
+
+    python benchmarks/logging_overhead.py
+    python benchmarks/logging_overhead.py --disk-latency-ms 20 --sessions 40
+
+--disk-latency-ms stalls every write to the log file for that long, standing
+in for a disk under write pressure. Each mode runs in a fresh interpreter so
+logging configuration does not leak between them.
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import logging
+import subprocess
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from common import REPO_ROOT, LoopLagProbe, environment_info, save_report
+
+# queue writes every record off the loop; sampled also thins per-session repeats
+MODES = ("off", "sync", "queue", "sampled")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=20, help="concurrent simulated sessions")
+    parser.add_argument("--images", type=int, default=16, help="scenes per session")
+    parser.add_argument("--messages-per-image", type=int, default=4,
+                        help="log records per scene (generate, download, overlay, cache)")
+    parser.add_argument("--interval-ms", type=float, default=5.0,
+                        help="pause between a session's records, standing in for real work")
+    parser.add_argument("--disk-latency-ms", type=float, default=5.0,
+                        help="added to every write to the log file")
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def slow_down_log_files(latency: float):
+    """Make every FileHandler write stall like a congested disk"""
+    emit = logging.FileHandler.emit
+
+    def slow_emit(self, record):
+        time.sleep(latency)
+        emit(self, record)
+
+    logging.FileHandler.emit = slow_emit
+
+
+async def simulated_session(index: int, args) -> None:
+    from utils.tracer import SessionTracer, use_tracer
+
+    logger = logging.getLogger("services.pipeline")
+    tracer = SessionTracer(f"bench-{index:03d}")
+    use_tracer(tracer)
+    with tracer.span("generate_images", "stage"):
+        for image in range(args.images):
+            for message in range(args.messages_per_image):
+                await asyncio.sleep(args.interval_ms / 1000)
+                logger.info(f"Scene {image + 1}/{args.images} step {message + 1}: "
+                            f"generated/bench-{index:03d}/image_{image + 1:02d}.png")
+
+
+async def run_child(args, log_path: Path) -> dict:
+    probe = LoopLagProbe(interval=0.01)
+    probe.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(simulated_session(i, args) for i in range(args.sessions)))
+    elapsed = time.perf_counter() - started
+    loop_lag = await probe.stop()
+    logged_at = time.perf_counter()
+
+    if args.child in ("queue", "sampled"):
+        from utils.logging_setup import stop_logging
+        stop_logging()
+    logging.shutdown()
+    lines = sum(1 for _ in open(log_path)) if log_path.exists() else 0
+    return {
+        "mode": args.child,
+        "loop_lag_ms": loop_lag,
+        "elapsed_seconds": round(elapsed, 3),
+        "drain_seconds": round(time.perf_counter() - logged_at, 3),
+        "records_logged": args.sessions * args.images * args.messages_per_image,
+        "lines_written": lines
+    }
+
+
+def child_main(args):
+    log_path = Path(tempfile.mkdtemp(prefix="runhistory-log-")) / "app.log"
+    slow_down_log_files(args.disk_latency_ms / 1000)
+    if args.child == "off":
+        logging.disable(logging.CRITICAL)
+    elif args.child == "sync":
+        # The configuration start.py used before logging moved off the loop
+        logging.basicConfig(
+            level=logging.INFO,
+            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+            handlers=[logging.StreamHandler(sys.stdout), logging.FileHandler(log_path, mode='a')]
+        )
+    else:
+        from utils.logging_setup import configure_logging
+        if args.child == "queue":
+            os.environ["LOG_SAMPLE_BURST"] = "0"
+        configure_logging(log_file=str(log_path))
+    result = asyncio.run(run_child(args, log_path))
+    with open(args.result, "w") as f:
+        json.dump(result, f)
+
+
+def main():
+    args = parse_args()
+    if args.child:
+        child_main(args)
+        return
+
+    results = []
+    for mode in args.modes.split(","):
+        with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+            result_path = f.name
+        command = [sys.executable, __file__, "--child", mode, "--result", result_path,
+                   "--sessions", str(args.sessions), "--images", str(args.images),
+                   "--messages-per-image", str(args.messages_per_image),
+                   "--interval-ms", str(args.interval_ms), "--disk-latency-ms", str(args.disk_latency_ms)]
+        # Console output goes nowhere; the log file is what the disk latency applies to
+        subprocess.run(command, cwd=REPO_ROOT, stdout=subprocess.DEVNULL, check=True)
+        with open(result_path) as f:
+            result = json.load(f)
+        os.unlink(result_path)
+        results.append(result)
+        lag = result["loop_lag_ms"]
+        print(f"{mode:>5}: loop lag p50 {lag.get('p50')} ms, p99 {lag.get('p99')} ms, max {lag.get('max')} ms; "
+              f"{result['lines_written']}/{result['records_logged']} records written, "
+              f"run {result['elapsed_seconds']} s")
+
+    report = {
+        "benchmark": "logging_overhead",
+        "config": {key: value for key, value in vars(args).items() if key not in ("child", "result", "output")},
+        "environment": environment_info(),
+        "results": results
+    }
+    path = save_report(report, args.output, "logging_overhead")
+    print(f"Report written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the overlay and encode hot paths.
+
+Covers ImageOverlayService.add_text_overlay / add_multiple_overlays and
+VideoService._get_audio_duration / _create_video_with_ffmpeg on synthetic
+images and tone audio generated locally. Full encodes start from an empty
+scene clip cache; the rerender cases change one image of an encoded video and
+measure the re-encode of that scene plus the stream-copy concat. Each case
+records wall time, CPU time (including ffmpeg children) and peak RSS growth,
+and is compared against a stored baseline with a regression threshold.
+
+    python benchmarks/micro_hot_paths.py                     # compare to baseline
+    python benchmarks/micro_hot_paths.py --update-baseline   # record a new baseline
+"""
+
+import sys
+import json
+import random
+import shutil
+import asyncio
+import argparse
+import logging
+import statistics
+import subprocess
+import tempfile
+from pathlib import Path
+from typing import Callable, Dict, Any, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from common import (
+    REPO_ROOT, Stopwatch, RssSampler, environment_info, have_ffmpeg, save_report
+)
+from PIL import Image
+
+from services.image_overlay_service import ImageOverlayService
+from services.video_service import VideoService
+
+BASELINE_PATH = REPO_ROOT / "benchmarks" / "baselines" / "micro_hot_paths.json"
+IMAGE_COUNTS = [4, 12, 16, 32]
+AUDIO_DURATIONS = [20, 60, 80]
+FPS = 25
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case; the median is reported")
+    parser.add_argument("--image-counts", type=int, nargs="+", default=IMAGE_COUNTS)
+    parser.add_argument("--durations", type=int, nargs="+", default=AUDIO_DURATIONS,
+                        help="voiceover lengths in seconds")
+    parser.add_argument("--image-px", type=int, default=1024)
+    parser.add_argument("--threshold", type=float, default=0.15,
+                        help="allowed slowdown vs baseline before a case counts as a regression")
+    parser.add_argument("--baseline", default=str(BASELINE_PATH))
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--only", help="run only cases whose name contains this string")
+    parser.add_argument("--output", help="report path (default benchmarks/results/micro_<timestamp>.json)")
+    return parser.parse_args()
+
+
+def make_images(directory: Path, count: int, size: int) -> List[Path]:
+    """Gradient plus noise, so PNG encode/decode costs resemble real renders"""
+    rng = random.Random(count)
+    paths = []
+    for i in range(count):
+        gradient = Image.linear_gradient("L").resize((size, size))
+        noise = Image.frombytes("L", (size, size), rng.randbytes(size * size))
+        img = Image.merge("RGB", (gradient, noise, gradient.rotate(90)))
+        path = directory / f"image_{i + 1:02d}.png"
+        img.save(path, "PNG")
+        paths.append(path)
+    return paths
+
+
+def make_tone(path: Path, seconds: int) -> Path:
+    cmd = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"sine=frequency=330:sample_rate=44100:duration={seconds}",
+        "-ac", "2", "-b:a", "128k", "-y", str(path)
+    ]
+    subprocess.run(cmd, check=True, capture_output=True, timeout=120)
+    return path
+
+
+def measure(fn: Callable[[], Any], repeat: int, units: int, before: Optional[Callable[[int], Any]] = None) -> Dict[str, Any]:
+    """Run fn repeat times and report medians; per_unit divides by frames/images.
+
+    before(run) prepares each run outside the timed section.
+    """
+    walls, cpus, peaks = [], [], []
+    for run in range(repeat):
+        if before is not None:
+            before(run)
+        with RssSampler() as rss, Stopwatch() as watch:
+            fn()
+        walls.append(watch.wall)
+        cpus.append(watch.cpu)
+        peaks.append(rss.peak_delta_mb)
+    wall = statistics.median(walls)
+    return {
+        "wall_s": round(wall, 4),
+        "cpu_s": round(statistics.median(cpus), 4),
+        "peak_rss_delta_mb": max(peaks),
+        "units": units,
+        "wall_ms_per_unit": round(wall / units * 1000, 3) if units else None,
+        "runs": [round(w, 4) for w in walls]
+    }
+
+
+def build_cases(args, workdir: Path) -> Dict[str, Callable[[], Dict[str, Any]]]:
+    overlay_service = ImageOverlayService()
+    video_service = VideoService()
+    max_count = max(args.image_counts)
+    images = make_images(workdir, max_count, args.image_px)
+    overlays_dir = workdir / "overlays"
+    cases = {}
+
+    def overlay_single():
+        return measure(
+            lambda: asyncio.run(overlay_service.add_text_overlay(
+                images[0], "Battle of Hastings, 1066 AD", overlays_dir / "single.png"
+            )),
+            args.repeat, 1
+        )
+    cases["overlay.add_text_overlay"] = overlay_single
+
+    for count in args.image_counts:
+        def overlay_multiple(count=count):
+            texts = [f"Historical Scene {i + 1}" for i in range(count)]
+            return measure(
+                lambda: asyncio.run(overlay_service.add_multiple_overlays(images[:count], texts, overlays_dir)),
+                args.repeat, count
+            )
+        cases[f"overlay.add_multiple_overlays[{count}]"] = overlay_multiple
+
+    if not have_ffmpeg():
+        return cases
+
+    tones = {d: make_tone(workdir / f"tone_{d}s.mp3", d) for d in args.durations}
+
+    for duration, tone in tones.items():
+        def audio_duration(tone=tone):
+            return measure(lambda: asyncio.run(video_service._get_audio_duration(tone)), args.repeat, 1)
+        cases[f"video._get_audio_duration[{duration}s]"] = audio_duration
+
+    def render(image_paths, tone, duration, output):
+        return asyncio.run(video_service._create_video_with_ffmpeg(
+            image_paths=image_paths,
+            voiceover_path=tone,
+            output_path=output,
+            audio_duration=float(duration)
+        ))
+
+    for count in args.image_counts:
+        for duration, tone in tones.items():
+            output_dir = workdir / f"encode_{count}_{duration}"
+            output_dir.mkdir(exist_ok=True)
+            output = output_dir / "final_video.mp4"
+
+            def encode(count=count, duration=duration, tone=tone, output=output):
+                return measure(
+                    lambda: render(images[:count], tone, duration, output),
+                    args.repeat, duration * FPS,
+                    before=lambda run: shutil.rmtree(output.parent / "clips", ignore_errors=True)
+                )
+            cases[f"video._create_video_with_ffmpeg[{count}img,{duration}s]"] = encode
+
+            def rerender(count=count, duration=duration, tone=tone, output=output):
+                variant = output.parent / "variant.png"
+                scene_images = [variant] + images[1:count]
+
+                def edit_first_image(run):
+                    with Image.open(images[0]) as img:
+                        img.putpixel((0, 0), (run % 256, 0, 0))
+                        img.save(variant, "PNG")
+
+                # Encode every scene once (cheap if the encode case just ran), untimed
+                edit_first_image(args.repeat)
+                render(scene_images, tone, duration, output)
+                return measure(
+                    lambda: render(scene_images, tone, duration, output),
+                    args.repeat, duration * FPS // count,
+                    before=edit_first_image
+                )
+            cases[f"video.rerender_one_scene[{count}img,{duration}s]"] = rerender
+
+    return cases
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Any], threshold: float) -> List[Dict[str, Any]]:
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get("results", {}).get(name)
+        if not reference:
+            result["baseline_wall_s"] = None
+            continue
+        ratio = result["wall_s"] / reference["wall_s"] if reference["wall_s"] else None
+        result["baseline_wall_s"] = reference["wall_s"]
+        result["vs_baseline"] = round(ratio, 3) if ratio else None
+        if ratio and ratio > 1 + threshold:
+            regressions.append({"case": name, "wall_s": result["wall_s"],
+                                "baseline_wall_s": reference["wall_s"], "ratio": round(ratio, 3)})
+    return regressions
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    baseline_path = Path(args.baseline)
+
+    with tempfile.TemporaryDirectory(prefix="runhistory-micro-") as tmp:
+        cases = build_cases(args, Path(tmp))
+        results = {}
+        for name, run in cases.items():
+            if args.only and args.only not in name:
+                continue
+            results[name] = run()
+            print(f"{name:55s} wall={results[name]['wall_s']:.4f}s cpu={results[name]['cpu_s']:.4f}s "
+                  f"peak+{results[name]['peak_rss_delta_mb']}MB "
+                  f"({results[name]['wall_ms_per_unit']} ms/unit)")
+
+    report = {
+        "benchmark": "micro_hot_paths",
+        "environment": environment_info(),
+        "config": {"repeat": args.repeat, "image_px": args.image_px, "fps": FPS,
+                   "threshold": args.threshold},
+        "results": results
+    }
+
+    if args.update_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(baseline_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"baseline updated: {baseline_path}")
+        return
+
+    regressions = []
+    if baseline_path.exists():
+        with open(baseline_path) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+    else:
+        print(f"no baseline at {baseline_path}; run with --update-baseline to create one")
+    report["regressions"] = regressions
+
+    path = save_report(report, args.output, "micro")
+    print(f"report: {path}")
+    for regression in regressions:
+        print(f"REGRESSION {regression['case']}: {regression['wall_s']}s vs "
+              f"{regression['baseline_wall_s']}s (x{regression['ratio']})")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
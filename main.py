@@ -1,49 +1,347 @@
 import os
 import asyncio
 import shutil
+import time
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
 import uvicorn
-from fastapi import FastAPI, HTTPException, BackgroundTasks
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
 import logging
 
-from services.openai_service import OpenAIService
-from services.elevenlabs_service import ElevenLabsService
-from services.video_service import VideoService
-from services.image_overlay_service import ImageOverlayService
-from utils.file_manager import FileManager
-from models.models import VideoRequest, VideoResponse, GenerationStatus
+from utils.blob_store import get_blob_store
+from utils.checkpoint import SessionCheckpoint
+from utils.coalescing import RequestCoalescer, request_key
+from utils.http_cache import (
+    IMMUTABLE, REVALIDATE, DigestCache, DownloadResponse, etag_matches, strong_etag, version
+)
+from utils.job_queue import get_job_queue
+from utils.logging_setup import configure_logging
+from utils.loop_monitor import loop_monitor_from_env
+from utils.memory import get_memory_accounting, get_memory_budget
+from utils.scheduler import QuotaExceeded, Ticket, api_keys_from_env, client_identity, get_scheduler
+from utils.service_registry import ServiceRegistry
+from utils.static_assets import StaticAssets
+from utils.tracer import SessionTracer, use_tracer
+from utils.zip_stream import stream_zip
+from models.models import VideoRequest, VideoResponse, GenerationStatus, SceneEdit
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging (a no-op when start.py or worker.py already did)
+configure_logging()
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="RunHistory.log Generator", version="1.0.0")
+# Services are built on first use so the app imports (and answers /health)
+# without pulling in openai, Pillow and aiohttp or requiring OPENAI_API_KEY.
+def _openai_service():
+    from services.openai_service import OpenAIService
+    return OpenAIService()
 
-# Mount static files
-app.mount("/static", StaticFiles(directory="static"), name="static")
+def _elevenlabs_service():
+    from services.elevenlabs_service import ElevenLabsService
+    return ElevenLabsService()
 
-# Initialize services
-openai_service = OpenAIService()
-elevenlabs_service = ElevenLabsService()
-video_service = VideoService()
-image_overlay_service = ImageOverlayService()
-file_manager = FileManager()
+def _video_service():
+    from services.video_service import VideoService
+    return VideoService()
+
+def _image_overlay_service():
+    from services.image_overlay_service import ImageOverlayService
+    return ImageOverlayService()
+
+def _thumbnail_service():
+    from services.thumbnail_service import ThumbnailService
+    return ThumbnailService()
+
+def _file_manager():
+    from utils.file_manager import FileManager
+    return FileManager.from_env()
+
+registry = ServiceRegistry()
+registry.register("openai_service", _openai_service)
+registry.register("elevenlabs_service", _elevenlabs_service)
+registry.register("video_service", _video_service)
+registry.register("image_overlay_service", _image_overlay_service)
+registry.register("thumbnail_service", _thumbnail_service)
+registry.register("file_manager", _file_manager)
+
+# Build services in the background once the server is already answering /health
+WARMUP_ON_STARTUP = os.environ.get("WARMUP_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+WARMUP_DELAY = float(os.environ.get("WARMUP_DELAY", "0.5"))
+
+# "inline" renders in this process; "queue" only enqueues jobs for worker.py
+# processes and reads their status back from the job queue
+RENDER_MODE = os.environ.get("RENDER_MODE", "inline").lower()
+API_SERVICES = ["file_manager", "thumbnail_service"] if RENDER_MODE == "queue" else None
+
+# Keys that make a client of their own for quotas and /usage; requests
+# without one of them are counted by their address
+API_KEYS = api_keys_from_env()
+
+# Proxies trusted to report the client address in X-Forwarded-For. The
+# hosting platforms' proxies connect from private or link-local addresses;
+# set FORWARDED_ALLOW_IPS=127.0.0.1 when untrusted hosts can reach the
+# server from such an address directly
+FORWARDED_ALLOW_IPS = os.environ.get(
+    "FORWARDED_ALLOW_IPS", "127.0.0.1,10.0.0.0/8,172.16.0.0/12,192.168.0.0/16,100.64.0.0/10,169.254.0.0/16"
+)
+
+# Cancel sessions whose status nobody has polled for this long (0 disables);
+# in queue mode the render workers apply it
+IDLE_CANCEL_SECONDS = float(os.environ.get("IDLE_CANCEL_SECONDS", "0"))
+
+# Event-loop lag and blocking-call attribution, served on /debug/loop
+loop_monitor = loop_monitor_from_env()
+
+async def _warm_up_services():
+    await asyncio.sleep(WARMUP_DELAY)
+    failures = await registry.warm_up_async(API_SERVICES)
+    if failures:
+        logger.warning(f"Service warm-up incomplete: {failures}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    background = []
+    if loop_monitor is not None:
+        loop_monitor.start()
+    if WARMUP_ON_STARTUP:
+        background.append(asyncio.create_task(_warm_up_services()))
+    if IDLE_CANCEL_SECONDS > 0 and RENDER_MODE != "queue":
+        background.append(asyncio.create_task(_cancel_idle_sessions()))
+    yield
+    for task in background:
+        if not task.done():
+            task.cancel()
+    if loop_monitor is not None:
+        await loop_monitor.stop()
+
+app = FastAPI(title="RunHistory.log Generator", version="1.0.0", lifespan=lifespan)
+
+# Mount static files: fingerprinted and precompressed (see utils/static_assets.py)
+static_assets = StaticAssets()
+app.mount("/static", static_assets, name="static")
+
+FINISHED_STATES = ("completed", "error", "cancelled")
 
 # Global status tracking
 generation_status: Dict[str, GenerationStatus] = {}
 
+# Pipelines running in this process, and when a client last polled each one
+render_tasks: Dict[str, asyncio.Task] = {}
+status_reads: Dict[str, float] = {}
+
+# Stream the script and start image requests as soon as each prompt is complete
+SCRIPT_STREAMING = os.environ.get("SCRIPT_STREAMING", "true").lower() in ("1", "true", "yes")
+
+# Identical requests (same normalized topic and options) that arrive while a
+# pipeline for them is running share it instead of starting another
+COALESCE_REQUESTS = os.environ.get("COALESCE_REQUESTS", "true").lower() in ("1", "true", "yes")
+coalescer = RequestCoalescer()
+
+# Leaders whose own client cancelled while followers still share the pipeline
+cancelled_leaders: Dict[str, GenerationStatus] = {}
+
+async def _session_status(session_id: str, touch: bool = False) -> Optional[GenerationStatus]:
+    """Status of a session as its client sees it: a cancelled leader reads as cancelled"""
+    cancelled = cancelled_leaders.get(session_id)
+    if cancelled is not None:
+        return cancelled
+    return await _pipeline_status(session_id, touch)
+
+async def _pipeline_status(session_id: str, touch: bool = False) -> Optional[GenerationStatus]:
+    """Status from this process, or from the job queue when workers render.
+    
+    touch records a client poll, which keeps the session clear of the idle timeout.
+    """
+    status = generation_status.get(session_id)
+    if status is None:
+        leader_id = coalescer.leader_of(session_id)
+        if leader_id is not None:
+            # Followers mirror the pipeline they share, and polling them keeps it alive
+            leader_status = await _pipeline_status(leader_id, touch)
+            if leader_status is None:
+                return GenerationStatus(
+                    session_id=session_id,
+                    status="initializing",
+                    progress=0,
+                    message="Starting video generation..."
+                )
+            if leader_status.status in FINISHED_STATES and leader_id not in render_tasks:
+                # Rendered by a worker: this process learns it finished here
+                _settle_followers(leader_id, leader_status)
+                return generation_status.get(session_id)
+            return leader_status.model_copy(update={"session_id": session_id})
+    if status is not None and touch:
+        status_reads[session_id] = time.monotonic()
+    if status is None and RENDER_MODE == "queue":
+        data = await asyncio.to_thread(get_job_queue().status, session_id, touch)
+        if data is not None:
+            status = GenerationStatus(**data)
+    return status
+
+def _session_dir(session_id: str) -> Path:
+    """Directory holding a session's assets; followers read their leader's (a link to it once it finished)"""
+    return Path(f"generated/{coalescer.leader_of(session_id) or session_id}")
+
+def _leader_of(session_id: str) -> Optional[str]:
+    """The session whose pipeline and directory session_id shares, while it runs or after it finished"""
+    leader_id = coalescer.leader_of(session_id)
+    if leader_id is None and _session_dir(session_id).is_symlink():
+        leader_id = Path(os.readlink(_session_dir(session_id))).name
+    return leader_id
+
+def _settle_followers(leader_id: str, status: GenerationStatus):
+    """Stop tracking a finished pipeline's followers.
+    
+    Each keeps a copy of the final status and a link to the leader's
+    directory, so nothing in the coalescer outlives the pipeline.
+    """
+    for session_id in coalescer.release(leader_id):
+        generation_status.setdefault(session_id, status.model_copy(update={"session_id": session_id}))
+        try:
+            _session_dir(session_id).symlink_to(leader_id, target_is_directory=True)
+        except FileExistsError:
+            pass
+        except OSError as e:
+            logger.error(f"Could not link session {session_id} to {leader_id}: {str(e)}")
+    cancelled = cancelled_leaders.pop(leader_id, None)
+    if cancelled is not None:
+        generation_status[leader_id] = cancelled
+
+# Digests of served files by version: recorded in the checkpoint at completion, or hashed on first request
+digest_cache = DigestCache()
+
+def _stat_and_digest(path: Path) -> Tuple[os.stat_result, str]:
+    """Current stat and SHA-256 of a session file (blocking)"""
+    stat = path.stat()
+    
+    def recorded() -> Optional[str]:
+        checkpoint = SessionCheckpoint.load(path.parent)
+        return checkpoint.digest(path, stat) if checkpoint else None
+    
+    return stat, digest_cache.get(path, stat, recorded)
+
+async def _file_download(request: Request, path: Path, filename: str, media_type: Optional[str] = None,
+                         v: Optional[str] = None) -> Response:
+    """Serve a session file with a strong content ETag.
+    
+    If-None-Match is answered with 304. Range requests, including several
+    ranges (multipart/byteranges) and If-Range against the ETag, are served
+    as 206 by DownloadResponse. URLs carrying the current content version in v
+    are immutable; others must be revalidated, since a re-render replaces
+    the file in place.
+    """
+    try:
+        stat, digest = await asyncio.to_thread(_stat_and_digest, path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File not found")
+    etag = strong_etag(digest)
+    headers = {"ETag": etag, "Cache-Control": IMMUTABLE if v == version(digest) else REVALIDATE}
+    
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return DownloadResponse(path, media_type=media_type, filename=filename, headers=headers, stat_result=stat)
+
+async def _in_flight_leader(key: str) -> Optional[str]:
+    """Session already running the pipeline for this request key, if any"""
+    while True:
+        leader_id = coalescer.leader_for(key)
+        if leader_id is None:
+            return None
+        status = await _pipeline_status(leader_id)
+        # No status yet means the leader is still being enqueued
+        if status is None or status.status not in FINISHED_STATES:
+            return leader_id
+        _settle_followers(leader_id, status)
+
+def _client_id(request: Request) -> str:
+    """Who a request is scheduled and counted as: its X-API-Key header if it is one of API_KEYS, else its address.
+
+    Behind a trusted proxy the address is the one it forwarded, as uvicorn
+    resolves it with proxy_headers.
+    """
+    return client_identity(request.headers.get("x-api-key"), request.client.host if request.client else None, API_KEYS)
+
+def _too_many_jobs(error: QuotaExceeded) -> HTTPException:
+    return HTTPException(status_code=429, detail=f"Too many generations waiting: {error}", headers={"Retry-After": "30"})
+
+async def _start_render(session_id: str, topic: str, status: GenerationStatus, client_id: str,
+                        priority: str = "interactive"):
+    """Run the pipeline as a task of this process once the scheduler grants it a slot, or hand it to the render workers.
+    
+    Raises QuotaExceeded if the client already has as many jobs waiting as it may.
+    """
+    scheduler = get_scheduler()
+    if RENDER_MODE == "queue":
+        await asyncio.to_thread(
+            get_job_queue().enqueue, session_id, topic, status.model_dump(), client_id, priority,
+            scheduler.policy.client_max_queued
+        )
+    else:
+        ticket = scheduler.submit(session_id, client_id, priority)
+        generation_status[session_id] = status
+        status_reads[session_id] = time.monotonic()
+        task = asyncio.create_task(_scheduled_render(session_id, topic, ticket))
+        render_tasks[session_id] = task
+        task.add_done_callback(lambda _: _render_finished(session_id, task, ticket))
+
+async def _scheduled_render(session_id: str, topic: str, ticket: Ticket):
+    """Wait for the scheduler's slot (status "queued" meanwhile), then run the pipeline"""
+    status = generation_status[session_id]
+    if ticket.started_at is None:
+        scheduler = get_scheduler()
+        message = status.message
+        status.status = "queued"
+        status.message = f"Waiting for a render slot ({scheduler.waiting()} generations waiting)"
+        await scheduler.turn(ticket)
+        status.status = "initializing"
+        status.message = message
+    await generate_video_task(session_id, topic)
+
+def _render_finished(session_id: str, task: asyncio.Task, ticket: Ticket):
+    if render_tasks.get(session_id) is task:
+        del render_tasks[session_id]
+        status_reads.pop(session_id, None)
+    # A task cancelled before its first step never runs its own cancellation handler
+    status = generation_status.get(session_id)
+    if task.cancelled() and status is not None and status.status not in FINISHED_STATES:
+        status.status = "cancelled"
+        status.message = "Generation cancelled"
+    get_scheduler().finish(ticket, status.status if status is not None else "cancelled")
+    if status is not None:
+        _settle_followers(session_id, status)
+
+def _cancel_render(session_id: str, reason: str) -> Optional[asyncio.Task]:
+    """Cancel a pipeline running in this process; its child processes are killed on the way out"""
+    task = render_tasks.get(session_id)
+    if task is None or task.done():
+        return None
+    logger.info(f"Cancelling session {session_id}: {reason}")
+    task.cancel(reason)
+    return task
+
+async def _cancel_idle_sessions():
+    """Cancel pipelines whose status has not been polled for IDLE_CANCEL_SECONDS"""
+    while True:
+        await asyncio.sleep(min(10.0, IDLE_CANCEL_SECONDS / 2))
+        cutoff = time.monotonic() - IDLE_CANCEL_SECONDS
+        for session_id in list(render_tasks):
+            if status_reads.get(session_id, 0) < cutoff:
+                _cancel_render(
+                    session_id, f"Generation cancelled: no status requests for {IDLE_CANCEL_SECONDS:.0f}s"
+                )
+
 @app.get("/")
-async def root():
-    """Serve the main HTML page"""
-    return FileResponse("static/index.html")
+async def root(request: Request):
+    """Serve the main HTML page, revalidated by ETag, with the current asset URLs"""
+    return await static_assets.get_response("index.html", request.scope)
 
 @app.get("/health")
+@app.get("/health/live")
 async def health_check():
-    """Health check endpoint for deployment"""
+    """Liveness check: the process is up and serving requests"""
     try:
         # Minimal health check for faster response
         return {"status": "healthy"}
@@ -54,73 +352,198 @@ async def health_check():
             content={"status": "unhealthy", "error": str(e)}
         )
 
+@app.get("/health/ready")
+async def readiness_check():
+    """Readiness check: every service can be built and is warmed up"""
+    failures = await registry.warm_up_async(API_SERVICES)
+    if failures:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "not_ready", "services": registry.status()}
+        )
+    result = {"status": "ready", "services": registry.status()}
+    if RENDER_MODE == "queue":
+        result["jobs"] = await asyncio.to_thread(get_job_queue().stats)
+    else:
+        result["blob_cache"] = get_blob_store().stats()
+        result["storage"] = registry.file_manager.storage_stats()
+    if COALESCE_REQUESTS:
+        result["coalescing"] = coalescer.stats()
+    return result
+
+@app.get("/debug/loop")
+async def loop_report():
+    """Event-loop lag percentiles and recent stalls with the stack and session that caused them"""
+    if loop_monitor is None:
+        raise HTTPException(status_code=404, detail="Loop monitor disabled (LOOP_MONITOR=false)")
+    return loop_monitor.report()
+
+@app.get("/debug/memory")
+async def memory_report(session_id: Optional[str] = None):
+    """Memory budget admissions and per-stage RSS (and tracemalloc) records, optionally for one session"""
+    return {
+        "budget": get_memory_budget().stats(),
+        **get_memory_accounting().report(session_id)
+    }
+
+@app.get("/usage")
+async def get_usage(request: Request):
+    """The calling client's generations: waiting, running, finished by outcome, and time spent waiting and rendering"""
+    client_id = _client_id(request)
+    if RENDER_MODE == "queue":
+        clients = await asyncio.to_thread(get_job_queue().usage, client_id)
+        return clients[0] if clients else {"client": client_id, "waiting": 0, "running": 0}
+    return get_scheduler().client_stats(client_id)
+
+@app.get("/debug/scheduler")
+async def scheduler_report():
+    """Render slots, scheduling limits and every client's usage"""
+    if RENDER_MODE == "queue":
+        return {"clients": await asyncio.to_thread(get_job_queue().usage)}
+    return get_scheduler().stats()
+
 @app.post("/generate")
-async def generate_video(request: VideoRequest, background_tasks: BackgroundTasks):
+async def generate_video(request: VideoRequest, http_request: Request):
     """Start video generation process"""
+    failures = await registry.warm_up_async(API_SERVICES)
+    if failures:
+        raise HTTPException(status_code=503, detail=f"Service unavailable: {'; '.join(failures.values())}")
+    
+    options = {
+        "renditions": list(dict.fromkeys(request.renditions)),
+        "subtitles": request.subtitles,
+        "quality": request.quality
+    }
+    
+    # Generate unique session ID
+    session_id = registry.file_manager.generate_session_id()
+    
+    if COALESCE_REQUESTS:
+        key = request_key(request.topic, options)
+        leader_id = await _in_flight_leader(key)
+        if leader_id is not None:
+            coalescer.follow(leader_id, session_id)
+            logger.info(f"Session {session_id} shares the running pipeline of {leader_id}")
+            return {"session_id": session_id, "status": "started"}
+        coalescer.lead(key, session_id)
+    
     try:
-        # Generate unique session ID
-        session_id = file_manager.generate_session_id()
+        # Record the request options where the pipeline (and any resume) reads them
+        session_dir = registry.file_manager.create_session_directory(session_id)
+        await asyncio.to_thread(SessionCheckpoint.create, session_dir, session_id, request.topic, options)
         
-        # Initialize status
-        generation_status[session_id] = GenerationStatus(
+        # Initialize status and start the pipeline
+        status = GenerationStatus(
             session_id=session_id,
             status="initializing",
             progress=0,
             message="Starting video generation..."
         )
-        
-        # Start background task
-        background_tasks.add_task(generate_video_task, session_id, request.topic)
+        await _start_render(session_id, request.topic, status, _client_id(http_request), request.priority)
         
         return {"session_id": session_id, "status": "started"}
         
+    except QuotaExceeded as e:
+        coalescer.forget(session_id)
+        await asyncio.to_thread(registry.file_manager.cleanup_session, session_id)
+        raise _too_many_jobs(e)
     except Exception as e:
+        coalescer.forget(session_id)
         logger.error(f"Error starting video generation: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to start generation: {str(e)}")
 
 @app.get("/status/{session_id}")
 async def get_status(session_id: str):
     """Get generation status"""
-    if session_id not in generation_status:
+    status = await _session_status(session_id, touch=True)
+    if status is None:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    return generation_status[session_id]
+    return status
+
+@app.delete("/generate/{session_id}")
+async def cancel_generation(session_id: str):
+    """Stop a generation: pending image calls, TTS and ffmpeg are abandoned right away"""
+    status = await _session_status(session_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    if status.status in FINISHED_STATES:
+        raise HTTPException(status_code=409, detail=f"Session already {status.status}")
+    
+    # A shared pipeline keeps running for the sessions still watching it
+    leader_id = coalescer.leader_of(session_id) or session_id
+    remaining = coalescer.detach(leader_id, session_id)
+    cancelled = status.model_copy(update={"status": "cancelled", "message": "Generation cancelled"})
+    if leader_id != session_id:
+        generation_status[session_id] = cancelled
+    elif remaining:
+        # The render carries on for the followers, but this session's client is done with it
+        cancelled_leaders[session_id] = cancelled
+    if remaining:
+        return {"session_id": session_id, "status": "cancelled"}
+    coalescer.forget(leader_id)
+    
+    if RENDER_MODE == "queue":
+        # The worker running it notices on its next heartbeat
+        result = await asyncio.to_thread(get_job_queue().request_cancel, leader_id)
+        return {"session_id": session_id, "status": "cancelled" if leader_id != session_id else result}
+    
+    task = _cancel_render(leader_id, "Generation cancelled")
+    if task is not None:
+        await asyncio.wait([task], timeout=10)
+    return {"session_id": session_id, "status": generation_status[session_id].status}
 
 @app.get("/download/{session_id}")
-async def download_video(session_id: str):
-    """Download generated video"""
-    if session_id not in generation_status:
+async def download_video(session_id: str, request: Request, rendition: Optional[str] = None, v: Optional[str] = None):
+    """Download generated video, or one of its other renditions (portrait, square); supports Range and ETags"""
+    status = await _session_status(session_id)
+    if status is None:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    status = generation_status[session_id]
     if status.status != "completed":
         raise HTTPException(status_code=400, detail="Video not ready for download")
     
-    video_path = Path(f"generated/{session_id}/final_video.mp4")
+    video_path = _session_dir(session_id) / "final_video.mp4"
+    filename = f"history_{session_id}.mp4"
+    if rendition is not None:
+        checkpoint = SessionCheckpoint.load(video_path.parent)
+        video_path = checkpoint.rendition_paths().get(rendition) if checkpoint else None
+        if video_path is None:
+            raise HTTPException(status_code=404, detail="Rendition not found")
+        filename = f"history_{session_id}_{rendition}.mp4"
     if not video_path.exists():
         raise HTTPException(status_code=404, detail="Video file not found")
     
-    return FileResponse(
-        video_path,
-        media_type="video/mp4",
-        filename=f"history_{session_id}.mp4"
-    )
+    return await _file_download(request, video_path, filename, "video/mp4", v)
 
 @app.get("/assets/{session_id}")
-async def get_assets(session_id: str):
-    """Get all generated assets for a session"""
-    if session_id not in generation_status:
+async def get_assets(session_id: str, thumbnails: bool = True):
+    """Get all generated assets for a session; images point at gallery thumbnails unless thumbnails=false"""
+    if await _session_status(session_id) is None:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    assets_dir = Path(f"generated/{session_id}")
+    assets_dir = _session_dir(session_id)
     if not assets_dir.exists():
         raise HTTPException(status_code=404, detail="Assets not found")
     
+    # Download URLs carry the content version recorded at completion, so clients can cache them forever
+    checkpoint = SessionCheckpoint.load(assets_dir)
+    
+    def versioned(url: str, path: Path) -> str:
+        digest = checkpoint.digest(path, path.stat()) if checkpoint else None
+        if digest is None:
+            return url
+        return f"{url}{'&' if '?' in url else '?'}v={version(digest)}"
+    
     assets = {
         "script": None,
         "voiceover": None,
         "images": [],
-        "video": None
+        "image_downloads": [],
+        "video": None,
+        "subtitles": None,
+        "renditions": {},
+        "export": f"/export/{session_id}.zip"
     }
     
     # Get script
@@ -131,101 +554,441 @@ async def get_assets(session_id: str):
     # Get voiceover path
     voiceover_path = assets_dir / "voiceover.mp3"
     if voiceover_path.exists():
-        assets["voiceover"] = f"/download-asset/{session_id}/voiceover.mp3"
+        assets["voiceover"] = versioned(f"/download-asset/{session_id}/voiceover.mp3", voiceover_path)
+    
+    # Get subtitle cues
+    if (assets_dir / "subtitles.srt").exists():
+        assets["subtitles"] = versioned(f"/download-asset/{session_id}/subtitles.srt", assets_dir / "subtitles.srt")
     
     # Get images
-    for i in range(1, 17):  # Up to 16 images
-        img_path = assets_dir / f"image_{i:02d}.png"
-        if img_path.exists():
-            assets["images"].append(f"/download-asset/{session_id}/image_{i:02d}.png")
+    image_paths = [path for path in (assets_dir / f"image_{i:02d}.png" for i in range(1, 17)) if path.exists()]
+    # Thumbnails are keyed on content, like the ?v= of downloads (mtimes do not change with blob-linked images)
+    image_digests = await asyncio.to_thread(lambda: [_stat_and_digest(path)[1] for path in image_paths]) if thumbnails else []
+    for index, img_path in enumerate(image_paths):
+        download_url = versioned(f"/download-asset/{session_id}/{img_path.name}", img_path)
+        assets["image_downloads"].append(download_url)
+        if thumbnails:
+            assets["images"].append(
+                f"/thumbnail/{session_id}/{img_path.name}?width=320&v={version(image_digests[index])}"
+            )
+        else:
+            assets["images"].append(download_url)
     
     # Get video
     video_path = assets_dir / "final_video.mp4"
     if video_path.exists():
-        assets["video"] = f"/download/{session_id}"
+        assets["video"] = versioned(f"/download/{session_id}", video_path)
+        if checkpoint:
+            assets["renditions"] = {
+                name: versioned(f"/download/{session_id}?rendition={name}", path)
+                for name, path in checkpoint.rendition_paths().items()
+            }
     
     return assets
 
 @app.get("/download-asset/{session_id}/{filename}")
-async def download_asset(session_id: str, filename: str):
-    """Download individual asset"""
-    if session_id not in generation_status:
+async def download_asset(session_id: str, filename: str, request: Request, v: Optional[str] = None):
+    """Download individual asset; supports Range and ETags"""
+    if await _session_status(session_id) is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    asset_path = _session_dir(session_id) / filename
+    if Path(filename).name != filename or not asset_path.is_file():
+        raise HTTPException(status_code=404, detail="Asset not found")
+    
+    return await _file_download(request, asset_path, filename, v=v)
+
+def _export_entries(session_dir: Path) -> List[Tuple[str, Path]]:
+    """Files of a session for its ZIP export: everything at the top level but its bookkeeping.
+    
+    Subdirectories (thumbnails, spilled scene clips and overlays) only hold caches derived from these.
+    """
+    return [
+        (path.name, path) for path in sorted(session_dir.iterdir())
+        if path.is_file() and path.name != SessionCheckpoint.FILENAME and not path.name.endswith(".tmp")
+    ]
+
+@app.get("/export/{session_id}.zip")
+async def export_session(session_id: str):
+    """Stream all of a session's assets as one ZIP, written on the fly as it downloads"""
+    status = await _pipeline_status(session_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    if status.status not in FINISHED_STATES:
+        raise HTTPException(status_code=409, detail="Session is still running")
+    
+    session_dir = _session_dir(session_id)
+    entries = await asyncio.to_thread(_export_entries, session_dir) if session_dir.is_dir() else []
+    if not entries:
+        raise HTTPException(status_code=404, detail="Assets not found")
+    
+    return StreamingResponse(
+        stream_zip(entries),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="history_{session_id}.zip"'}
+    )
+
+@app.get("/thumbnail/{session_id}/{filename}")
+async def get_thumbnail(session_id: str, filename: str, request: Request, width: int = 320,
+                        format: str = "auto", v: Optional[str] = None):
+    """Resized WebP/JPEG copy of a session image, rendered on first request and cached on disk"""
+    if await _session_status(session_id) is None:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    asset_path = Path(f"generated/{session_id}/{filename}")
-    if not asset_path.exists():
+    thumbnail_service = registry.thumbnail_service
+    if width not in thumbnail_service.WIDTHS:
+        raise HTTPException(status_code=400, detail=f"width must be one of {list(thumbnail_service.WIDTHS)}")
+    if format == "auto":
+        format = "webp" if "image/webp" in request.headers.get("accept", "") else "jpeg"
+    if format not in thumbnail_service.FORMATS:
+        raise HTTPException(status_code=400, detail="format must be webp, jpeg or auto")
+    
+    image_path = _session_dir(session_id) / filename
+    if Path(filename).name != filename or image_path.suffix.lower() not in (".png", ".jpg", ".jpeg"):
+        raise HTTPException(status_code=400, detail="Not an image asset")
+    if not image_path.exists():
         raise HTTPException(status_code=404, detail="Asset not found")
     
-    return FileResponse(asset_path, filename=filename)
+    try:
+        _, digest = await asyncio.to_thread(_stat_and_digest, image_path)
+        thumbnail_path = await thumbnail_service.get_thumbnail(image_path, version(digest), width, format)
+    except Exception as e:
+        logger.error(f"Error creating thumbnail for {image_path}: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to create thumbnail")
+    
+    # URLs carrying the current content version (from /assets) never change content; others may after an edit
+    cache_control = IMMUTABLE if v == version(digest) else "public, max-age=3600"
+    return FileResponse(
+        thumbnail_path,
+        media_type=thumbnail_service.media_type(format),
+        headers={"Cache-Control": cache_control, "Vary": "Accept"}
+    )
+
+@app.get("/trace/{session_id}")
+async def download_trace(session_id: str):
+    """Download the Chrome/Perfetto timeline trace of a generation run"""
+    if await _session_status(session_id) is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    trace_path = _session_dir(session_id) / "trace.json"
+    if not trace_path.exists():
+        raise HTTPException(status_code=404, detail="Trace not available yet")
+    
+    return FileResponse(
+        trace_path,
+        media_type="application/json",
+        filename=f"trace_{session_id}.json"
+    )
+
+@app.post("/resume/{session_id}")
+async def resume_generation(session_id: str, request: Request):
+    """Re-run only the missing or failed stages of a session from its checkpoint"""
+    # Followers resume the pipeline they share
+    leader_id = _leader_of(session_id) or session_id
+    status = await _pipeline_status(leader_id)
+    if status and status.status not in FINISHED_STATES:
+        raise HTTPException(status_code=409, detail="Session is still running")
+    
+    checkpoint = SessionCheckpoint.load(registry.file_manager.base_dir / leader_id)
+    if checkpoint is None:
+        raise HTTPException(status_code=404, detail="No checkpoint found for session")
+    
+    status = GenerationStatus(
+        session_id=leader_id,
+        status="initializing",
+        progress=0,
+        message="Resuming video generation..."
+    )
+    try:
+        await _start_render(leader_id, checkpoint.topic, status, _client_id(request))
+    except QuotaExceeded as e:
+        raise _too_many_jobs(e)
+    if leader_id != session_id:
+        generation_status.pop(session_id, None)
+        coalescer.follow(leader_id, session_id)
+    else:
+        coalescer.attach(leader_id, session_id)
+    
+    return {
+        "session_id": session_id,
+        "status": "resumed",
+        "missing_images": len(checkpoint.missing_images()) if checkpoint.script else None
+    }
+
+@app.patch("/sessions/{session_id}/scenes/{scene}")
+async def edit_scene(session_id: str, scene: int, edit: SceneEdit, request: Request):
+    """Change one scene's image or caption and re-render the video.
+    
+    The edit is recorded in the checkpoint and the session resumes: only the
+    changed image and overlay are produced again, and only that scene's clip
+    is re-encoded before the video is reassembled by stream copy.
+    """
+    if _leader_of(session_id) is not None:
+        raise HTTPException(status_code=409, detail="Session shares another session's pipeline and cannot be edited")
+    status = await _pipeline_status(session_id)
+    if status and status.status not in FINISHED_STATES:
+        raise HTTPException(status_code=409, detail="Session is still running")
+    
+    checkpoint = SessionCheckpoint.load(registry.file_manager.base_dir / session_id)
+    if checkpoint is None:
+        raise HTTPException(status_code=404, detail="No checkpoint found for session")
+    script_data = checkpoint.script
+    if script_data is None:
+        raise HTTPException(status_code=409, detail="Session has no script yet; resume it first")
+    if not 1 <= scene <= len(script_data["image_prompts"]):
+        raise HTTPException(status_code=400, detail=f"scene must be between 1 and {len(script_data['image_prompts'])}")
+    if edit.image_url is not None and (edit.prompt is not None or edit.regenerate):
+        raise HTTPException(status_code=400, detail="image_url cannot be combined with prompt or regenerate")
+    if edit.prompt is None and not edit.regenerate and edit.image_url is None and edit.caption is None:
+        raise HTTPException(status_code=400, detail="Nothing to change")
+    
+    checkpoint.defer_saves()
+    index = scene - 1
+    changes = []
+    if edit.image_url is not None:
+        try:
+            image_path = await registry.file_manager.download_external_image(
+                edit.image_url, checkpoint.session_dir, f"image_{scene:02d}.png"
+            )
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Could not download image: {str(e)}")
+        checkpoint.record_image(index, image_path, uploaded=True)
+        changes.append("image")
+    if edit.prompt is not None and edit.prompt != script_data["image_prompts"][index]:
+        script_data["image_prompts"][index] = edit.prompt
+        changes.append("prompt")
+    if edit.caption is not None and edit.caption != script_data["text_overlays"][index]:
+        script_data["text_overlays"][index] = edit.caption
+        changes.append("caption")
+    if "prompt" in changes or "caption" in changes:
+        checkpoint.record_script(script_data)
+    if edit.regenerate and "prompt" not in changes:
+        checkpoint.request_image_refresh(index)
+        changes.append("regenerate")
+    await checkpoint.flush()
+    
+    # An edited session no longer matches its original request, so identical
+    # requests must not share its pipeline any more
+    coalescer.forget(session_id)
+    status = GenerationStatus(
+        session_id=session_id,
+        status="initializing",
+        progress=0,
+        message=f"Re-rendering after editing scene {scene}..."
+    )
+    try:
+        await _start_render(session_id, checkpoint.topic, status, _client_id(request))
+    except QuotaExceeded as e:
+        raise _too_many_jobs(e)
+    
+    return {"session_id": session_id, "scene": scene, "changes": changes, "status": "rerendering"}
+
+@app.post("/sessions/{session_id}/finalize")
+async def finalize_session(session_id: str, request: Request):
+    """Render a previewed session at full quality.
+    
+    The approved script (including any scene edits) and uploaded images are
+    kept; generated images, voice and video are produced again at final
+    quality, except where the blob cache already holds the final-quality result.
+    """
+    if _leader_of(session_id) is not None:
+        raise HTTPException(status_code=409, detail="Session shares another session's pipeline and cannot be finalized")
+    status = await _pipeline_status(session_id)
+    if status and status.status not in FINISHED_STATES:
+        raise HTTPException(status_code=409, detail="Session is still running")
+    
+    checkpoint = SessionCheckpoint.load(registry.file_manager.base_dir / session_id)
+    if checkpoint is None:
+        raise HTTPException(status_code=404, detail="No checkpoint found for session")
+    if not checkpoint.preview:
+        raise HTTPException(status_code=409, detail="Session is already rendered at final quality")
+    
+    # Saved before the render starts, since a worker may pick the job up at once;
+    # a refused render must leave the session a preview, or retries would get 409
+    checkpoint.defer_saves()
+    checkpoint.update_options(quality="final")
+    await checkpoint.flush()
+    coalescer.forget(session_id)
+    status = GenerationStatus(
+        session_id=session_id,
+        status="initializing",
+        progress=0,
+        message="Rendering the final video..."
+    )
+    try:
+        await _start_render(session_id, checkpoint.topic, status, _client_id(request))
+    except QuotaExceeded as e:
+        checkpoint.update_options(quality="preview")
+        await checkpoint.flush()
+        raise _too_many_jobs(e)
+    except Exception:
+        checkpoint.update_options(quality="preview")
+        await checkpoint.flush()
+        raise
+    
+    return {
+        "session_id": session_id,
+        "status": "finalizing",
+        "missing_images": len(checkpoint.missing_images()) if checkpoint.script else None
+    }
 
 async def generate_video_task(session_id: str, topic: str):
-    """Background task for video generation"""
+    """Background task for video generation; resumes from the session checkpoint if one exists"""
+    tracer = SessionTracer(session_id)
+    use_tracer(tracer)
+    file_manager = None
+    session_dir = None
+    checkpoint = None
     try:
-        # Create session directory
+        # Create session directory; its scratch stays put while this task runs
+        file_manager = registry.file_manager
+        file_manager.hold_scratch(session_id)
         session_dir = file_manager.create_session_directory(session_id)
+        checkpoint = await asyncio.to_thread(SessionCheckpoint.load, session_dir) or await asyncio.to_thread(
+            SessionCheckpoint.create, session_dir, session_id, topic
+        )
+        # Every image, overlay and clip is recorded from the loop: write the
+        # checkpoint once per stage, from a thread, instead of once per piece
+        checkpoint.defer_saves()
+        # Previews render a subset of scenes with cheaper images, voice and encode
+        preview = checkpoint.preview
+        
+        completed_images = 0
+        prompt_count = 0
+        
+        async def generate_scene_image(index: int, prompt: str):
+            nonlocal completed_images
+            try:
+                # An identical prompt generated for any earlier session is reused
+                # without an API call, unless the scene was sent back for regeneration
+                cache_key = registry.openai_service.image_cache_key(prompt, preview)
+                refresh = checkpoint.refresh_requested(index)
+                image_path = None
+                if not refresh:
+                    image_path = await asyncio.to_thread(
+                        get_blob_store().link, cache_key, session_dir / f"image_{index+1:02d}.png"
+                    )
+                if image_path is None:
+                    image_url = await registry.openai_service.generate_image(prompt, preview)
+                    image_path = await registry.file_manager.download_image(
+                        image_url, session_dir, f"image_{index+1:02d}.png"
+                    )
+                    await asyncio.to_thread(get_blob_store().put, cache_key, image_path, replace=refresh)
+            except Exception as e:
+                logger.error(f"Error generating image {index+1}: {str(e)}")
+                checkpoint.record_image_failure(index, str(e))
+                return
+            
+            checkpoint.record_image(index, image_path, prompt)
+            
+            # Update progress (prompt_count is unknown while the script still streams)
+            completed_images += 1
+            if prompt_count:
+                generation_status[session_id].progress = 30 + completed_images * 25 // prompt_count
+                generation_status[session_id].message = f"Generated image {completed_images}/{prompt_count}"
         
         # Step 1: Generate script
         generation_status[session_id].status = "generating_script"
         generation_status[session_id].progress = 10
         generation_status[session_id].message = "Generating script with AI..."
         
-        script_data = await openai_service.generate_script(topic)
-        script_path = session_dir / "script.txt"
-        script_path.write_text(script_data["script"])
+        # Image requests started while the script is still streaming
+        early_images: Dict[int, asyncio.Task] = {}
+        early_prompts: Dict[int, str] = {}
+        
+        def dispatch_early_image(index: int, prompt: str):
+            if not checkpoint.renders_scene(index):
+                return
+            early_prompts[index] = prompt
+            early_images[index] = asyncio.create_task(generate_scene_image(index, prompt))
+            generation_status[session_id].message = (
+                f"Generating script with AI... ({len(early_images)} images already started)"
+            )
+        
+        script_data = checkpoint.script
+        if script_data is None:
+            with tracer.span("generate_script", "stage", topic=topic, streaming=SCRIPT_STREAMING):
+                try:
+                    if SCRIPT_STREAMING:
+                        script_data = await registry.openai_service.generate_script_streaming(topic, dispatch_early_image)
+                    else:
+                        script_data = await registry.openai_service.generate_script(topic)
+                except BaseException:
+                    for task in early_images.values():
+                        task.cancel()
+                    raise
+                file_manager.save_text_file(script_data["script"], session_dir / "script.txt")
+                checkpoint.record_script(script_data)
+                await checkpoint.flush()
         
         # Step 2: Generate images (optimized for deployment)
         generation_status[session_id].status = "generating_images"
         generation_status[session_id].progress = 30
         generation_status[session_id].message = "Generating images with DALL-E..."
         
-        # Use batch processing for better deployment performance
-        image_paths = []
-        batch_size = int(os.environ.get("BATCH_SIZE", "3"))
+        # Every missing prompt is dispatched at once; the process-wide image
+        # rate limiter decides how many DALL-E calls actually run concurrently
+        prompts = script_data["image_prompts"]
+        prompt_count = len(checkpoint.scenes())
         
-        for i in range(0, len(script_data["image_prompts"]), batch_size):
-            batch_prompts = script_data["image_prompts"][i:i + batch_size]
-            
-            try:
-                # Generate batch of images
-                batch_urls = await openai_service.generate_multiple_images(batch_prompts)
-                
-                # Download images from batch
-                for j, image_url in enumerate(batch_urls):
-                    try:
-                        image_path = await file_manager.download_image(
-                            image_url, session_dir, f"image_{i+j+1:02d}.png"
-                        )
-                        image_paths.append(image_path)
-                        
-                        # Update progress
-                        total_processed = len(image_paths)
-                        progress = 30 + total_processed * 25 // len(script_data["image_prompts"])
-                        generation_status[session_id].progress = progress
-                        generation_status[session_id].message = f"Generated image {total_processed}/{len(script_data['image_prompts'])}"
-                        
-                    except Exception as e:
-                        logger.error(f"Error downloading image {i+j+1}: {str(e)}")
-                        continue
-                
-            except Exception as e:
-                logger.error(f"Error generating batch {i//batch_size + 1}: {str(e)}")
-                continue
+        completed_images = len(checkpoint.completed_images())
+        
+        with tracer.span("generate_images", "stage", prompts=len(prompts), early=len(early_images)) as stage_span:
+            await asyncio.gather(*early_images.values())
+            # Early requests that failed this run are not retried here, only
+            # prompts the stream never produced (or produced differently)
+            missing = [
+                i for i in checkpoint.missing_images()
+                if early_prompts.get(i) != prompts[i]
+            ]
+            stage_span.set(missing=len(missing))
+            await asyncio.gather(*(generate_scene_image(i, prompts[i]) for i in missing))
+            scene_images = checkpoint.completed_images()
+            stage_span.set(images=len(scene_images), failed=len(checkpoint.failed_images))
+            await checkpoint.flush()
+        
+        if checkpoint.failed_images:
+            logger.warning(
+                f"Session {session_id}: {len(checkpoint.failed_images)} image(s) failed "
+                f"and can be retried with POST /resume/{session_id}"
+            )
         
         # Step 2.5: Add text overlays to images
         generation_status[session_id].status = "adding_overlays"
         generation_status[session_id].progress = 55
         generation_status[session_id].message = "Adding text overlays to images..."
         
+        image_paths = [scene_images[i] for i in sorted(scene_images)]
         if image_paths and 'text_overlays' in script_data:
             try:
-                overlays_dir = session_dir / "overlays"
-                overlay_paths = await image_overlay_service.add_multiple_overlays(
-                    image_paths, 
-                    script_data['text_overlays'], 
-                    overlays_dir
+                texts = script_data['text_overlays']
+                pending = [i for i in sorted(scene_images) if checkpoint.overlay_path(i, texts[i]) is None]
+                # Overlays only feed the encode, so they go to the scratch tier when it has room
+                overlays_dir = await asyncio.to_thread(
+                    file_manager.work_dir, session_id, "overlays", sum(scene_images[i].stat().st_size for i in pending)
                 )
+                
+                with tracer.span("add_overlays", "stage", images=len(image_paths), pending=len(pending)):
+                    while pending:
+                        with file_manager.record_writes(overlays_dir):
+                            overlay_paths = await registry.image_overlay_service.add_multiple_overlays(
+                                [scene_images[i] for i in pending], 
+                                [texts[i] for i in pending], 
+                                overlays_dir
+                            )
+                        for i, overlay_path in zip(pending, overlay_paths):
+                            # The service hands back the originals when it fails; those are not overlays
+                            if overlay_path.parent == overlays_dir and overlay_path.exists():
+                                checkpoint.record_overlay(i, overlay_path, texts[i])
+                        pending = [i for i in pending if checkpoint.overlay_path(i, texts[i]) is None]
+                        # Scratch filled up under us: redo the rest on durable storage, once
+                        if not pending or not file_manager.out_of_scratch(overlays_dir):
+                            break
+                        overlays_dir = await asyncio.to_thread(file_manager.spill_dir, session_id, "overlays")
+                
+                await checkpoint.flush()
                 # Use overlay images instead of original images
-                image_paths = overlay_paths
+                image_paths = [checkpoint.overlay_path(i, texts[i]) or scene_images[i] for i in sorted(scene_images)]
                 generation_status[session_id].message = "Text overlays added successfully"
             except Exception as e:
                 logger.error(f"Error adding text overlays: {str(e)}")
@@ -237,40 +1000,112 @@ async def generate_video_task(session_id: str, topic: str):
         generation_status[session_id].progress = 70
         generation_status[session_id].message = "Generating voiceover..."
         
-        voiceover_path = await elevenlabs_service.generate_voiceover(
-            script_data["script"], 
-            session_dir / "voiceover.mp3"
-        )
+        voiceover_path = checkpoint.voiceover_path()
+        if voiceover_path is None:
+            with tracer.span("generate_voiceover", "stage", chars=len(script_data["script"])):
+                voiceover_path = await registry.elevenlabs_service.generate_voiceover(
+                    script_data["script"], 
+                    session_dir / "voiceover.mp3",
+                    fast=preview
+                )
+                file_manager.record_write(voiceover_path)
+                checkpoint.record_voiceover(voiceover_path)
+                await checkpoint.flush()
         
         # Step 4: Create video
         generation_status[session_id].status = "creating_video"
         generation_status[session_id].progress = 85
         generation_status[session_id].message = "Assembling final video..."
         
-        video_path = await video_service.create_video(
-            image_paths=image_paths,
-            voiceover_path=voiceover_path,
-            output_path=session_dir / "final_video.mp4",
-            script_duration=script_data.get("duration", 60)
-        )
+        renditions = checkpoint.options.get("renditions") or registry.video_service.DEFAULT_RENDITIONS
+        if preview:
+            renditions = renditions[:1]
+        subtitles = checkpoint.options.get("subtitles")
+        video_inputs = checkpoint.input_signature(image_paths + [voiceover_path]) + [f"renditions:{','.join(renditions)}"]
+        if subtitles:
+            video_inputs.append(f"subtitles:{subtitles}")
+        if preview:
+            video_inputs.append("quality:preview")
+        video_path = checkpoint.video_path(video_inputs)
+        if video_path is None:
+            # Scene clips are a cache for re-renders of this session; the videos themselves are deliverables
+            clips_dir = await asyncio.to_thread(file_manager.work_dir, session_id, "clips", int(
+                script_data.get("duration", 60) * registry.video_service.CLIP_BYTES_PER_SECOND * len(renditions)
+            ))
+            with tracer.span("create_video", "stage", images=len(image_paths), renditions=len(renditions)):
+                while True:
+                    try:
+                        with file_manager.record_writes(clips_dir):
+                            video_path = await registry.video_service.create_video(
+                                image_paths=image_paths,
+                                voiceover_path=voiceover_path,
+                                output_path=session_dir / "final_video.mp4",
+                                script_duration=script_data.get("duration", 60),
+                                renditions=renditions,
+                                subtitles=subtitles,
+                                subtitle_text=script_data["script"],
+                                preview=preview,
+                                work_dir=clips_dir
+                            )
+                        break
+                    except Exception:
+                        # Scratch filled up under the encode: redo it on durable storage, once
+                        if not file_manager.out_of_scratch(clips_dir):
+                            raise
+                        await asyncio.to_thread(file_manager.release_scratch, session_id, "clips")
+                        clips_dir = await asyncio.to_thread(file_manager.spill_dir, session_id, "clips")
+                rendition_paths = registry.video_service.rendition_paths(video_path, renditions)
+                for path in rendition_paths.values():
+                    file_manager.record_write(path)
+                checkpoint.record_video(video_path, video_inputs, rendition_paths)
+                await checkpoint.flush()
         
-        # Memory optimization: cleanup temporary files
-        try:
-            import gc
-            gc.collect()
-        except Exception:
-            pass
+        # Content digests of the deliverables back the download ETags and versioned asset URLs
+        deliverables = [*checkpoint.rendition_paths().values(), *scene_images.values(), voiceover_path,
+                        session_dir / "script.txt", session_dir / "subtitles.srt"]
+        await asyncio.to_thread(checkpoint.record_digests, deliverables)
+        await checkpoint.flush()
         
         # Complete
         generation_status[session_id].status = "completed"
         generation_status[session_id].progress = 100
         generation_status[session_id].message = "Video generation completed!"
+        if preview:
+            generation_status[session_id].message = (
+                f"Preview ready; POST /sessions/{session_id}/finalize renders the full-quality video"
+            )
+        if checkpoint.failed_images:
+            generation_status[session_id].message = (
+                f"Video generation completed without {len(checkpoint.failed_images)} failed image(s); "
+                "resume the session to retry them"
+            )
         generation_status[session_id].video_path = str(video_path)
         
+    except asyncio.CancelledError as e:
+        logger.info(f"Video generation cancelled for {session_id}")
+        generation_status[session_id].status = "cancelled"
+        generation_status[session_id].message = str(e) or "Generation cancelled"
+        raise
     except Exception as e:
         logger.error(f"Error in video generation task: {str(e)}")
         generation_status[session_id].status = "error"
         generation_status[session_id].message = f"Error: {str(e)}"
+    finally:
+        if checkpoint is not None:
+            # Whatever the interrupted stage finished (failed images included) is kept for a resume
+            try:
+                await checkpoint.flush()
+            except Exception as e:
+                logger.error(f"Error saving checkpoint for {session_id}: {str(e)}")
+        if file_manager is not None:
+            file_manager.release_hold(session_id)
+        tracer.instant(generation_status[session_id].status, "status")
+        if session_dir is not None:
+            try:
+                tracer.save(session_dir / "trace.json")
+            except Exception as e:
+                logger.error(f"Error saving trace for {session_id}: {str(e)}")
+        use_tracer(None)
 
 if __name__ == "__main__":
     # Ensure directories exist at startup
@@ -290,7 +1125,10 @@ if __name__ == "__main__":
             app, 
             host="0.0.0.0", 
             port=port,
-            log_level="info"
+            log_level="info",
+            log_config=None,  # uvicorn's loggers propagate to our queue handler
+            proxy_headers=True,
+            forwarded_allow_ips=FORWARDED_ALLOW_IPS
         )
     except Exception as e:
         logger.error(f"Failed to start server: {str(e)}")
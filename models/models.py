@@ -1,9 +1,28 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Literal
 from enum import Enum
 
 class VideoRequest(BaseModel):
     topic: str = Field(..., min_length=1, max_length=200, description="Historical topic for video generation")
+    renditions: List[Literal["landscape", "portrait", "square"]] = Field(
+        default_factory=lambda: ["landscape"], min_length=1, max_length=3,
+        description="Aspect ratios to render (16:9, 9:16, 1:1); the first is the main download"
+    )
+    subtitles: Optional[Literal["soft", "burned"]] = Field(
+        None, description="Per-sentence captions as a selectable track (soft) or drawn into the video (burned)"
+    )
+    quality: Literal["preview", "final"] = Field(
+        "final", description="preview: fewer, smaller scenes, fast voice and encode; finalize it later for full quality"
+    )
+    priority: Literal["interactive", "bulk"] = Field(
+        "interactive", description="bulk: wait for spare render capacity, behind interactive generations"
+    )
+
+class SceneEdit(BaseModel):
+    prompt: Optional[str] = Field(None, min_length=1, max_length=1000, description="Generate the scene's image from this prompt instead")
+    regenerate: bool = Field(False, description="Generate the scene's image again from its current prompt")
+    image_url: Optional[str] = Field(None, description="Replace the scene's image with the image at this https URL (public hosts only)")
+    caption: Optional[str] = Field(None, max_length=200, description="New text overlay for the scene")
 
 class VideoResponse(BaseModel):
     session_id: str
@@ -14,7 +33,7 @@ class VideoResponse(BaseModel):
 
 class GenerationStatus(BaseModel):
     session_id: str
-    status: str  # initializing, generating_script, generating_images, generating_voiceover, creating_video, completed, error
+    status: str  # queued, initializing, generating_script, generating_images, generating_voiceover, creating_video, completed, error, cancelled
     progress: int = Field(0, ge=0, le=100)
     message: str = ""
     video_path: Optional[str] = None
@@ -45,4 +64,7 @@ class AssetResponse(BaseModel):
     script: Optional[str] = None
     voiceover: Optional[str] = None
     images: List[str] = []
+    image_downloads: List[str] = []
     video: Optional[str] = None
+    subtitles: Optional[str] = None
+    renditions: Dict[str, str] = {}
@@ -5,6 +5,10 @@ import logging
 from pathlib import Path
 from typing import Union
 
+from utils.blob_store import BlobStore, get_blob_store
+from utils.process import run_process
+from utils.tracer import trace_span
+
 logger = logging.getLogger(__name__)
 
 class ElevenLabsService:
@@ -13,15 +17,44 @@ class ElevenLabsService:
         if not self.api_key:
             logger.warning("ELEVENLABS_API_KEY not found, will try TTSMaker as fallback")
         
-        self.base_url = "https://api.elevenlabs.io/v1"
+        self.base_url = os.getenv("ELEVENLABS_BASE_URL", "https://api.elevenlabs.io/v1")
         self.voice_id = "21m00Tcm4TlvDq8ikWAM"  # Default voice ID
+        self.model_id = "eleven_monolingual_v1"
+        # Asked for explicitly: the video muxer stream-copies this MP3 into the MP4
+        self.output_format = "mp3_44100_128"
+        self.voice_settings = {
+            "stability": 0.5,
+            "similarity_boost": 0.8,
+            "style": 0.0,
+            "use_speaker_boost": True
+        }
+        self.edge_voice = "en-US-JennyNeural"
+    
+    def _cache_key(self, provider: str, text: str) -> str:
+        """Blob store key of the audio a provider produces for text"""
+        if provider == "elevenlabs":
+            return BlobStore.key("voiceover", provider=provider, voice=self.voice_id, model=self.model_id,
+                                 settings=self.voice_settings, format=self.output_format, text=text)
+        return BlobStore.key("voiceover", provider=provider, voice=self.edge_voice, text=text)
+        
+    async def generate_voiceover(self, text: str, output_path: Union[str, Path], fast: bool = False) -> Path:
+        """Generate voiceover audio from text; identical text is only synthesized once per voice.
         
-    async def generate_voiceover(self, text: str, output_path: Union[str, Path]) -> Path:
-        """Generate voiceover audio from text"""
+        fast skips ElevenLabs for the quicker, free edge-tts voice (previews).
+        """
         output_path = Path(output_path)
         
+        # Look up the preferred provider's output; fallback results are cached
+        # under their own provider and never stand in for the preferred one
+        provider = "elevenlabs" if self.api_key and not fast else "edge-tts"
+        if await asyncio.to_thread(get_blob_store().link, self._cache_key(provider, text), output_path):
+            return output_path
+        
+        # A previous file may be linked into the blob store; never overwrite it in place
+        output_path.unlink(missing_ok=True)
+        
         try:
-            if self.api_key:
+            if provider == "elevenlabs":
                 return await self._generate_with_elevenlabs(text, output_path)
             else:
                 return await self._generate_with_ttsmaker(text, output_path)
@@ -29,7 +62,7 @@ class ElevenLabsService:
         except Exception as e:
             logger.error(f"Error generating voiceover: {str(e)}")
             # Fallback to TTSMaker if ElevenLabs fails
-            if self.api_key:
+            if provider == "elevenlabs":
                 logger.info("Falling back to TTSMaker...")
                 return await self._generate_with_ttsmaker(text, output_path)
             else:
@@ -47,36 +80,34 @@ class ElevenLabsService:
         
         data = {
             "text": text,
-            "model_id": "eleven_monolingual_v1",
-            "voice_settings": {
-                "stability": 0.5,
-                "similarity_boost": 0.8,
-                "style": 0.0,
-                "use_speaker_boost": True
-            }
+            "model_id": self.model_id,
+            "voice_settings": self.voice_settings
         }
         
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=data, headers=headers) as response:
-                if response.status == 200:
-                    content = await response.read()
-                    
-                    # Save the audio file
-                    output_path.parent.mkdir(parents=True, exist_ok=True)
-                    with open(output_path, 'wb') as f:
-                        f.write(content)
-                    
-                    logger.info(f"Generated voiceover with ElevenLabs: {output_path}")
-                    return output_path
-                else:
-                    error_text = await response.text()
-                    raise Exception(f"ElevenLabs API error {response.status}: {error_text}")
+        with trace_span("elevenlabs.text_to_speech", "tts", chars=len(text)) as span:
+            async with aiohttp.ClientSession() as session:
+                async with session.post(url, json=data, headers=headers,
+                                        params={"output_format": self.output_format}) as response:
+                    if response.status == 200:
+                        content = await response.read()
+                        span.set(bytes=len(content))
+                        
+                        # Save the audio file
+                        output_path.parent.mkdir(parents=True, exist_ok=True)
+                        with open(output_path, 'wb') as f:
+                            f.write(content)
+                        
+                        await asyncio.to_thread(get_blob_store().put, self._cache_key("elevenlabs", text), output_path)
+                        logger.info(f"Generated voiceover with ElevenLabs: {output_path}")
+                        return output_path
+                    else:
+                        error_text = await response.text()
+                        raise Exception(f"ElevenLabs API error {response.status}: {error_text}")
     
     async def _generate_with_ttsmaker(self, text: str, output_path: Path) -> Path:
         """Generate voiceover using edge-tts (Microsoft Edge TTS) as fallback"""
         try:
             # Try using a different approach - directly use edge-tts if available
-            import subprocess
             import tempfile
             
             # Create a temporary SSML file
@@ -89,22 +120,28 @@ class ElevenLabsService:
                 'edge-tts',
                 '--text', text,
                 '--write-media', str(output_path),
-                '--voice', 'en-US-JennyNeural'
+                '--voice', self.edge_voice
             ]
             
             try:
-                result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
+                with trace_span("edge-tts", "subprocess", chars=len(text)) as span:
+                    result = await run_process(cmd, timeout=60)
+                    span.set(returncode=result.returncode)
+                    if result.returncode == 0:
+                        span.set(bytes=output_path.stat().st_size)
                 if result.returncode == 0:
+                    await asyncio.to_thread(get_blob_store().put, self._cache_key("edge-tts", text), output_path)
                     logger.info(f"Generated voiceover with edge-tts: {output_path}")
                     return output_path
                 else:
-                    logger.error(f"edge-tts error: {result.stderr}")
-                    raise Exception(f"edge-tts failed: {result.stderr}")
+                    stderr = result.stderr.decode('utf-8', errors='replace')
+                    logger.error(f"edge-tts error: {stderr}")
+                    raise Exception(f"edge-tts failed: {stderr}")
             except FileNotFoundError:
                 # edge-tts not available, try a simpler approach
                 logger.warning("edge-tts not available, using text-to-silence fallback")
                 return await self._generate_silence_with_text(text, output_path)
-            except subprocess.TimeoutExpired:
+            except asyncio.TimeoutError:
                 raise Exception("TTS generation timed out")
             finally:
                 # Clean up temp file
@@ -121,8 +158,6 @@ class ElevenLabsService:
     async def _generate_silence_with_text(self, text: str, output_path: Path) -> Path:
         """Generate a silent audio file as final fallback"""
         try:
-            import subprocess
-            
             # Calculate duration based on text length (average reading speed)
             words = len(text.split())
             duration = max(10, words * 0.4)  # ~150 words per minute
@@ -138,12 +173,14 @@ class ElevenLabsService:
                 str(output_path)
             ]
             
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+            with trace_span("ffmpeg.silence", "subprocess", duration=duration) as span:
+                result = await run_process(cmd, timeout=30)
+                span.set(returncode=result.returncode)
             if result.returncode == 0:
                 logger.info(f"Generated silent audio placeholder: {output_path}")
                 return output_path
             else:
-                raise Exception(f"FFmpeg error: {result.stderr}")
+                raise Exception(f"FFmpeg error: {result.stderr.decode('utf-8', errors='replace')}")
                 
         except Exception as e:
             logger.error(f"Error generating silent audio: {str(e)}")
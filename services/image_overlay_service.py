@@ -7,6 +7,9 @@ from PIL import Image, ImageDraw, ImageFont
 import io
 import base64
 
+from utils.memory import get_memory_budget
+from utils.tracer import trace_span
+
 logger = logging.getLogger(__name__)
 
 class ImageOverlayService:
@@ -31,74 +34,11 @@ class ImageOverlayService:
             # Ensure output directory exists
             output_path.parent.mkdir(parents=True, exist_ok=True)
             
-            # Open the image
-            with Image.open(image_path) as img:
-                # Convert to RGBA if not already
-                if img.mode != 'RGBA':
-                    img = img.convert('RGBA')
-                
-                # Create a drawing context
-                draw = ImageDraw.Draw(img)
-                
-                # Try to load a font, fallback to default if not available
-                try:
-                    font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", self.font_size)
-                except (OSError, IOError):
-                    try:
-                        font = ImageFont.truetype("arial.ttf", self.font_size)
-                    except (OSError, IOError):
-                        font = ImageFont.load_default()
-                
-                # Get text dimensions
-                text_bbox = draw.textbbox((0, 0), text, font=font)
-                text_width = text_bbox[2] - text_bbox[0]
-                text_height = text_bbox[3] - text_bbox[1]
-                
-                # Calculate position
-                img_width, img_height = img.size
-                
-                if self.position == 'bottom':
-                    x = (img_width - text_width) // 2
-                    y = img_height - text_height - self.padding * 2
-                elif self.position == 'top':
-                    x = (img_width - text_width) // 2
-                    y = self.padding
-                else:  # center
-                    x = (img_width - text_width) // 2
-                    y = (img_height - text_height) // 2
-                
-                # Create background rectangle
-                bg_x1 = x - self.padding
-                bg_y1 = y - self.padding
-                bg_x2 = x + text_width + self.padding
-                bg_y2 = y + text_height + self.padding
-                
-                # Create overlay for background
-                overlay = Image.new('RGBA', img.size, (0, 0, 0, 0))
-                overlay_draw = ImageDraw.Draw(overlay)
-                
-                # Draw background rectangle
-                overlay_draw.rectangle(
-                    [bg_x1, bg_y1, bg_x2, bg_y2],
-                    fill=self.background_color
-                )
-                
-                # Composite the overlay
-                img = Image.alpha_composite(img, overlay)
-                
-                # Draw text
-                draw = ImageDraw.Draw(img)
-                draw.text((x, y), text, font=font, fill=self.font_color)
-                
-                # Convert back to RGB for saving
-                if img.mode == 'RGBA':
-                    # Create a white background
-                    background = Image.new('RGB', img.size, (255, 255, 255))
-                    background.paste(img, mask=img.split()[-1])  # Use alpha channel as mask
-                    img = background
-                
-                # Save the result
-                img.save(output_path, 'PNG', quality=95)
+            # Decoded image, overlay layer and composite are all full-size; wait for memory headroom.
+            # Pillow does not release the loop, so the drawing itself runs in a thread.
+            async with get_memory_budget().reserve("overlay"):
+                with trace_span("image_overlay.add_text_overlay", "overlay", image=image_path.name) as span:
+                    span.set(bytes=await asyncio.to_thread(self._render_overlay, image_path, text, output_path))
                 
             logger.info(f"Added text overlay '{text}' to image: {output_path}")
             return output_path
@@ -107,9 +47,80 @@ class ImageOverlayService:
             logger.error(f"Error adding text overlay: {str(e)}")
             # If overlay fails, just copy the original image
             import shutil
-            shutil.copy2(image_path, output_path)
+            await asyncio.to_thread(shutil.copy2, image_path, output_path)
             return output_path
     
+    def _render_overlay(self, image_path: Path, text: str, output_path: Path) -> int:
+        """Draw the text box onto the image and save it as output_path; returns its size. Blocking."""
+        with Image.open(image_path) as img:
+            # Convert to RGBA if not already
+            if img.mode != 'RGBA':
+                img = img.convert('RGBA')
+            
+            # Create a drawing context
+            draw = ImageDraw.Draw(img)
+            
+            # Try to load a font, fallback to default if not available
+            try:
+                font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", self.font_size)
+            except (OSError, IOError):
+                try:
+                    font = ImageFont.truetype("arial.ttf", self.font_size)
+                except (OSError, IOError):
+                    font = ImageFont.load_default()
+            
+            # Get text dimensions
+            text_bbox = draw.textbbox((0, 0), text, font=font)
+            text_width = text_bbox[2] - text_bbox[0]
+            text_height = text_bbox[3] - text_bbox[1]
+            
+            # Calculate position
+            img_width, img_height = img.size
+            
+            if self.position == 'bottom':
+                x = (img_width - text_width) // 2
+                y = img_height - text_height - self.padding * 2
+            elif self.position == 'top':
+                x = (img_width - text_width) // 2
+                y = self.padding
+            else:  # center
+                x = (img_width - text_width) // 2
+                y = (img_height - text_height) // 2
+            
+            # Create background rectangle
+            bg_x1 = x - self.padding
+            bg_y1 = y - self.padding
+            bg_x2 = x + text_width + self.padding
+            bg_y2 = y + text_height + self.padding
+            
+            # Create overlay for background
+            overlay = Image.new('RGBA', img.size, (0, 0, 0, 0))
+            overlay_draw = ImageDraw.Draw(overlay)
+            
+            # Draw background rectangle
+            overlay_draw.rectangle(
+                [bg_x1, bg_y1, bg_x2, bg_y2],
+                fill=self.background_color
+            )
+            
+            # Composite the overlay
+            img = Image.alpha_composite(img, overlay)
+            
+            # Draw text
+            draw = ImageDraw.Draw(img)
+            draw.text((x, y), text, font=font, fill=self.font_color)
+            
+            # Convert back to RGB for saving
+            if img.mode == 'RGBA':
+                # Create a white background
+                background = Image.new('RGB', img.size, (255, 255, 255))
+                background.paste(img, mask=img.split()[-1])  # Use alpha channel as mask
+                img = background
+            
+            # Save the result
+            img.save(output_path, 'PNG', quality=95)
+        return output_path.stat().st_size
+    
     async def add_multiple_overlays(
         self,
         image_paths: List[Path],
@@ -1,13 +1,66 @@
 import os
 import json
 import logging
-from typing import Dict, List, Any
-from openai import OpenAI
+from typing import Callable, Dict, List, Any, Optional, Tuple
+from openai import OpenAI, AsyncOpenAI, RateLimitError
 import aiohttp
 import asyncio
 
+from utils.blob_store import BlobStore
+from utils.rate_limiter import get_image_rate_limiter, retry_after_seconds
+from utils.tracer import trace_span
+
 logger = logging.getLogger(__name__)
 
+class ImagePromptStreamParser:
+    """Pulls completed strings out of the top-level "image_prompts" array of a
+    JSON document that arrives in arbitrary chunks"""
+    
+    def __init__(self, key: str = "image_prompts"):
+        self.key = key
+        self.count = 0
+        self._stack: List[Dict[str, Any]] = []
+        self._in_string = False
+        self._escape = False
+        self._buffer: List[str] = []
+    
+    def feed(self, text: str) -> List[Tuple[int, str]]:
+        """Consume a chunk and return the (index, prompt) pairs it completed"""
+        found = []
+        for ch in text:
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    self._string_done(json.loads('"' + "".join(self._buffer) + '"'), found)
+                    continue
+                self._buffer.append(ch)
+            elif ch == '"':
+                self._in_string = True
+                self._buffer = []
+            elif ch in '{[':
+                self._stack.append({"type": ch, "key": None, "expect_key": ch == '{'})
+            elif ch in '}]':
+                if self._stack:
+                    self._stack.pop()
+            elif ch == ':' and self._stack:
+                self._stack[-1]["expect_key"] = False
+            elif ch == ',' and self._stack and self._stack[-1]["type"] == '{':
+                self._stack[-1]["expect_key"] = True
+        return found
+    
+    def _string_done(self, value: str, found: List[Tuple[int, str]]):
+        top = self._stack[-1] if self._stack else None
+        if top and top["type"] == '{' and top["expect_key"]:
+            top["key"] = value
+        elif (len(self._stack) == 2 and self._stack[0]["type"] == '{'
+              and self._stack[0]["key"] == self.key and top["type"] == '['):
+            found.append((self.count, value))
+            self.count += 1
+
 class OpenAIService:
     def __init__(self):
         self.api_key = os.getenv("OPENAI_API_KEY")
@@ -15,6 +68,22 @@ class OpenAIService:
             raise ValueError("OPENAI_API_KEY environment variable is required")
         
         self.client = OpenAI(api_key=self.api_key)
+        self.async_client = AsyncOpenAI(api_key=self.api_key)
+        
+        # Image calls go through the shared adaptive limiter, which owns 429
+        # handling, so the SDK's own retries are disabled for them
+        self.image_client = AsyncOpenAI(
+            api_key=self.api_key,
+            max_retries=0,
+            timeout=float(os.getenv("IMAGE_REQUEST_TIMEOUT", "120"))
+        )
+        self.image_max_attempts = int(os.getenv("IMAGE_MAX_ATTEMPTS", "4"))
+        self.image_model = "dall-e-3"
+        self.image_size = "1024x1024"
+        self.image_quality = "standard"
+        # Previews trade image quality for speed and cost
+        self.preview_image_model = os.getenv("PREVIEW_IMAGE_MODEL", "dall-e-2")
+        self.preview_image_size = os.getenv("PREVIEW_IMAGE_SIZE", "512x512")
         
         # Enhanced visual style template for images
         self.visual_style = (
@@ -26,66 +95,76 @@ class OpenAIService:
             "museum-quality artwork style, engaging and educational composition"
         )
 
+    def _script_messages(self, topic: str) -> List[Dict[str, str]]:
+        """Build the chat messages asking for the script and image prompts"""
+        return [
+            {
+                "role": "system",
+                "content": (
+                    "You are an expert historical documentary script writer. "
+                    "Generate engaging, factual educational content for video production. "
+                    "Create a continuous voiceover script for 60-80 seconds and corresponding "
+                    "image prompts that will bring the story to life visually. "
+                    "Respond with JSON format containing 'script', 'image_prompts', and 'duration'."
+                )
+            },
+            {
+                "role": "user",
+                "content": (
+                    f"Create a 60-80 second educational video script about: {topic}\n\n"
+                    "Requirements:\n"
+                    "1. Write an engaging, informative voiceover script\n"
+                    "2. Create 12-16 highly detailed image prompts (one per 5 seconds)\n"
+                    "3. Each image prompt should be specific, vivid, and historically accurate\n"
+                    "4. Include descriptive text overlays for each image with key information\n"
+                    "5. Make it educational but entertaining\n"
+                    "6. Include estimated duration in seconds\n\n"
+                    "Format response as JSON with keys:\n"
+                    "- 'script': the voiceover text\n"
+                    "- 'image_prompts': array of detailed image descriptions\n"
+                    "- 'text_overlays': array of educational text for each image (dates, names, locations, facts)\n"
+                    "- 'duration': estimated duration in seconds\n\n"
+                    "Example text overlay: 'Ancient Rome, 753 BC' or 'Julius Caesar (100-44 BC)' or 'Battle of Hastings, 1066 AD'"
+                )
+            }
+        ]
+
+    def _validate_script(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Check the script JSON and pad/truncate text_overlays to the prompts"""
+        # Validate response structure
+        required_keys = ['script', 'image_prompts', 'duration']
+        if not all(key in result for key in required_keys):
+            raise ValueError("Invalid response format from OpenAI")
+        
+        # Handle text_overlays - if not provided, create default ones
+        if 'text_overlays' not in result:
+            result['text_overlays'] = [f"Historical Scene {i+1}" for i in range(len(result['image_prompts']))]
+        
+        # Ensure text_overlays matches image_prompts length
+        if len(result['text_overlays']) != len(result['image_prompts']):
+            # Pad or truncate to match
+            while len(result['text_overlays']) < len(result['image_prompts']):
+                result['text_overlays'].append("Historical Scene")
+            result['text_overlays'] = result['text_overlays'][:len(result['image_prompts'])]
+        
+        return result
+
     async def generate_script(self, topic: str) -> Dict[str, Any]:
         """Generate script and image prompts for the historical topic"""
         try:
             # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
             # do not change this unless explicitly requested by the user
-            response = self.client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": (
-                            "You are an expert historical documentary script writer. "
-                            "Generate engaging, factual educational content for video production. "
-                            "Create a continuous voiceover script for 60-80 seconds and corresponding "
-                            "image prompts that will bring the story to life visually. "
-                            "Respond with JSON format containing 'script', 'image_prompts', and 'duration'."
-                        )
-                    },
-                    {
-                        "role": "user",
-                        "content": (
-                            f"Create a 60-80 second educational video script about: {topic}\n\n"
-                            "Requirements:\n"
-                            "1. Write an engaging, informative voiceover script\n"
-                            "2. Create 12-16 highly detailed image prompts (one per 5 seconds)\n"
-                            "3. Each image prompt should be specific, vivid, and historically accurate\n"
-                            "4. Include descriptive text overlays for each image with key information\n"
-                            "5. Make it educational but entertaining\n"
-                            "6. Include estimated duration in seconds\n\n"
-                            "Format response as JSON with keys:\n"
-                            "- 'script': the voiceover text\n"
-                            "- 'image_prompts': array of detailed image descriptions\n"
-                            "- 'text_overlays': array of educational text for each image (dates, names, locations, facts)\n"
-                            "- 'duration': estimated duration in seconds\n\n"
-                            "Example text overlay: 'Ancient Rome, 753 BC' or 'Julius Caesar (100-44 BC)' or 'Battle of Hastings, 1066 AD'"
-                        )
-                    }
-                ],
-                response_format={"type": "json_object"},
-                max_tokens=2000,
-                temperature=0.7
-            )
-            
-            result = json.loads(response.choices[0].message.content)
-            
-            # Validate response structure
-            required_keys = ['script', 'image_prompts', 'duration']
-            if not all(key in result for key in required_keys):
-                raise ValueError("Invalid response format from OpenAI")
+            with trace_span("openai.generate_script", "openai", model="gpt-4o") as span:
+                response = self.client.chat.completions.create(
+                    model="gpt-4o",
+                    messages=self._script_messages(topic),
+                    response_format={"type": "json_object"},
+                    max_tokens=2000,
+                    temperature=0.7
+                )
+                span.set(bytes=len(response.choices[0].message.content or ""))
             
-            # Handle text_overlays - if not provided, create default ones
-            if 'text_overlays' not in result:
-                result['text_overlays'] = [f"Historical Scene {i+1}" for i in range(len(result['image_prompts']))]
-            
-            # Ensure text_overlays matches image_prompts length
-            if len(result['text_overlays']) != len(result['image_prompts']):
-                # Pad or truncate to match
-                while len(result['text_overlays']) < len(result['image_prompts']):
-                    result['text_overlays'].append("Historical Scene")
-                result['text_overlays'] = result['text_overlays'][:len(result['image_prompts'])]
+            result = self._validate_script(json.loads(response.choices[0].message.content))
             
             logger.info(f"Generated script with {len(result['image_prompts'])} image prompts")
             return result
@@ -94,71 +173,115 @@ class OpenAIService:
             logger.error(f"Error generating script: {str(e)}")
             raise Exception(f"Failed to generate script: {str(e)}")
 
-    async def generate_image(self, prompt: str) -> str:
-        """Generate image using DALL-E"""
+    async def generate_script_streaming(
+        self,
+        topic: str,
+        on_image_prompt: Callable[[int, str], None]
+    ) -> Dict[str, Any]:
+        """Generate the script as a stream, calling on_image_prompt(index, prompt) as
+        soon as each image prompt is complete so image requests can start early"""
         try:
-            # Add visual style to prompt
-            full_prompt = f"{prompt}, {self.visual_style}"
+            parser = ImagePromptStreamParser()
+            chunks = []
             
-            response = self.client.images.generate(
-                model="dall-e-3",
-                prompt=full_prompt,
-                size="1024x1024",
-                quality="standard",
-                n=1
-            )
+            with trace_span("openai.generate_script", "openai", model="gpt-4o", stream=True) as span:
+                stream = await self.async_client.chat.completions.create(
+                    model="gpt-4o",
+                    messages=self._script_messages(topic),
+                    response_format={"type": "json_object"},
+                    max_tokens=2000,
+                    temperature=0.7,
+                    stream=True
+                )
+                async for chunk in stream:
+                    if not chunk.choices or not chunk.choices[0].delta.content:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    chunks.append(delta)
+                    for index, prompt in parser.feed(delta):
+                        on_image_prompt(index, prompt)
+                span.set(bytes=sum(len(c) for c in chunks), streamed_prompts=parser.count)
             
-            image_url = response.data[0].url
-            logger.info(f"Generated image for prompt: {prompt[:50]}...")
+            result = self._validate_script(json.loads("".join(chunks)))
             
-            return image_url
+            logger.info(
+                f"Generated script with {len(result['image_prompts'])} image prompts "
+                f"({parser.count} dispatched while streaming)"
+            )
+            return result
             
         except Exception as e:
-            logger.error(f"Error generating image: {str(e)}")
-            raise Exception(f"Failed to generate image: {str(e)}")
+            logger.error(f"Error generating script: {str(e)}")
+            raise Exception(f"Failed to generate script: {str(e)}")
+
+    def _image_settings(self, prompt: str, preview: bool = False) -> Dict[str, str]:
+        """Model, styled prompt, size and quality of an image request"""
+        if preview:
+            # dall-e-2 rejects prompts over 1000 characters
+            return {
+                "model": self.preview_image_model,
+                "prompt": f"{prompt}, {self.visual_style}"[:1000],
+                "size": self.preview_image_size,
+                "quality": "standard"
+            }
+        return {
+            "model": self.image_model,
+            "prompt": f"{prompt}, {self.visual_style}",
+            "size": self.image_size,
+            "quality": self.image_quality
+        }
 
-    async def generate_multiple_images(self, prompts: List[str]) -> List[str]:
-        """Generate multiple images with deployment optimizations"""
+    async def generate_image(self, prompt: str, preview: bool = False) -> str:
+        """Generate image using DALL-E; preview uses the cheaper preview model and size"""
+        limiter = get_image_rate_limiter()
+        
         try:
-            # Process in smaller batches to avoid rate limits and memory issues
-            batch_size = 3
-            all_urls = []
+            settings = self._image_settings(prompt, preview)
             
-            for i in range(0, len(prompts), batch_size):
-                batch = prompts[i:i + batch_size]
-                logger.info(f"Processing image batch {i//batch_size + 1}/{(len(prompts) + batch_size - 1)//batch_size}")
-                
-                # Create tasks for concurrent generation within batch
-                tasks = []
-                for prompt in batch:
-                    task = asyncio.create_task(self.generate_image(prompt))
-                    tasks.append(task)
-                
-                # Wait for batch completion with timeout
+            for attempt in range(1, self.image_max_attempts + 1):
                 try:
-                    batch_urls = await asyncio.wait_for(
-                        asyncio.gather(*tasks, return_exceptions=True),
-                        timeout=120.0  # 2 minute timeout per batch
-                    )
-                    
-                    # Filter out exceptions and return valid URLs
-                    for j, result in enumerate(batch_urls):
-                        if isinstance(result, Exception):
-                            logger.error(f"Failed to generate image {i+j+1}: {str(result)}")
-                            continue
-                        all_urls.append(result)
-                    
-                except asyncio.TimeoutError:
-                    logger.warning(f"Batch {i//batch_size + 1} timed out, continuing with next batch")
+                    async with limiter.slot():
+                        with trace_span("openai.generate_image", "openai", model=settings["model"],
+                                        prompt=prompt[:80], attempt=attempt):
+                            response = await self.image_client.images.generate(n=1, **settings)
+                except RateLimitError as e:
+                    limiter.on_rate_limited(retry_after_seconds(e.response.headers, default=2.0 ** attempt))
+                    if attempt == self.image_max_attempts:
+                        raise
                     continue
                 
-                # Small delay between batches to avoid rate limits
-                if i + batch_size < len(prompts):
-                    await asyncio.sleep(1)
+                limiter.on_success()
+                break
             
-            logger.info(f"Generated {len(all_urls)} out of {len(prompts)} images")
-            return all_urls
+            image_url = response.data[0].url
+            logger.info(f"Generated image for prompt: {prompt[:50]}...")
+            
+            return image_url
             
         except Exception as e:
-            logger.error(f"Error generating multiple images: {str(e)}")
-            raise Exception(f"Failed to generate images: {str(e)}")
+            limiter.on_failure()
+            logger.error(f"Error generating image: {str(e)}")
+            raise Exception(f"Failed to generate image: {str(e)}")
+
+    def image_cache_key(self, prompt: str, preview: bool = False) -> str:
+        """Blob store key of the image generate_image would produce for prompt"""
+        return BlobStore.key("image", **self._image_settings(prompt, preview))
+
+    async def generate_multiple_images(self, prompts: List[str]) -> List[Optional[str]]:
+        """Generate multiple images; failed prompts come back as None so indices stay aligned"""
+        # Pacing and concurrency are left to the process-wide image limiter
+        results = await asyncio.gather(
+            *(self.generate_image(prompt) for prompt in prompts),
+            return_exceptions=True
+        )
+        
+        urls = []
+        for i, result in enumerate(results):
+            if isinstance(result, Exception):
+                logger.error(f"Failed to generate image {i+1}: {str(result)}")
+                urls.append(None)
+            else:
+                urls.append(result)
+        
+        logger.info(f"Generated {sum(1 for url in urls if url)} out of {len(prompts)} images")
+        return urls
@@ -0,0 +1,73 @@
+import os
+import asyncio
+import logging
+from pathlib import Path
+from typing import Dict, Union
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+class ThumbnailService:
+    """Resized WebP/JPEG copies of session images for the asset gallery.
+
+    Each variant is rendered once, on first request, into a thumbnails/
+    directory next to the original. Its name carries the original's content
+    version, so an edited image never reuses an old variant; mtimes cannot
+    tell, since images linked from the blob store keep the blob's mtime.
+    """
+
+    WIDTHS = (160, 320, 640)
+    # format -> (Pillow format, media type, encoder options)
+    FORMATS = {
+        "webp": ("WEBP", "image/webp", {"method": 4}),
+        "jpeg": ("JPEG", "image/jpeg", {"optimize": True, "progressive": True})
+    }
+
+    def __init__(self, quality: int = 80):
+        self.quality = quality
+        self._pending: Dict[Path, asyncio.Task] = {}
+
+    def thumbnail_path(self, image_path: Path, width: int, fmt: str, version: str) -> Path:
+        return image_path.parent / "thumbnails" / f"{image_path.stem}_{width}_{version}.{fmt}"
+
+    async def get_thumbnail(self, image_path: Union[str, Path], version: str, width: int = 320,
+                            fmt: str = "webp") -> Path:
+        """Path of the variant for the image content identified by version, rendering it first if missing"""
+        image_path = Path(image_path)
+        if width not in self.WIDTHS:
+            raise ValueError(f"Unsupported thumbnail width: {width}")
+        if fmt not in self.FORMATS:
+            raise ValueError(f"Unsupported thumbnail format: {fmt}")
+
+        path = self.thumbnail_path(image_path, width, fmt, version)
+        if path.exists():
+            return path
+
+        # Concurrent requests for the same variant share one render
+        task = self._pending.get(path)
+        if task is None:
+            task = asyncio.ensure_future(asyncio.to_thread(self._render, image_path, path, width, fmt))
+            self._pending[path] = task
+            task.add_done_callback(lambda _: self._pending.pop(path, None))
+        return await asyncio.shield(task)
+
+    def _render(self, image_path: Path, path: Path, width: int, fmt: str) -> Path:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with Image.open(image_path) as img:
+            img = img.convert("RGB")
+            if img.width > width:
+                img = img.resize((width, max(1, round(img.height * width / img.width))), Image.LANCZOS)
+            # Write under a temp name so readers never see a partial file
+            tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+            pil_format, _, options = self.FORMATS[fmt]
+            img.save(tmp_path, pil_format, quality=self.quality, **options)
+        os.replace(tmp_path, path)
+        # Variants of earlier versions of the image are never asked for again
+        for old in path.parent.glob(f"{image_path.stem}_{width}_*.{fmt}"):
+            if old != path:
+                old.unlink(missing_ok=True)
+        logger.info(f"Created {width}px {fmt} thumbnail: {path} ({path.stat().st_size} bytes)")
+        return path
+
+    def media_type(self, fmt: str) -> str:
+        return self.FORMATS[fmt][1]
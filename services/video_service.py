@@ -1,25 +1,79 @@
 import os
 import asyncio
+import hashlib
 import logging
 from pathlib import Path
-from typing import List, Union
+from typing import Any, Dict, List, Optional, Union
 import subprocess
 import json
 
+from utils.memory import get_memory_budget
+from utils.process import run_process
+from utils.subtitles import write_srt
+from utils.tracer import trace_span
+
 logger = logging.getLogger(__name__)
 
 class VideoService:
+    # Output formats: images are cover-cropped to `crop`, then zoompan renders
+    # frames of `size`; `encoder` holds per-output libx264 settings
+    RENDITIONS = {
+        "landscape": {"aspect": "16:9", "crop": (1920, 1080), "size": (1280, 720), "encoder": ["-preset", "medium", "-crf", "23"]},
+        "portrait": {"aspect": "9:16", "crop": (1080, 1920), "size": (720, 1280), "encoder": ["-preset", "medium", "-crf", "23"]},
+        "square": {"aspect": "1:1", "crop": (1080, 1080), "size": (720, 720), "encoder": ["-preset", "medium", "-crf", "23"]}
+    }
+    DEFAULT_RENDITIONS = ["landscape"]
+    # Previews halve crop and frame size and trade compression for encode speed
+    PREVIEW_ENCODER = ["-preset", "ultrafast", "-crf", "30"]
+    FPS = 25
+    # Rough size of one rendition's scene clips per second of video, for sizing the scratch tier
+    CLIP_BYTES_PER_SECOND = 512 * 1024
+    # "soft": timed text track muxed into the MP4; "burned": drawn into the frames
+    SUBTITLE_MODES = ("soft", "burned")
+    
     def __init__(self):
         self.ffmpeg_path = "ffmpeg"  # Assume ffmpeg is in PATH
+        # Scene clips encoded at once; each ffmpeg run is already multi-threaded
+        self.clip_concurrency = max(1, int(os.environ.get("VIDEO_CLIP_CONCURRENCY", "2")))
+        # The TTS layer delivers MP3, which MP4 carries as is; only loudness
+        # normalization (AUDIO_LOUDNORM) costs an audio encode, done in the mux run
+        self.audio_copy = os.environ.get("AUDIO_STREAM_COPY", "true").lower() in ("1", "true", "yes")
+        self.loudnorm = os.environ.get("AUDIO_LOUDNORM", "false").lower() in ("1", "true", "yes")
+        self.loudnorm_target = float(os.environ.get("AUDIO_LOUDNORM_LUFS", "-16"))
+    
+    def rendition_paths(self, output_path: Union[str, Path], renditions: Optional[List[str]] = None) -> Dict[str, Path]:
+        """Output file per rendition; the first one is written to output_path itself"""
+        output_path = Path(output_path)
+        renditions = renditions or self.DEFAULT_RENDITIONS
+        paths = {renditions[0]: output_path}
+        for name in renditions[1:]:
+            paths[name] = output_path.with_name(f"{output_path.stem}_{name}{output_path.suffix}")
+        return paths
         
     async def create_video(
         self,
         image_paths: List[Path],
         voiceover_path: Path,
         output_path: Union[str, Path],
-        script_duration: int = 60
+        script_duration: int = 60,
+        renditions: Optional[List[str]] = None,
+        subtitles: Optional[str] = None,
+        subtitle_text: Optional[str] = None,
+        preview: bool = False,
+        work_dir: Optional[Path] = None
     ) -> Path:
-        """Create video from images and voiceover"""
+        """Create video from images and voiceover.
+        
+        Each image is shown for an equal share of the voiceover. Scenes are
+        encoded once per rendition into cached clips and stream-copied into
+        the outputs, so a re-render re-encodes only scenes that changed; the
+        first rendition is written to output_path, the others next to it (see
+        rendition_paths). With subtitles set, subtitle_text is cut into cues
+        timed to the voiceover (subtitles.srt next to the video) and muxed as
+        a track or burned into the scene clips. preview renders at half size
+        with the ultrafast preset. work_dir holds the clip cache and concat
+        lists (default: clips/ next to the output).
+        """
         output_path = Path(output_path)
         
         try:
@@ -30,19 +84,26 @@ class VideoService:
             audio_duration = await self._get_audio_duration(voiceover_path)
             logger.info(f"Audio duration: {audio_duration} seconds")
             
-            # Calculate image duration
-            if len(image_paths) > 0:
-                image_duration = audio_duration / len(image_paths)
-            else:
+            if not image_paths:
                 raise Exception("No images provided for video creation")
             
+            subtitles_path = None
+            if subtitles and subtitle_text:
+                if subtitles not in self.SUBTITLE_MODES:
+                    raise ValueError(f"Unknown subtitle mode: {subtitles}")
+                subtitles_path = write_srt(subtitle_text, audio_duration, output_path.parent / "subtitles.srt")
+            
             # Create video with images and audio
             await self._create_video_with_ffmpeg(
                 image_paths=image_paths,
                 voiceover_path=voiceover_path,
                 output_path=output_path,
-                image_duration=image_duration,
-                audio_duration=audio_duration
+                audio_duration=audio_duration,
+                renditions=renditions,
+                subtitles_path=subtitles_path,
+                burn_subtitles=subtitles == "burned",
+                preview=preview,
+                work_dir=work_dir
             )
             
             logger.info(f"Video created successfully: {output_path}")
@@ -55,29 +116,28 @@ class VideoService:
     async def _get_audio_duration(self, audio_path: Path) -> float:
         """Get duration of audio file"""
         try:
+            # Progress stats (time=...) are logged at info level, and the final
+            # one, after a \r rather than a newline, holds the full duration
             cmd = [
-                self.ffmpeg_path, "-i", str(audio_path),
-                "-f", "null", "-",
-                "-hide_banner", "-loglevel", "error"
+                self.ffmpeg_path, "-hide_banner", "-nostdin",
+                "-i", str(audio_path),
+                "-vn", "-f", "null", "-"
             ]
             
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            
-            stdout, stderr = await process.communicate()
+            with trace_span("ffmpeg.audio_duration", "subprocess", bytes=audio_path.stat().st_size) as span:
+                process = await run_process(cmd)
+                stdout, stderr = process.stdout, process.stderr
+                span.set(returncode=process.returncode)
             
             if process.returncode != 0:
                 # Try alternative method with ffprobe
                 return await self._get_duration_with_ffprobe(audio_path)
             
             # Parse duration from stderr
-            stderr_str = stderr.decode('utf-8')
-            for line in stderr_str.split('\n'):
+            stderr_str = stderr.decode('utf-8', errors='replace')
+            for line in reversed(stderr_str.replace('\r', '\n').split('\n')):
                 if 'time=' in line:
-                    time_part = line.split('time=')[1].split(' ')[0]
+                    time_part = line.split('time=')[-1].split(' ')[0]
                     # Parse time format HH:MM:SS.ss
                     time_parts = time_part.split(':')
                     if len(time_parts) == 3:
@@ -86,8 +146,8 @@ class VideoService:
                         seconds = float(time_parts[2])
                         return hours * 3600 + minutes * 60 + seconds
             
-            # Default duration if parsing fails
-            return 60.0
+            # Fall back to ffprobe if parsing fails
+            return await self._get_duration_with_ffprobe(audio_path)
             
         except Exception as e:
             logger.error(f"Error getting audio duration: {str(e)}")
@@ -101,13 +161,10 @@ class VideoService:
                 "-show_format", str(audio_path)
             ]
             
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            
-            stdout, stderr = await process.communicate()
+            with trace_span("ffprobe.audio_duration", "subprocess") as span:
+                process = await run_process(cmd)
+                stdout, stderr = process.stdout, process.stderr
+                span.set(returncode=process.returncode)
             
             if process.returncode == 0:
                 data = json.loads(stdout.decode('utf-8'))
@@ -125,70 +182,299 @@ class VideoService:
         image_paths: List[Path],
         voiceover_path: Path,
         output_path: Path,
-        image_duration: float,
-        audio_duration: float
+        audio_duration: float,
+        renditions: Optional[List[str]] = None,
+        subtitles_path: Optional[Path] = None,
+        burn_subtitles: bool = False,
+        preview: bool = False,
+        work_dir: Optional[Path] = None
     ):
-        """Create video using FFmpeg"""
+        """Encode every scene into a cached clip, then join clips and audio by stream copy.
+        
+        Clips live in work_dir (default clips/ next to the output), named
+        after a hash of the image content, the scene's frame count and the
+        exact filters and encoder settings, so re-rendering after one image or
+        caption changed only encodes that scene again.
+        """
         try:
-            # Create a temporary file list for FFmpeg
-            temp_list_path = output_path.parent / "temp_images.txt"
-            
-            with open(temp_list_path, 'w') as f:
-                for img_path in image_paths:
-                    f.write(f"file '{img_path.absolute()}'\n")
-                    f.write(f"duration {image_duration}\n")
-                # Add last image again for proper ending
-                if image_paths:
-                    f.write(f"file '{image_paths[-1].absolute()}'\n")
-            
-            # FFmpeg command with effects
-            cmd = [
-                self.ffmpeg_path,
-                "-f", "concat",
-                "-safe", "0",
-                "-i", str(temp_list_path),
-                "-i", str(voiceover_path),
+            outputs = self.rendition_paths(output_path, renditions)
+            clips_dir = Path(work_dir) if work_dir is not None else output_path.parent / "clips"
+            clips_dir.mkdir(parents=True, exist_ok=True)
+            burn_path = subtitles_path if burn_subtitles else None
+            
+            frames = self.scene_frames(audio_duration, len(image_paths))
+            digests = await asyncio.gather(*(asyncio.to_thread(self._file_digest, path) for path in image_paths))
+            subtitles_digest = await asyncio.to_thread(self._file_digest, burn_path) if burn_path else None
+            
+            scene_clips: List[Dict[str, Path]] = []
+            encodes = []
+            # Identical scenes share a clip: encode it once, or both encodes would race on its temp file
+            scheduled = set()
+            start_frame = 0
+            for image_path, digest, count in zip(image_paths, digests, frames):
+                clips = {
+                    name: clips_dir / f"{self._clip_key(name, digest, count, start_frame, burn_path, subtitles_digest, preview)}.mp4"
+                    for name in outputs
+                }
+                scene_clips.append(clips)
+                missing = {name: path for name, path in clips.items() if not path.exists() and path not in scheduled}
+                scheduled.update(missing.values())
+                if missing:
+                    encodes.append((image_path, count, start_frame, missing))
+                start_frame += count
+            
+            semaphore = asyncio.Semaphore(self.clip_concurrency)
+            
+            budget = get_memory_budget()
+            
+            async def encode(image_path, count, start, clips):
+                # x264 lookahead and reference frames dominate; each rendition is its own encoder.
+                # The concat pass only copies packets and is not budgeted.
+                async with semaphore, budget.reserve("encode", budget.estimates["encode"] * len(clips)):
+                    await self._encode_scene(image_path, count, start, clips, burn_path, preview)
+            
+            with trace_span("ffmpeg.encode_scenes", "subprocess", scenes=len(image_paths), encoded=len(encodes)):
+                await asyncio.gather(*(encode(*args) for args in encodes))
+            logger.info(f"Encoded {len(encodes)} of {len(image_paths)} scene(s), reused the rest from the clip cache")
+            
+            await self._concat_scenes(scene_clips, outputs, voiceover_path, None if burn_subtitles else subtitles_path)
+            
+            # Drop clips this render no longer uses (replaced images, old settings)
+            keep = {path for clips in scene_clips for path in clips.values()}
+            for path in clips_dir.glob("*.mp4"):
+                if path not in keep:
+                    path.unlink(missing_ok=True)
+        
+        except Exception as e:
+            logger.error(f"Error creating video with FFmpeg: {str(e)}")
+            raise
+    
+    def scene_frames(self, audio_duration: float, count: int) -> List[int]:
+        """Frames per scene, splitting the voiceover evenly without accumulating rounding drift"""
+        total = max(count, round(audio_duration * self.FPS))
+        bounds = [round(i * total / count) for i in range(count + 1)]
+        return [end - start for start, end in zip(bounds, bounds[1:])]
+    
+    @staticmethod
+    def _file_digest(path: Path) -> str:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+    
+    def _clip_key(
+        self,
+        rendition: str,
+        image_digest: str,
+        frames: int,
+        start_frame: int,
+        subtitles_path: Optional[Path] = None,
+        subtitles_digest: Optional[str] = None,
+        preview: bool = False
+    ) -> str:
+        """Identity of one encoded scene: everything that affects its frames or bitstream"""
+        filters = self._get_video_filters(rendition, subtitles_path, frames, start_frame, preview)
+        encoder = self._rendition_spec(rendition, preview)["encoder"]
+        parts = [image_digest, frames, self.FPS, filters, encoder, subtitles_digest]
+        return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()[:32]
+    
+    async def _encode_scene(
+        self,
+        image_path: Path,
+        frames: int,
+        start_frame: int,
+        clips: Dict[str, Path],
+        subtitles_path: Optional[Path] = None,
+        preview: bool = False
+    ):
+        """Encode one still image into a clip per rendition; renditions share the decode"""
+        cmd = [
+            self.ffmpeg_path, "-hide_banner", "-nostdin",
+            "-i", str(image_path),
+            "-filter_complex", self._get_filter_graph(list(clips), subtitles_path, frames, start_frame, preview),
+            "-y"
+        ]
+        # Temp names until complete, so an interrupted encode never looks like a cached clip
+        temp_paths = {name: path.with_name(f".{path.name}.tmp") for name, path in clips.items()}
+        for index, name in enumerate(clips):
+            cmd += [
+                "-map", f"[v{index}]",
                 "-c:v", "libx264",
+                *self._rendition_spec(name, preview)["encoder"],
                 "-pix_fmt", "yuv420p",
-                "-c:a", "aac",
-                "-b:a", "128k",
-                "-vf", self._get_video_filters(),
-                "-shortest",
-                "-y",
-                str(output_path)
+                "-frames:v", str(frames),
+                "-an", "-f", "mp4",
+                str(temp_paths[name])
             ]
+        
+        try:
+            with trace_span("ffmpeg.encode_scene", "subprocess", image=image_path.name, frames=frames,
+                            renditions=len(clips)) as span:
+                process = await run_process(cmd)
+                span.set(returncode=process.returncode)
             
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            
-            stdout, stderr = await process.communicate()
+            if process.returncode != 0:
+                stderr_str = process.stderr.decode('utf-8', errors='replace')
+                logger.error(f"FFmpeg error: {stderr_str}")
+                raise Exception(f"FFmpeg failed on {image_path.name}: {stderr_str}")
+            for name, path in clips.items():
+                os.replace(temp_paths[name], path)
+        finally:
+            for temp_path in temp_paths.values():
+                temp_path.unlink(missing_ok=True)
+    
+    async def _concat_scenes(
+        self,
+        scene_clips: List[Dict[str, Path]],
+        outputs: Dict[str, Path],
+        voiceover_path: Path,
+        soft_subtitles_path: Optional[Path] = None
+    ):
+        """Join each rendition's scene clips and add the voiceover; video is copied, not re-encoded"""
+        cmd = [self.ffmpeg_path, "-hide_banner", "-nostdin"]
+        list_paths = []
+        for name, path in outputs.items():
+            list_path = scene_clips[0][name].parent / f"concat_{name}.txt"
+            with open(list_path, 'w') as f:
+                for clips in scene_clips:
+                    f.write(f"file '{clips[name].absolute()}'\n")
+            list_paths.append(list_path)
+            cmd += ["-f", "concat", "-safe", "0", "-i", str(list_path)]
+        audio_input = len(outputs)
+        cmd += ["-i", str(voiceover_path)]
+        if soft_subtitles_path is not None:
+            cmd += ["-i", str(soft_subtitles_path)]
+        cmd += ["-y"]
+        
+        # Finished files are renamed into place, so the previous render stays
+        # downloadable while this one is written
+        temp_paths = {name: path.with_name(f".{path.name}.tmp") for name, path in outputs.items()}
+        audio_args = await self._audio_args(voiceover_path)
+        for index, name in enumerate(outputs):
+            cmd += [
+                "-map", f"{index}:v",
+                "-map", f"{audio_input}:a",
+                "-c:v", "copy",
+                *audio_args
+            ]
+            if soft_subtitles_path is not None:
+                cmd += ["-map", f"{audio_input + 1}:s", "-c:s", "mov_text", "-metadata:s:s:0", "language=eng"]
+            cmd += ["-shortest", "-f", "mp4", str(temp_paths[name])]
+        
+        try:
+            with trace_span("ffmpeg.concat", "subprocess", scenes=len(scene_clips), renditions=len(outputs),
+                        audio=audio_args[audio_args.index("-c:a") + 1]) as span:
+                process = await run_process(cmd)
+                span.set(returncode=process.returncode)
+                if process.returncode == 0:
+                    span.set(bytes=sum(path.stat().st_size for path in temp_paths.values()))
             
             if process.returncode != 0:
-                stderr_str = stderr.decode('utf-8')
+                stderr_str = process.stderr.decode('utf-8', errors='replace')
                 logger.error(f"FFmpeg error: {stderr_str}")
                 raise Exception(f"FFmpeg failed: {stderr_str}")
-            
-            # Clean up temp file
-            if temp_list_path.exists():
-                temp_list_path.unlink()
-            
+            for name, path in outputs.items():
+                os.replace(temp_paths[name], path)
+        finally:
+            for path in list_paths + list(temp_paths.values()):
+                path.unlink(missing_ok=True)
+    
+    async def _audio_args(self, voiceover_path: Path) -> List[str]:
+        """Output options for the voiceover: a stream copy unless it needs normalizing or converting"""
+        if self.loudnorm:
+            # Single-pass loudnorm works at 192 kHz internally; resample for AAC
+            return [
+                "-af", f"loudnorm=I={self.loudnorm_target}:TP=-1.5:LRA=11",
+                "-ar", "44100",
+                "-c:a", "aac",
+                "-b:a", "128k"
+            ]
+        if self.audio_copy and await self._audio_codec(voiceover_path) is not None:
+            return ["-c:a", "copy"]
+        return ["-c:a", "aac", "-b:a", "128k"]
+    
+    # Audio codecs an MP4 carries unchanged and every player decodes
+    COPYABLE_AUDIO = ("aac", "mp3")
+    
+    async def _audio_codec(self, path: Path) -> Optional[str]:
+        """The file's audio codec if it is one of COPYABLE_AUDIO, as ffprobe reports it.
+        
+        The container says nothing reliable: an M4A may hold ALAC or Opus, and
+        copying those as if they were AAC breaks the mux.
+        """
+        cmd = [
+            "ffprobe", "-v", "error", "-select_streams", "a:0",
+            "-show_entries", "stream=codec_name", "-print_format", "json", str(path)
+        ]
+        try:
+            with trace_span("ffprobe.audio_codec", "subprocess") as span:
+                process = await run_process(cmd)
+                span.set(returncode=process.returncode)
+            if process.returncode != 0:
+                return None
+            streams = json.loads(process.stdout.decode('utf-8')).get("streams") or []
         except Exception as e:
-            logger.error(f"Error creating video with FFmpeg: {str(e)}")
-            raise
+            logger.error(f"Error probing audio codec: {str(e)}")
+            return None
+        codec = streams[0].get("codec_name") if streams else None
+        return codec if codec in self.COPYABLE_AUDIO else None
+    
+    def _get_filter_graph(
+        self,
+        renditions: List[str],
+        subtitles_path: Optional[Path] = None,
+        frames: int = 125,
+        start_frame: int = 0,
+        preview: bool = False
+    ) -> str:
+        """filter_complex with one labelled video output [v0], [v1], ... per rendition"""
+        if len(renditions) == 1:
+            return f"[0:v]{self._get_video_filters(renditions[0], subtitles_path, frames, start_frame, preview)}[v0]"
+        branches = "".join(f"[s{i}]" for i in range(len(renditions)))
+        graph = [f"[0:v]split={len(renditions)}{branches}"]
+        for i, name in enumerate(renditions):
+            graph.append(f"[s{i}]{self._get_video_filters(name, subtitles_path, frames, start_frame, preview)}[v{i}]")
+        return ";".join(graph)
+    
+    def _rendition_spec(self, rendition: str, preview: bool = False) -> Dict[str, Any]:
+        spec = self.RENDITIONS[rendition]
+        if not preview:
+            return spec
+        return {
+            **spec,
+            "crop": tuple(side // 2 for side in spec["crop"]),
+            "size": tuple(side // 2 for side in spec["size"]),
+            "encoder": self.PREVIEW_ENCODER
+        }
     
-    def _get_video_filters(self) -> str:
+    @staticmethod
+    def _escape_filter_value(value: str) -> str:
+        """Escape an option value for both the option parser and the filtergraph parser"""
+        for special in ("\\':", "\\'[],;"):
+            value = "".join(f"\\{c}" if c in special else c for c in value)
+        return value
+    
+    def _get_video_filters(
+        self,
+        rendition: str = "landscape",
+        subtitles_path: Optional[Path] = None,
+        frames: int = 125,
+        start_frame: int = 0,
+        preview: bool = False
+    ) -> str:
         """Get video filters for effects"""
+        spec = self._rendition_spec(rendition, preview)
+        crop_width, crop_height = spec["crop"]
+        width, height = spec["size"]
         filters = []
         
         # Scale and crop to ensure consistent size
-        filters.append("scale=1920:1080:force_original_aspect_ratio=increase")
-        filters.append("crop=1920:1080")
+        filters.append(f"scale={crop_width}:{crop_height}:force_original_aspect_ratio=increase")
+        filters.append(f"crop={crop_width}:{crop_height}")
         
         # Add subtle zoom effect
-        filters.append("zoompan=z='min(zoom+0.0005,1.1)':d=125:x='iw/2-(iw/zoom/2)':y='ih/2-(ih/zoom/2)'")
+        filters.append(f"zoompan=z='min(zoom+0.0005,1.1)':d={frames}:x='iw/2-(iw/zoom/2)':y='ih/2-(ih/zoom/2)':s={width}x{height}:fps={self.FPS}")
         
         # Add scanlines effect
         filters.append("format=yuv420p")
@@ -196,45 +482,51 @@ class VideoService:
         # Add slight color correction for cinematic look
         filters.append("eq=contrast=1.1:brightness=0.02:saturation=1.1")
         
+        # Burn captions into the frames at output resolution
+        # (the clip is shifted to its place in the video so the right cues show)
+        if subtitles_path is not None:
+            filters.append(f"setpts=PTS+{start_frame / self.FPS}/TB")
+            filters.append(f"subtitles=filename={self._escape_filter_value(str(subtitles_path))}")
+            filters.append("setpts=PTS-STARTPTS")
+        
         return ",".join(filters)
     
     async def add_subtitles(self, video_path: Path, subtitle_text: str, output_path: Path) -> Path:
-        """Add subtitles to video"""
+        """Mux subtitle_text as a soft track with cues timed to the video's audio.
+        
+        Audio and video are stream-copied, so this costs no re-encode; new
+        renders should pass subtitles to create_video instead.
+        """
         try:
-            # Create temporary subtitle file
-            srt_path = video_path.parent / "temp_subtitles.srt"
-            
-            # Simple SRT format
-            with open(srt_path, 'w') as f:
-                f.write("1\n")
-                f.write("00:00:00,000 --> 00:01:20,000\n")
-                f.write(f"{subtitle_text}\n")
+            video_path = Path(video_path)
+            output_path = Path(output_path)
+            output_path.parent.mkdir(parents=True, exist_ok=True)
+            duration = await self._get_audio_duration(video_path)
+            srt_path = write_srt(subtitle_text, duration, output_path.with_suffix(".srt"))
             
             cmd = [
                 self.ffmpeg_path,
                 "-i", str(video_path),
-                "-vf", f"subtitles={srt_path}",
-                "-c:a", "copy",
+                "-i", str(srt_path),
+                "-map", "0:v",
+                "-map", "0:a?",
+                "-map", "1:s",
+                "-c", "copy",
+                "-c:s", "mov_text",
+                "-metadata:s:s:0", "language=eng",
                 "-y",
                 str(output_path)
             ]
             
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            
-            stdout, stderr = await process.communicate()
+            with trace_span("ffmpeg.subtitles", "subprocess") as span:
+                process = await run_process(cmd)
+                stdout, stderr = process.stdout, process.stderr
+                span.set(returncode=process.returncode)
             
             if process.returncode != 0:
                 stderr_str = stderr.decode('utf-8')
                 raise Exception(f"FFmpeg subtitle error: {stderr_str}")
             
-            # Clean up temp file
-            if srt_path.exists():
-                srt_path.unlink()
-            
             return output_path
             
         except Exception as e:
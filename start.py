@@ -9,15 +9,11 @@ import uvicorn
 from pathlib import Path
 import logging
 
-# Configure logging for production
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler('app.log', mode='a')
-    ]
-)
+from utils.logging_setup import configure_logging
+
+# Configure logging for production: records are written by a background
+# thread, so a slow disk never stalls the event loop
+configure_logging(log_file='app.log')
 
 logger = logging.getLogger(__name__)
 
@@ -48,7 +44,7 @@ def main():
     
     try:
         # Import the app after environment setup
-        from main import app
+        from main import app, FORWARDED_ALLOW_IPS
         
         # Run the server
         uvicorn.run(
@@ -57,7 +53,10 @@ def main():
             port=port,
             log_level="info",
             access_log=True,
-            loop="asyncio"
+            log_config=None,  # uvicorn's loggers propagate to our queue handler
+            loop="asyncio",
+            proxy_headers=True,
+            forwarded_allow_ips=FORWARDED_ALLOW_IPS
         )
     except Exception as e:
         logger.error(f"Failed to start server: {e}")
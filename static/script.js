@@ -31,6 +31,13 @@ class VideoGenerator {
         document.getElementById('retryBtn').addEventListener('click', () => {
             this.startGeneration();
         });
+
+        // Stop a generation nobody will see once the page is closed
+        window.addEventListener('pagehide', () => {
+            if (this.pollInterval && this.currentSessionId) {
+                fetch(`/generate/${this.currentSessionId}`, { method: 'DELETE', keepalive: true });
+            }
+        });
     }
 
     async startGeneration() {
@@ -119,7 +126,7 @@ class VideoGenerator {
                 if (status.status === 'completed') {
                     this.stopPolling();
                     this.showResults();
-                } else if (status.status === 'error') {
+                } else if (status.status === 'error' || status.status === 'cancelled') {
                     this.stopPolling();
                     this.showError(status.message);
                 }
@@ -199,9 +206,18 @@ class VideoGenerator {
         generateBtn.disabled = false;
         generateBtn.innerHTML = '<i class="fas fa-play me-2"></i>Generate Video';
 
-        // Set video source for preview
+        // Set video source for preview; the versioned URL from /assets can be cached by the browser
         const videoPlayer = document.getElementById('videoPlayer');
-        videoPlayer.src = `/download/${this.currentSessionId}`;
+        let videoUrl = `/download/${this.currentSessionId}`;
+        try {
+            const response = await fetch(`/assets/${this.currentSessionId}?thumbnails=false`);
+            if (response.ok) {
+                videoUrl = (await response.json()).video || videoUrl;
+            }
+        } catch (error) {
+            console.error('Error fetching assets:', error);
+        }
+        videoPlayer.src = videoUrl;
     }
 
     async downloadVideo() {
@@ -273,9 +289,9 @@ class VideoGenerator {
             assets.images.forEach((imageUrl, index) => {
                 html += `
                     <div class="col-md-4 mb-3">
-                        <img src="${imageUrl}" class="img-fluid rounded" alt="Generated image ${index + 1}">
+                        <img src="${imageUrl}" class="img-fluid rounded" loading="lazy" alt="Generated image ${index + 1}">
                         <div class="text-center mt-2">
-                            <a href="${imageUrl}" class="btn btn-sm btn-outline-primary" download>
+                            <a href="${(assets.image_downloads || [])[index] || imageUrl}" class="btn btn-sm btn-outline-primary" download>
                                 <i class="fas fa-download me-1"></i>Download
                             </a>
                         </div>
@@ -313,6 +329,22 @@ class VideoGenerator {
                     <a href="${assets.video}" class="btn btn-success">
                         <i class="fas fa-download me-1"></i>Download Video
                     </a>
+                    ${Object.entries(assets.renditions || {}).map(([name, url]) => `
+                        <a href="${url}" class="btn btn-outline-success ms-2">
+                            <i class="fas fa-download me-1"></i>${name}
+                        </a>
+                    `).join('')}
+                </div>
+            `;
+        }
+
+        // Everything at once
+        if (assets.export) {
+            html += `
+                <div class="asset-item">
+                    <a href="${assets.export}" class="btn btn-primary" download>
+                        <i class="fas fa-file-archive me-1"></i>Download All (ZIP)
+                    </a>
                 </div>
             `;
         }
@@ -0,0 +1,56 @@
+import threading
+import time
+
+from utils.blob_store import BlobStore
+
+
+def wait_for_eviction(store, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while any(thread.name == "blob-evict" for thread in threading.enumerate()):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_link_hits_what_put_stored(tmp_path):
+    store = BlobStore(tmp_path / "blobs", max_bytes=1 << 20)
+    source = tmp_path / "a" / "image.png"
+    source.parent.mkdir()
+    source.write_bytes(b"image")
+    key = store.key("image", prompt="a cat")
+    store.put(key, source)
+    wait_for_eviction(store)
+
+    linked = store.link(key, tmp_path / "b" / "image.png")
+    assert linked.read_bytes() == b"image"
+    assert store.link(store.key("image", prompt="a dog"), tmp_path / "c.png") is None
+
+
+def test_eviction_runs_off_the_calling_thread(tmp_path, monkeypatch):
+    store = BlobStore(tmp_path / "blobs", max_bytes=10)
+    evicted_on = []
+    release = threading.Event()
+    evict = store.evict
+
+    def slow_evict():
+        evicted_on.append(threading.current_thread().name)
+        release.wait(5)
+        return evict()
+
+    monkeypatch.setattr(store, "evict", slow_evict)
+    old = tmp_path / "old.png"
+    old.write_bytes(b"x" * 8)
+    store.put(store.key("image", prompt="old"), old)
+    # put() returned while eviction is still blocked
+    assert not release.is_set()
+    old.unlink()
+    release.set()
+    wait_for_eviction(store)
+    assert evicted_on == ["blob-evict"]
+
+    new = tmp_path / "new.png"
+    new.write_bytes(b"y" * 8)
+    store.put(store.key("image", prompt="new"), new)
+    wait_for_eviction(store)
+    # The unreferenced old blob went; the new one is still linked from its session
+    assert store.link(store.key("image", prompt="old"), tmp_path / "again.png") is None
+    assert store.blob_path(store.key("image", prompt="new")).exists()
@@ -0,0 +1,67 @@
+import asyncio
+
+from utils.checkpoint import SessionCheckpoint
+
+SCRIPT = {
+    "script": "Narration.",
+    "image_prompts": [f"prompt {i}" for i in range(6)],
+    "text_overlays": [f"caption {i}" for i in range(6)]
+}
+
+
+def _preview(tmp_path):
+    checkpoint = SessionCheckpoint.create(tmp_path, "session", "topic", {"quality": "preview"})
+    checkpoint.record_script(dict(SCRIPT))
+    return checkpoint
+
+
+def test_generated_preview_images_are_redone_at_final_quality(tmp_path):
+    checkpoint = _preview(tmp_path)
+    image = tmp_path / "image_01.png"
+    image.write_bytes(b"preview render")
+    checkpoint.record_image(0, image)
+
+    checkpoint.update_options(quality="final")
+    assert checkpoint.image_path(0) is None
+    assert 0 in checkpoint.missing_images()
+
+
+def test_uploaded_image_survives_finalize(tmp_path):
+    checkpoint = _preview(tmp_path)
+    image = tmp_path / "image_04.png"
+    image.write_bytes(b"the user's own picture")
+    checkpoint.record_image(3, image, uploaded=True)
+
+    checkpoint.update_options(quality="final")
+    reloaded = SessionCheckpoint.load(tmp_path)
+    assert reloaded.image_path(3) == image
+    assert 3 not in reloaded.missing_images()
+    assert image.read_bytes() == b"the user's own picture"
+
+
+def test_uploaded_image_is_replaced_when_its_prompt_changes(tmp_path):
+    checkpoint = _preview(tmp_path)
+    image = tmp_path / "image_04.png"
+    image.write_bytes(b"the user's own picture")
+    checkpoint.record_image(3, image, uploaded=True)
+
+    script = checkpoint.script
+    script["image_prompts"][3] = "something else"
+    checkpoint.record_script(script)
+    assert checkpoint.image_path(3) is None
+
+
+def test_deferred_changes_are_written_on_flush(tmp_path):
+    checkpoint = SessionCheckpoint.create(tmp_path, "session", "topic")
+    checkpoint.defer_saves()
+    checkpoint.record_script(dict(SCRIPT))
+    image = tmp_path / "image_01.png"
+    image.write_bytes(b"image")
+    checkpoint.record_image(0, image)
+    assert SessionCheckpoint.load(tmp_path).script is None
+
+    asyncio.run(checkpoint.flush())
+    reloaded = SessionCheckpoint.load(tmp_path)
+    assert reloaded.script == SCRIPT
+    assert reloaded.image_path(0) == image
+    assert [path.name for path in tmp_path.iterdir() if path.name.endswith(".tmp")] == []
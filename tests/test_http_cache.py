@@ -0,0 +1,88 @@
+import re
+
+import pytest
+from starlette.applications import Starlette
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from utils.http_cache import DownloadResponse, parse_byte_ranges
+
+DATA = bytes(range(256)) * 40
+
+
+@pytest.fixture
+def client(tmp_path):
+    path = tmp_path / "video.mp4"
+    path.write_bytes(DATA)
+
+    async def download(request):
+        return DownloadResponse(path, media_type="video/mp4", stat_result=path.stat())
+
+    return TestClient(Starlette(routes=[Route("/video.mp4", download, methods=["GET", "HEAD"])]))
+
+
+def parse_multipart(response):
+    match = re.fullmatch(r"multipart/byteranges; boundary=(\w+)", response.headers["content-type"])
+    assert match, response.headers["content-type"]
+    boundary = match.group(1).encode()
+    body = response.content
+    assert len(body) == int(response.headers["content-length"])
+    assert body.endswith(b"--" + boundary + b"--\r\n")
+    parts = []
+    for chunk in body.split(b"--" + boundary)[1:-1]:
+        head, _, content = chunk.removeprefix(b"\r\n").partition(b"\r\n\r\n")
+        assert content.endswith(b"\r\n")
+        headers = dict(line.split(": ", 1) for line in head.decode("latin-1").split("\r\n"))
+        parts.append((headers, content[:-2]))
+    return parts
+
+
+def test_parse_byte_ranges():
+    assert parse_byte_ranges("bytes=0-9", 100) == [(0, 10)]
+    assert parse_byte_ranges("bytes=90-", 100) == [(90, 100)]
+    assert parse_byte_ranges("bytes=-10", 100) == [(90, 100)]
+    assert parse_byte_ranges("bytes=50-200", 100) == [(50, 100)]
+    # Sorted, with overlapping and adjacent ranges merged
+    assert parse_byte_ranges("bytes=20-30, 0-10, 5-25, 40-49, 50-59", 100) == [(0, 31), (40, 60)]
+    assert parse_byte_ranges("bytes=100-, -0", 100) is None
+    assert parse_byte_ranges("bytes=10-5", 100) is None
+    assert parse_byte_ranges("items=0-9", 100) is None
+    assert parse_byte_ranges("bytes=x-9", 100) is None
+
+
+def test_multiple_ranges_are_a_multipart_body(client):
+    size = len(DATA)
+    response = client.get("/video.mp4", headers={"Range": "bytes=0-9,100-109,-10"})
+    assert response.status_code == 206
+    assert "content-range" not in response.headers
+    parts = parse_multipart(response)
+    assert [headers["Content-Range"] for headers, _ in parts] == [
+        f"bytes 0-9/{size}", f"bytes 100-109/{size}", f"bytes {size - 10}-{size - 1}/{size}"
+    ]
+    assert all(headers["Content-Type"] == "video/mp4" for headers, _ in parts)
+    assert [content for _, content in parts] == [DATA[0:10], DATA[100:110], DATA[-10:]]
+
+
+def test_head_of_multiple_ranges_has_the_length_of_the_body(client):
+    get = client.get("/video.mp4", headers={"Range": "bytes=0-9,100-109"})
+    head = client.head("/video.mp4", headers={"Range": "bytes=0-9,100-109"})
+    assert head.status_code == 206 and head.content == b""
+    assert head.headers["content-length"] == get.headers["content-length"]
+
+
+def test_single_range(client):
+    response = client.get("/video.mp4", headers={"Range": "bytes=1000-1999"})
+    assert response.status_code == 206
+    assert response.headers["content-range"] == f"bytes 1000-1999/{len(DATA)}"
+    assert response.content == DATA[1000:2000]
+
+
+def test_stale_if_range_gets_the_whole_file(client):
+    response = client.get("/video.mp4", headers={"Range": "bytes=0-9,100-109", "If-Range": '"stale"'})
+    assert response.status_code == 200
+    assert response.content == DATA
+
+
+def test_unusable_ranges_are_left_to_starlette(client):
+    assert client.get("/video.mp4", headers={"Range": f"bytes={len(DATA)}-"}).status_code == 416
+    assert client.get("/video.mp4", headers={"Range": "bytes=9-0"}).status_code == 400
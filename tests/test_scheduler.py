@@ -0,0 +1,43 @@
+import asyncio
+
+import pytest
+
+from utils.scheduler import FairScheduler, QuotaExceeded, SchedulingPolicy, client_identity
+
+
+def test_only_listed_keys_identify_a_client():
+    keys = {"known"}
+    assert client_identity("known", "203.0.113.9", keys).startswith("key:")
+    assert client_identity("made-up", "203.0.113.9", keys) == "ip:203.0.113.9"
+    assert client_identity(None, "203.0.113.9", keys) == "ip:203.0.113.9"
+
+
+def test_rotating_keys_do_not_bypass_client_max_queued():
+    async def flood():
+        scheduler = FairScheduler(1, SchedulingPolicy(client_max_running=1, client_max_queued=2))
+        accepted = rejected = 0
+        for index in range(10):
+            client = client_identity(f"random-{index}", "203.0.113.9", {"known"})
+            try:
+                scheduler.submit(f"job-{index}", client, "bulk")
+                accepted += 1
+            except QuotaExceeded:
+                rejected += 1
+        return accepted, rejected, scheduler.client_stats("ip:203.0.113.9")
+
+    accepted, rejected, stats = asyncio.run(flood())
+    # One running plus client_max_queued waiting, however many keys were tried
+    assert (accepted, rejected) == (3, 7)
+    assert stats["waiting"] == 2 and stats["rejected"] == 7
+
+
+def test_listed_keys_get_quotas_of_their_own():
+    async def submit_all():
+        scheduler = FairScheduler(1, SchedulingPolicy(client_max_running=1, client_max_queued=1))
+        keys = {"alice", "bob"}
+        for index, key in enumerate(["alice", "alice", "bob"]):
+            scheduler.submit(f"job-{index}", client_identity(key, "203.0.113.9", keys), "bulk")
+        with pytest.raises(QuotaExceeded):
+            scheduler.submit("job-3", client_identity("alice", "203.0.113.9", keys), "bulk")
+
+    asyncio.run(submit_all())
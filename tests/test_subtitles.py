@@ -0,0 +1,43 @@
+import pytest
+
+from utils.subtitles import MIN_CUE_SECONDS, build_cues, format_srt
+
+
+def assert_contiguous(cues, duration):
+    assert cues[0].start == 0.0
+    assert cues[-1].end == duration
+    for previous, cue in zip(cues, cues[1:]):
+        assert cue.start == pytest.approx(previous.end)
+        assert cue.end > cue.start
+
+
+def test_cues_follow_sentence_length():
+    script = "Short one. " + "This sentence is quite a bit longer than the first one."
+    cues = build_cues(script, 10.0)
+    assert [cue.text for cue in cues] == ["Short one.", "This sentence is quite a bit longer than\nthe first one."]
+    assert_contiguous(cues, 10.0)
+    assert cues[1].end - cues[1].start > cues[0].end - cues[0].start
+
+
+def test_padding_short_cues_keeps_the_trailing_ones():
+    script = "A long opening sentence that takes most of the narration time to read out. " + "Go. " * 5 + "End."
+    cues = build_cues(script, 8.0)
+    assert len(cues) == 7
+    assert cues[-1].text == "End."
+    assert_contiguous(cues, 8.0)
+    assert all(cue.end - cue.start >= MIN_CUE_SECONDS - 1e-9 for cue in cues)
+
+
+def test_many_short_sentences_over_a_short_duration_all_get_a_cue():
+    script = " ".join(f"Line {i}." for i in range(20))
+    cues = build_cues(script, 5.0)
+    # 20 cues cannot each get MIN_CUE_SECONDS in 5 seconds: they share it instead
+    assert [cue.text for cue in cues] == [f"Line {i}." for i in range(20)]
+    assert_contiguous(cues, 5.0)
+    assert all(cue.end - cue.start == pytest.approx(0.25) for cue in cues)
+    assert format_srt(cues).count(" --> ") == 20
+
+
+def test_nothing_to_show():
+    assert build_cues("", 10.0) == []
+    assert build_cues("Hello.", 0) == []
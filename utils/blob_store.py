@@ -0,0 +1,176 @@
+import os
+import json
+import errno
+import shutil
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Any, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# Filesystems that cannot hardlink there (or cross-device stores) get copies
+_NO_HARDLINK = (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP)
+
+
+class BlobStore:
+    """Content-addressed cache of paid generation results (images, voiceovers).
+
+    Blobs live at <root>/<key[:2]>/<key>, where the key hashes whatever
+    determines the output (model, prompt, size / provider, voice, text).
+    Sessions hardlink their files to the blobs, so the store keeps one copy on
+    disk however many sessions use it, and a blob's reference count is simply
+    its link count minus one. Only blobs no session links to any more are
+    evicted, least recently referenced first, once the store outgrows
+    max_bytes; eviction walks the whole store, so put() leaves it to a
+    background thread. Falls back to plain copies where hardlinks are not
+    supported. Blocking: call link() and put() from a thread.
+    """
+
+    def __init__(self, root: Union[str, Path], max_bytes: int, enabled: bool = True):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._bytes: Optional[int] = None
+        self._lock = threading.Lock()
+        self._evicting = False
+
+    @staticmethod
+    def key(kind: str, **fields: Any) -> str:
+        return hashlib.sha256(json.dumps([kind, fields], sort_keys=True).encode("utf-8")).hexdigest()
+
+    def blob_path(self, key: str) -> Path:
+        return self.root / key[:2] / key
+
+    def link(self, key: str, dest: Union[str, Path]) -> Optional[Path]:
+        """Point dest at the cached blob; None on a miss"""
+        if not self.enabled:
+            return None
+        dest = Path(dest)
+        blob = self.blob_path(key)
+        try:
+            self._place(blob, dest)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        logger.info(f"Blob cache hit for {dest.name} ({key[:12]})")
+        return dest
+
+    def put(self, key: str, source: Union[str, Path], replace: bool = False) -> Path:
+        """Adopt a freshly generated file as the blob for key.
+
+        If another session stored the same key first, source is swapped for a
+        link to that blob so the duplicate bytes are freed, unless replace is
+        set: then source becomes the blob (a deliberate regeneration), and
+        sessions linked to the old one keep their file.
+        """
+        source = Path(source)
+        if not self.enabled:
+            return source
+        blob = self.blob_path(key)
+        try:
+            blob.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                if replace and blob.exists():
+                    self._place(source, blob)
+                else:
+                    os.link(source, blob)
+            except FileExistsError:
+                self._place(blob, source)
+                return source
+            except OSError as e:
+                if e.errno not in _NO_HARDLINK:
+                    raise
+                tmp_path = blob.with_name(f".{blob.name}.{os.getpid()}.tmp")
+                shutil.copyfile(source, tmp_path)
+                os.replace(tmp_path, blob)
+            size = blob.stat().st_size
+        except OSError as e:
+            # The cache is an optimization; the session keeps its own file either way
+            logger.warning(f"Could not store {source.name} in the blob store: {str(e)}")
+            return source
+
+        with self._lock:
+            if self._bytes is not None:
+                self._bytes += size
+            over_budget = self._bytes is None or self._bytes > self.max_bytes
+            start_eviction = over_budget and not self._evicting
+            if start_eviction:
+                self._evicting = True
+        if start_eviction:
+            threading.Thread(target=self._evict_in_background, name="blob-evict", daemon=True).start()
+        return source
+
+    def _evict_in_background(self):
+        try:
+            self.evict()
+        except Exception as e:
+            logger.error(f"Blob store eviction failed: {str(e)}")
+        finally:
+            with self._lock:
+                self._evicting = False
+
+    def _place(self, blob: Path, dest: Path):
+        # Link under a temp name and rename over dest, so a file being replaced
+        # is never truncated in place (it may itself be linked to another blob)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = dest.with_name(f".{dest.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            os.link(blob, tmp_path)
+        except OSError as e:
+            if e.errno not in _NO_HARDLINK:
+                raise
+            shutil.copyfile(blob, tmp_path)
+        os.replace(tmp_path, dest)
+
+    def evict(self) -> int:
+        """Delete unreferenced blobs, least recently referenced first, until under max_bytes"""
+        blobs = []
+        total = 0
+        for blob in self.root.glob("??/*"):
+            try:
+                stat = blob.stat()
+            except FileNotFoundError:
+                continue
+            total += stat.st_size
+            # Linking or unlinking a session file updates the shared inode's ctime
+            if stat.st_nlink <= 1 and not blob.name.startswith("."):
+                blobs.append((stat.st_ctime, stat.st_size, blob))
+
+        removed = 0
+        for _, size, blob in sorted(blobs):
+            if total <= self.max_bytes:
+                break
+            try:
+                blob.unlink()
+            except FileNotFoundError:
+                continue
+            total -= size
+            removed += 1
+        if removed:
+            logger.info(f"Evicted {removed} unreferenced blob(s); store now {total} bytes")
+        with self._lock:
+            self._bytes = total
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        return {"enabled": self.enabled, "hits": self.hits, "misses": self.misses, "bytes": self._bytes}
+
+
+_blob_store: Optional[BlobStore] = None
+
+
+def get_blob_store() -> BlobStore:
+    """Process-wide store at BLOB_STORE_DIR; unreferenced blobs are evicted beyond BLOB_STORE_MAX_MB"""
+    global _blob_store
+    if _blob_store is None:
+        _blob_store = BlobStore(
+            os.environ.get("BLOB_STORE_DIR", "generated/blobs"),
+            max_bytes=int(float(os.environ.get("BLOB_STORE_MAX_MB", "2048")) * 1024 * 1024),
+            enabled=os.environ.get("BLOB_CACHE", "true").lower() in ("1", "true", "yes")
+        )
+    return _blob_store
@@ -0,0 +1,318 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Union
+
+from utils.http_cache import file_digest, stat_signature
+
+logger = logging.getLogger(__name__)
+
+
+class SessionCheckpoint:
+    """Durable record of the pipeline stages a session has completed.
+
+    Stored as checkpoint.json in the session directory and rewritten
+    atomically after every completed piece, so a restarted process (or a
+    retry after a failed encode) only redoes what is missing. The pipeline
+    defers those writes instead and flushes them from a thread at each stage
+    boundary, so a slow volume never stalls the event loop. File entries are
+    stored relative to the session directory (absolute when in the scratch
+    tier) and only count as done while the file still exists and was
+    produced for the current quality tier (a preview's cheap images and
+    voice are redone when it is finalized; images a user uploaded belong to
+    no tier and are kept).
+    """
+
+    FILENAME = "checkpoint.json"
+    # A preview renders every PREVIEW_STRIDE-th scene
+    PREVIEW_STRIDE = 3
+
+    def __init__(self, session_dir: Union[str, Path], data: Dict[str, Any]):
+        self.session_dir = Path(session_dir)
+        self.data = data
+        self._deferred = False
+        self._dirty = False
+        self._flush_lock = asyncio.Lock()
+
+    @classmethod
+    def create(
+        cls,
+        session_dir: Union[str, Path],
+        session_id: str,
+        topic: str,
+        options: Optional[Dict[str, Any]] = None
+    ) -> "SessionCheckpoint":
+        """New checkpoint; options are the per-request settings a resume must reuse"""
+        checkpoint = cls(session_dir, {
+            "session_id": session_id,
+            "topic": topic,
+            "options": options or {},
+            "created_at": time.time(),
+            "script": None,
+            "images": {},
+            "failed_images": {},
+            "overlays": {},
+            "voiceover": None,
+            "video": None
+        })
+        checkpoint.save()
+        return checkpoint
+
+    @classmethod
+    def load(cls, session_dir: Union[str, Path]) -> Optional["SessionCheckpoint"]:
+        path = Path(session_dir) / cls.FILENAME
+        if not path.exists():
+            return None
+        try:
+            with open(path) as f:
+                return cls(session_dir, json.load(f))
+        except (OSError, ValueError) as e:
+            logger.error(f"Unreadable checkpoint {path}: {str(e)}")
+            return None
+
+    def save(self):
+        """Write checkpoint.json now (blocking)"""
+        self._dirty = False
+        self.data["updated_at"] = time.time()
+        self._write(json.dumps(self.data, indent=2))
+
+    def _write(self, text: str):
+        # Via a temp file so a crash never leaves it half written; the name is
+        # per thread, so concurrent writers never share one
+        path = self.session_dir / self.FILENAME
+        tmp_path = path.with_name(f".{self.FILENAME}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, 'w') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _changed(self):
+        if self._deferred:
+            self._dirty = True
+        else:
+            self.save()
+
+    def defer_saves(self):
+        """Keep changes in memory until the next flush() instead of writing each one"""
+        self._deferred = True
+
+    async def flush(self):
+        """Write the changes made since the last write, from a thread"""
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            # Serialized here, so the loop never mutates data while the thread reads it
+            self.data["updated_at"] = time.time()
+            try:
+                await asyncio.to_thread(self._write, json.dumps(self.data, indent=2))
+            except BaseException:
+                self._dirty = True
+                raise
+
+    def _existing(self, entry: Optional[Dict[str, Any]]) -> Optional[Path]:
+        if not entry:
+            return None
+        path = self.session_dir / entry["file"]
+        return path if path.exists() else None
+
+    def _relative(self, path: Path) -> str:
+        # Intermediates in the scratch tier live outside the session directory and are stored absolute
+        path = Path(path)
+        if not path.is_relative_to(self.session_dir):
+            return str(path.absolute())
+        return str(path.relative_to(self.session_dir))
+
+    @property
+    def topic(self) -> str:
+        return self.data["topic"]
+
+    @property
+    def options(self) -> Dict[str, Any]:
+        return self.data.get("options", {})
+
+    def update_options(self, **changes: Any):
+        self.data.setdefault("options", {}).update(changes)
+        self._changed()
+
+    @property
+    def preview(self) -> bool:
+        return self.options.get("quality") == "preview"
+
+    @property
+    def tier(self) -> str:
+        """Quality tier assets are produced for; assets of the other tier do not count as done"""
+        return "preview" if self.preview else "final"
+
+    def renders_scene(self, index: int) -> bool:
+        return not self.preview or index % self.PREVIEW_STRIDE == 0
+
+    def scenes(self) -> List[int]:
+        """Prompt indices the current tier renders"""
+        prompts = self.script["image_prompts"] if self.script else []
+        return [i for i in range(len(prompts)) if self.renders_scene(i)]
+
+    # Script
+
+    @property
+    def script(self) -> Optional[Dict[str, Any]]:
+        return self.data.get("script")
+
+    def record_script(self, script_data: Dict[str, Any]):
+        self.data["script"] = script_data
+        self._changed()
+
+    # Images
+
+    def image_path(self, index: int) -> Optional[Path]:
+        entry = self.data["images"].get(str(index))
+        if entry and entry.get("prompt") != self.script["image_prompts"][index]:
+            return None
+        if entry and entry.get("tier", "final") not in (None, self.tier):
+            return None
+        if self.refresh_requested(index):
+            return None
+        return self._existing(entry)
+
+    def missing_images(self) -> List[int]:
+        """Rendered scenes without a usable image, failed ones included"""
+        return [i for i in self.scenes() if self.image_path(i) is None]
+
+    def completed_images(self) -> Dict[int, Path]:
+        images = {}
+        for i in self.scenes():
+            path = self.image_path(i)
+            if path is not None:
+                images[i] = path
+        return images
+
+    def record_image(self, index: int, path: Path, prompt: Optional[str] = None, uploaded: bool = False):
+        """Record a finished image; prompt is needed when the script is not recorded yet.
+
+        An uploaded image is the user's choice rather than a render at some
+        quality, so it stays in use whatever the tier.
+        """
+        self.data["images"][str(index)] = {
+            "file": self._relative(path),
+            "prompt": prompt if prompt is not None else self.script["image_prompts"][index],
+            "tier": None if uploaded else self.tier
+        }
+        self.data["failed_images"].pop(str(index), None)
+        # A new image keeps its file name, so its old overlay has to go explicitly
+        self.data["overlays"].pop(str(index), None)
+        refresh = self.data.get("refresh_images", [])
+        if index in refresh:
+            refresh.remove(index)
+        self._changed()
+
+    def request_image_refresh(self, index: int):
+        """Have the next run generate image index again, bypassing the blob cache"""
+        refresh = self.data.setdefault("refresh_images", [])
+        if index not in refresh:
+            refresh.append(index)
+        self._changed()
+
+    def refresh_requested(self, index: int) -> bool:
+        return index in self.data.get("refresh_images", [])
+
+    def record_image_failure(self, index: int, error: str):
+        self.data["failed_images"][str(index)] = error
+        self._changed()
+
+    @property
+    def failed_images(self) -> Dict[str, str]:
+        return self.data["failed_images"]
+
+    # Overlays
+
+    def overlay_path(self, index: int, text: str) -> Optional[Path]:
+        """Overlay for index, if one exists for this exact image and caption"""
+        entry = self.data["overlays"].get(str(index))
+        image = self.data["images"].get(str(index))
+        if not entry or not image or entry.get("text") != text or entry.get("image") != image["file"]:
+            return None
+        return self._existing(entry)
+
+    def record_overlay(self, index: int, path: Path, text: str):
+        self.data["overlays"][str(index)] = {
+            "file": self._relative(path),
+            "text": text,
+            "image": self.data["images"][str(index)]["file"]
+        }
+        self._changed()
+
+    # Voiceover and video
+
+    def voiceover_path(self) -> Optional[Path]:
+        entry = self.data.get("voiceover")
+        if entry and self.script and entry.get("text") != self.script["script"]:
+            return None
+        if entry and entry.get("tier", "final") != self.tier:
+            return None
+        return self._existing(entry)
+
+    def record_voiceover(self, path: Path):
+        self.data["voiceover"] = {"file": self._relative(path), "text": self.script["script"], "tier": self.tier}
+        self._changed()
+
+    def input_signature(self, paths: List[Path]) -> List[str]:
+        """Identify encode inputs by name, size and mtime"""
+        signature = []
+        for path in paths:
+            stat = Path(path).stat()
+            signature.append(f"{self._relative(path)}:{stat.st_size}:{stat.st_mtime_ns}")
+        return signature
+
+    def video_path(self, inputs: Optional[List[str]] = None) -> Optional[Path]:
+        """Finished video, if it was encoded from exactly these inputs"""
+        entry = self.data.get("video")
+        if entry and inputs is not None and entry.get("inputs") != inputs:
+            return None
+        return self._existing(entry)
+
+    def record_video(self, path: Path, inputs: List[str], renditions: Optional[Dict[str, Path]] = None):
+        self.data["video"] = {
+            "file": self._relative(path),
+            "inputs": inputs,
+            "renditions": {name: self._relative(p) for name, p in (renditions or {}).items()}
+        }
+        self._changed()
+
+    def rendition_paths(self) -> Dict[str, Path]:
+        """Existing encoded renditions of the finished video by name"""
+        entry = self.data.get("video") or {}
+        paths = {}
+        for name, file in entry.get("renditions", {}).items():
+            path = self._existing({"file": file})
+            if path is not None:
+                paths[name] = path
+        return paths
+
+    # Content digests of deliverables, for HTTP validators
+
+    def record_digests(self, paths: List[Path]):
+        """Hash the deliverables that changed since their digest was recorded (blocking)"""
+        digests = self.data.setdefault("digests", {})
+        for path in paths:
+            path = Path(path)
+            if not path.exists():
+                continue
+            key = self._relative(path)
+            stat = path.stat()
+            entry = digests.get(key)
+            if entry and (entry["size"], entry["mtime_ns"]) == stat_signature(stat):
+                continue
+            digests[key] = {"sha256": file_digest(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        self._changed()
+
+    def digest(self, path: Path, stat: os.stat_result) -> Optional[str]:
+        """Recorded SHA-256 of path, if it was recorded for this version of the file"""
+        entry = self.data.get("digests", {}).get(self._relative(path))
+        if entry and (entry["size"], entry["mtime_ns"]) == stat_signature(stat):
+            return entry["sha256"]
+        return None
@@ -0,0 +1,80 @@
+import re
+import json
+import logging
+from typing import Dict, Any, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_topic(topic: str) -> str:
+    """Fold case, whitespace and surrounding punctuation so trivially different spellings match"""
+    return _WHITESPACE.sub(" ", topic).strip(" \t\"'.!?,;:").casefold()
+
+
+def request_key(topic: str, options: Dict[str, Any]) -> str:
+    """Identity of a generation request: its normalized topic plus every option that changes the output"""
+    return json.dumps([normalize_topic(topic), options], sort_keys=True)
+
+
+class RequestCoalescer:
+    """Single-flight bookkeeping for identical /generate requests.
+
+    The first request for a key leads: it owns the pipeline, the session
+    directory and the checkpoint. Requests with the same key that arrive while
+    it runs follow it: they get their own session IDs, run nothing, and
+    serve the leader's status and assets. A pipeline is only worth cancelling
+    once every session subscribed to it has detached. Once it finishes,
+    release() drops its entries, so nothing here outlives the pipelines
+    in flight.
+    """
+
+    def __init__(self):
+        self._leaders: Dict[str, str] = {}  # key -> leading session
+        self._keys: Dict[str, str] = {}  # leading session -> key
+        self._followers: Dict[str, str] = {}  # following session -> leading session
+        self._subscribers: Dict[str, Set[str]] = {}  # leading session -> sessions still watching
+
+    def leader_for(self, key: str) -> Optional[str]:
+        return self._leaders.get(key)
+
+    def lead(self, key: str, session_id: str):
+        self._leaders[key] = session_id
+        self._keys[session_id] = key
+        self._subscribers[session_id] = {session_id}
+
+    def forget(self, session_id: str):
+        """Stop routing new requests to a leader (it finished, failed to start or was cancelled)"""
+        key = self._keys.pop(session_id, None)
+        if key is not None and self._leaders.get(key) == session_id:
+            del self._leaders[key]
+
+    def follow(self, leader_id: str, session_id: str):
+        self._followers[session_id] = leader_id
+        self.attach(leader_id, session_id)
+
+    def attach(self, leader_id: str, session_id: str):
+        self._subscribers.setdefault(leader_id, set()).add(session_id)
+
+    def leader_of(self, session_id: str) -> Optional[str]:
+        """The session whose pipeline serves session_id, if it is a follower"""
+        return self._followers.get(session_id)
+
+    def detach(self, leader_id: str, session_id: str) -> int:
+        """Unsubscribe a session; returns how many sessions still watch the pipeline"""
+        subscribers = self._subscribers.get(leader_id, set())
+        subscribers.discard(session_id)
+        return len(subscribers)
+
+    def release(self, leader_id: str) -> List[str]:
+        """Drop everything kept for a pipeline that finished; returns the sessions that followed it"""
+        self.forget(leader_id)
+        self._subscribers.pop(leader_id, None)
+        followers = [session_id for session_id, leader in self._followers.items() if leader == leader_id]
+        for session_id in followers:
+            del self._followers[session_id]
+        return followers
+
+    def stats(self) -> Dict[str, int]:
+        return {"in_flight": len(self._leaders), "followers": len(self._followers)}
@@ -1,17 +1,123 @@
+import io
 import os
+import time
 import uuid
+import shutil
+import socket
 import aiohttp
+import aiohttp.abc
 import asyncio
+import ipaddress
+from contextlib import contextmanager
 from pathlib import Path
-from typing import List, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
+from urllib.parse import urlsplit
 import logging
+from PIL import Image
+
+from utils.memory import get_memory_budget
+from utils.tracer import trace_span
 
 logger = logging.getLogger(__name__)
 
+# User-supplied scene images larger than this are refused
+MAX_EXTERNAL_IMAGE_BYTES = 20 * 1024 * 1024
+
+def _is_public(address: Union[ipaddress.IPv4Address, ipaddress.IPv6Address]) -> bool:
+    if isinstance(address, ipaddress.IPv6Address) and address.ipv4_mapped is not None:
+        address = address.ipv4_mapped
+    return address.is_global
+
+def check_public_url(url: str):
+    """Raise ValueError unless url is https to a host name or a public IP address"""
+    parts = urlsplit(url)
+    if parts.scheme != "https" or not parts.hostname:
+        raise ValueError("Only https:// image URLs are accepted")
+    try:
+        address = ipaddress.ip_address(parts.hostname)
+    except ValueError:
+        return  # Host names are checked as they are resolved
+    if not _is_public(address):
+        raise ValueError("Image URL points to a non-public address")
+
+class PublicResolver(aiohttp.abc.AbstractResolver):
+    """Resolver refusing hosts with any non-public address.
+    
+    The connection goes to the addresses checked here, so a host name
+    re-resolving to an internal address between check and connect cannot
+    slip through.
+    """
+
+    def __init__(self):
+        self._resolver = aiohttp.DefaultResolver()
+
+    async def resolve(self, host: str, port: int = 0, family: socket.AddressFamily = socket.AF_INET):
+        results = await self._resolver.resolve(host, port, family)
+        for result in results:
+            if not _is_public(ipaddress.ip_address(result["host"])):
+                raise OSError(f"{host} resolves to a non-public address")
+        return results
+
+    async def close(self):
+        await self._resolver.close()
+
+def _verify_image(content: bytes):
+    """Raise ValueError unless content decodes as an image"""
+    try:
+        with Image.open(io.BytesIO(content)) as image:
+            image.verify()
+    except Exception as e:
+        raise ValueError(f"Not an image: {str(e)}")
+
 class FileManager:
-    def __init__(self, base_dir: str = "generated"):
+    """Session directories on durable storage, plus an optional RAM-backed scratch tier.
+    
+    Deliverables (script, images, voiceover, videos) live in base_dir/<session>.
+    Intermediates that only feed later stages (overlay PNGs, scene clips,
+    concat lists) can live in scratch_dir/runhistory/<session> instead, e.g.
+    on /dev/shm, which is far faster than the network volumes base_dir is
+    usually on. Scratch is capped at scratch_max_bytes and at the space
+    actually free on its filesystem (Docker's default /dev/shm is 64 MB):
+    scratch directories of sessions idle for scratch_idle_seconds are
+    evicted to make room, and when that is not enough, work spills to
+    base_dir. Everything in scratch can be recomputed, so losing it
+    (restart, eviction) only costs time. Files on a tmpfs count against the
+    container's memory limit.
+    """
+    
+    # Left free on the scratch filesystem for writes nobody announced
+    SCRATCH_FREE_MARGIN = 8 * 1024 * 1024
+    
+    def __init__(
+        self,
+        base_dir: str = "generated",
+        scratch_dir: Optional[str] = None,
+        scratch_max_bytes: int = 256 * 1024 * 1024,
+        scratch_idle_seconds: float = 300
+    ):
         self.base_dir = Path(base_dir)
         self.base_dir.mkdir(exist_ok=True)
+        self.scratch_root = Path(scratch_dir) / "runhistory" if scratch_dir else None
+        self.scratch_max_bytes = scratch_max_bytes
+        self.scratch_idle_seconds = scratch_idle_seconds
+        self.bytes_written = {"scratch": 0, "durable": 0}
+        self.counters = {"scratch_dirs": 0, "spilled_dirs": 0, "evicted_bytes": 0}
+        self._active_sessions: Dict[str, int] = {}
+        # Bytes of each (session, name) scratch directory handed out by this process:
+        # the expected size until record_writes has seen what was really written
+        self._scratch_dirs: Dict[Tuple[str, str], int] = {}
+    
+    @classmethod
+    def from_env(cls) -> "FileManager":
+        """SCRATCH_DIR (default /dev/shm where it exists; empty disables), SCRATCH_MAX_MB, SCRATCH_IDLE_SECONDS"""
+        scratch_dir = os.environ.get("SCRATCH_DIR")
+        if scratch_dir is None:
+            scratch_dir = "/dev/shm" if os.access("/dev/shm", os.W_OK) else ""
+        return cls(
+            scratch_dir=scratch_dir or None,
+            scratch_max_bytes=int(float(os.environ.get("SCRATCH_MAX_MB", "256")) * 1024 * 1024),
+            scratch_idle_seconds=float(os.environ.get("SCRATCH_IDLE_SECONDS", "300"))
+        )
     
     def generate_session_id(self) -> str:
         """Generate unique session ID"""
@@ -28,23 +134,66 @@ class FileManager:
         image_path = directory / filename
         
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url) as response:
-                    if response.status == 200:
-                        content = await response.read()
-                        
-                        # Save image
-                        with open(image_path, 'wb') as f:
-                            f.write(content)
-                        
-                        logger.info(f"Downloaded image: {image_path}")
-                        return image_path
-                    else:
-                        raise Exception(f"Failed to download image: HTTP {response.status}")
+            # The whole body is held in memory until it is written out
+            async with get_memory_budget().reserve("download"):
+                with trace_span("file_manager.download_image", "download", filename=filename) as span:
+                    async with aiohttp.ClientSession() as session:
+                        async with session.get(url) as response:
+                            if response.status == 200:
+                                content = await response.read()
+                                span.set(bytes=len(content))
+                                self._save_image(image_path, content)
+                                
+                                logger.info(f"Downloaded image: {image_path}")
+                                return image_path
+                            else:
+                                raise Exception(f"Failed to download image: HTTP {response.status}")
         except Exception as e:
             logger.error(f"Error downloading image: {str(e)}")
             raise
     
+    async def download_external_image(self, url: str, directory: Path, filename: str,
+                                      max_bytes: int = MAX_EXTERNAL_IMAGE_BYTES) -> Path:
+        """Download a user-supplied image URL into the session.
+        
+        Only https URLs resolving to public addresses are fetched, redirects
+        are not followed, bodies over max_bytes are refused and the body must
+        decode as an image. Raises ValueError or aiohttp errors otherwise.
+        """
+        check_public_url(url)
+        image_path = directory / filename
+        
+        async with get_memory_budget().reserve("download"):
+            with trace_span("file_manager.download_external_image", "download", filename=filename) as span:
+                resolver = PublicResolver()
+                try:
+                    connector = aiohttp.TCPConnector(resolver=resolver)
+                    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=30)) as session:
+                        async with session.get(url, allow_redirects=False) as response:
+                            if response.status != 200:
+                                raise ValueError(f"Failed to download image: HTTP {response.status}")
+                            content = bytearray()
+                            async for chunk in response.content.iter_chunked(64 * 1024):
+                                content += chunk
+                                if len(content) > max_bytes:
+                                    raise ValueError(f"Image is larger than {max_bytes // (1024 * 1024)} MB")
+                finally:
+                    await resolver.close()
+                span.set(bytes=len(content))
+                await asyncio.to_thread(_verify_image, bytes(content))
+                self._save_image(image_path, bytes(content))
+        
+        logger.info(f"Downloaded external image: {image_path}")
+        return image_path
+    
+    def _save_image(self, image_path: Path, content: bytes):
+        """Write via a rename: an existing file may be linked into the blob store"""
+        tmp_path = image_path.with_name(f".{image_path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, image_path)
+        self.record_write(image_path)
+    
     async def download_images(self, urls: List[str], directory: Path) -> List[Path]:
         """Download multiple images concurrently"""
         tasks = []
@@ -78,6 +227,7 @@ class FileManager:
         
         with open(path, 'w', encoding='utf-8') as f:
             f.write(content)
+        self.record_write(path)
         
         logger.info(f"Saved text file: {path}")
         return path
@@ -123,6 +273,7 @@ class FileManager:
     def cleanup_session(self, session_id: str) -> bool:
         """Clean up session files"""
         session_dir = self.base_dir / session_id
+        self.release_scratch(session_id)
         
         if not session_dir.exists():
             return False
@@ -155,3 +306,172 @@ class FileManager:
         path = Path(path)
         path.mkdir(parents=True, exist_ok=True)
         return path
+    
+    # Scratch tier
+    
+    def _tier(self, path: Path) -> str:
+        if self.scratch_root is not None and Path(path).is_relative_to(self.scratch_root):
+            return "scratch"
+        return "durable"
+    
+    def record_write(self, path: Union[str, Path]):
+        """Count a file just written towards its tier's byte counter"""
+        path = Path(path)
+        if path.exists():
+            self.bytes_written[self._tier(path)] += path.stat().st_size
+    
+    @contextmanager
+    def record_writes(self, directory: Path):
+        """Count files created or rewritten in directory while the block runs"""
+        before = self._listing(directory)
+        try:
+            yield
+        finally:
+            after = self._listing(directory)
+            self.bytes_written[self._tier(directory)] += sum(
+                size for path, (size, mtime) in after.items() if before.get(path) != (size, mtime)
+            )
+            key = self._scratch_key(directory)
+            if key in self._scratch_dirs:
+                self._scratch_dirs[key] = sum(size for size, _ in after.values())
+    
+    @staticmethod
+    def _listing(directory: Path) -> Dict[str, tuple]:
+        listing = {}
+        if directory.is_dir():
+            for entry in os.scandir(directory):
+                if entry.is_file():
+                    stat = entry.stat()
+                    listing[entry.name] = (stat.st_size, stat.st_mtime_ns)
+        return listing
+    
+    def hold_scratch(self, session_id: str):
+        """Mark session_id as rendering in this process, so its scratch is not evicted until release_hold"""
+        self._active_sessions[session_id] = self._active_sessions.get(session_id, 0) + 1
+    
+    def release_hold(self, session_id: str):
+        self._active_sessions[session_id] -= 1
+        if not self._active_sessions[session_id]:
+            del self._active_sessions[session_id]
+    
+    def _scratch_key(self, directory: Path) -> Optional[Tuple[str, str]]:
+        if self._tier(directory) != "scratch":
+            return None
+        parts = Path(directory).relative_to(self.scratch_root).parts
+        return (parts[0], parts[1]) if len(parts) >= 2 else None
+    
+    def _scratch_free(self) -> int:
+        """Bytes still free on the scratch filesystem"""
+        try:
+            stat = os.statvfs(self.scratch_root if self.scratch_root.is_dir() else self.scratch_root.parent)
+        except OSError:
+            return 0
+        return stat.f_bavail * stat.f_frsize
+    
+    def out_of_scratch(self, directory: Path) -> bool:
+        """Whether directory is in scratch and its filesystem has (nearly) run out of space"""
+        return self._tier(directory) == "scratch" and self._scratch_free() < self.SCRATCH_FREE_MARGIN
+    
+    def spill_dir(self, session_id: str, name: str) -> Path:
+        """The durable directory for a session's intermediates, for work that does not fit in scratch"""
+        durable = self.base_dir / session_id / name
+        durable.mkdir(parents=True, exist_ok=True)
+        self.counters["spilled_dirs"] += 1
+        logger.info(f"Scratch full, {name} for session {session_id} spills to {durable}")
+        return durable
+    
+    def work_dir(self, session_id: str, name: str, expected_bytes: int = 0) -> Path:
+        """Directory for a session's intermediates: scratch when they fit, else durable.
+        
+        Blocking (it may have to measure and evict scratch): call it in a thread.
+        """
+        if self.scratch_root is None:
+            durable = self.base_dir / session_id / name
+            durable.mkdir(parents=True, exist_ok=True)
+            return durable
+        
+        scratch = self.scratch_root / session_id / name
+        # Already counted in scratch usage; keep using it so its contents stay reusable
+        if not scratch.is_dir():
+            used = sum(self._scratch_dirs.values())
+            fits = used + expected_bytes <= min(
+                self.scratch_max_bytes, used + self._scratch_free() - self.SCRATCH_FREE_MARGIN
+            )
+            if not fits and not self._make_room(expected_bytes, session_id):
+                return self.spill_dir(session_id, name)
+        
+        try:
+            scratch.mkdir(parents=True, exist_ok=True)
+        except OSError as e:
+            logger.warning(f"Scratch unavailable ({e}), using durable storage")
+            return self.spill_dir(session_id, name)
+        key = (session_id, name)
+        self._scratch_dirs[key] = max(self._scratch_dirs.get(key, 0), expected_bytes)
+        self.counters["scratch_dirs"] += 1
+        return scratch
+    
+    def _scratch_usage(self) -> Dict[str, List[float]]:
+        """Bytes and newest modification time of every session directory in scratch (walks it all)"""
+        usage: Dict[str, List[float]] = {}
+        if self.scratch_root is None or not self.scratch_root.is_dir():
+            return usage
+        for session_dir in self.scratch_root.iterdir():
+            total, newest = 0, session_dir.stat().st_mtime
+            for root, _, files in os.walk(session_dir):
+                for filename in files:
+                    try:
+                        stat = os.stat(os.path.join(root, filename))
+                    except FileNotFoundError:
+                        continue
+                    total += stat.st_size
+                    newest = max(newest, stat.st_mtime)
+            usage[session_dir.name] = [total, newest]
+        return usage
+    
+    def _make_room(self, needed: int, session_id: str) -> bool:
+        """Evict idle sessions' scratch, least recently written first, until needed bytes fit.
+        
+        Measures all of scratch, other processes' sessions included, so it only
+        runs when this process's own count says the directory does not fit.
+        """
+        usage = self._scratch_usage()
+        used = sum(size for size, _ in usage.values())
+        # Evicting frees filesystem space as it lowers usage, so the limit stays put
+        limit = min(self.scratch_max_bytes, used + self._scratch_free() - self.SCRATCH_FREE_MARGIN)
+        if used + needed <= limit:
+            return True
+        
+        # Sessions rendering here, or recently written to by another worker, are left alone
+        idle_before = time.time() - self.scratch_idle_seconds
+        idle = sorted(
+            (newest, name) for name, (size, newest) in usage.items()
+            if name != session_id and name not in self._active_sessions and newest < idle_before
+        )
+        for _, name in idle:
+            if used + needed <= limit:
+                break
+            used -= usage[name][0]
+            self.counters["evicted_bytes"] += usage[name][0]
+            self.release_scratch(name)
+            logger.info(f"Evicted scratch of idle session {name} ({usage[name][0]} bytes)")
+        return used + needed <= limit
+    
+    def release_scratch(self, session_id: str, name: Optional[str] = None):
+        """Drop a session's scratch directory, or only its name subdirectory"""
+        if self.scratch_root is not None:
+            target = self.scratch_root / session_id
+            shutil.rmtree(target / name if name else target, ignore_errors=True)
+            for key in [key for key in self._scratch_dirs if key[0] == session_id and name in (None, key[1])]:
+                del self._scratch_dirs[key]
+    
+    def storage_stats(self) -> Dict[str, Any]:
+        """Tier counters; scratch usage is this process's running count, so this never walks scratch"""
+        return {
+            "scratch_root": str(self.scratch_root) if self.scratch_root else None,
+            "scratch_bytes": sum(self._scratch_dirs.values()),
+            "scratch_max_bytes": self.scratch_max_bytes if self.scratch_root else 0,
+            "scratch_free_bytes": self._scratch_free() if self.scratch_root else 0,
+            "scratch_sessions": len({session for session, _ in self._scratch_dirs}),
+            "bytes_written": dict(self.bytes_written),
+            **self.counters
+        }
@@ -0,0 +1,202 @@
+import os
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from secrets import token_hex
+from typing import Callable, List, Optional, Tuple, Union
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.types import Receive, Scope, Send
+
+# Versioned URLs (?v=...) never change content; unversioned ones change when a session is re-rendered
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+
+BYTE_RANGE = re.compile(r"(\d*)-(\d*)", re.ASCII)
+
+
+def parse_byte_ranges(value: str, file_size: int) -> Optional[List[Tuple[int, int]]]:
+    """Satisfiable ranges of a Range header, end exclusive, sorted and merged.
+
+    None when the header is malformed or asks for nothing inside the file.
+    """
+    units, _, spec = value.partition("=")
+    if units.strip().lower() != "bytes":
+        return None
+    ranges = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        match = BYTE_RANGE.fullmatch(item)
+        if match is None or match.group(0) == "-":
+            return None
+        first, last = match.groups()
+        if not first:
+            # Suffix: the last n bytes
+            if int(last) > 0:
+                ranges.append((max(file_size - int(last), 0), file_size))
+            continue
+        if last and int(last) < int(first):
+            return None
+        if int(first) < file_size:
+            ranges.append((int(first), min(int(last) + 1, file_size) if last else file_size))
+    if not ranges:
+        return None
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        if start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class DownloadResponse(FileResponse):
+    """FileResponse reading 256 KiB per send instead of 64 KiB (about twice the throughput under uvicorn).
+
+    Servers offering the ASGI pathsend extension get the path and send the
+    file themselves, without the body passing through Python at all. Range
+    requests are answered here: one range as a plain 206, several as a
+    multipart/byteranges body (Starlette 0.47.1 sends those with the file's
+    own Content-Type and the boundary in Content-Range, which no client can
+    parse). Anything else, malformed or unsatisfiable ranges included, is
+    left to FileResponse.
+    """
+
+    chunk_size = 256 * 1024
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        request_headers = Headers(scope=scope)
+        range_header = request_headers.get("range")
+        if range_header is None:
+            return await super().__call__(scope, receive, send)
+        if self.stat_result is None:
+            try:
+                self.stat_result = await anyio.to_thread.run_sync(os.stat, self.path)
+            except OSError:
+                return await super().__call__(scope, receive, send)
+            self.set_stat_headers(self.stat_result)
+        if_range = request_headers.get("if-range")
+        if if_range is not None and if_range not in (self.headers.get("last-modified"), self.headers.get("etag")):
+            return await super().__call__(scope, receive, send)
+        file_size = self.stat_result.st_size
+        ranges = parse_byte_ranges(range_header, file_size)
+        if ranges is None:
+            return await super().__call__(scope, receive, send)
+
+        send_header_only = scope["method"].upper() == "HEAD"
+        if len(ranges) == 1:
+            await self._send_range(send, ranges[0], file_size, send_header_only)
+        else:
+            await self._send_multipart(send, ranges, file_size, send_header_only)
+        if self.background is not None:
+            await self.background()
+
+    async def _send_file_range(self, send: Send, file, start: int, end: int):
+        await file.seek(start)
+        while start < end:
+            chunk = await file.read(min(self.chunk_size, end - start))
+            if not chunk:
+                break
+            start += len(chunk)
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+
+    async def _send_range(self, send: Send, byte_range: Tuple[int, int], file_size: int, send_header_only: bool):
+        start, end = byte_range
+        self.headers["content-range"] = f"bytes {start}-{end - 1}/{file_size}"
+        self.headers["content-length"] = str(end - start)
+        await send({"type": "http.response.start", "status": 206, "headers": self.raw_headers})
+        if not send_header_only:
+            async with await anyio.open_file(self.path, mode="rb") as file:
+                await self._send_file_range(send, file, start, end)
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    async def _send_multipart(self, send: Send, ranges: List[Tuple[int, int]], file_size: int,
+                              send_header_only: bool):
+        """206 multipart/byteranges: a part with its own Content-Type and Content-Range per range"""
+        boundary = token_hex(13)
+        part_type = self.headers.get("content-type", "application/octet-stream")
+        heads = [
+            (f"--{boundary}\r\nContent-Type: {part_type}\r\n"
+             f"Content-Range: bytes {start}-{end - 1}/{file_size}\r\n\r\n").encode("latin-1")
+            for start, end in ranges
+        ]
+        tail = f"--{boundary}--\r\n".encode("latin-1")
+        content_length = sum(len(head) + (end - start) + 2 for head, (start, end) in zip(heads, ranges)) + len(tail)
+
+        self.headers["content-type"] = f"multipart/byteranges; boundary={boundary}"
+        self.headers["content-length"] = str(content_length)
+        await send({"type": "http.response.start", "status": 206, "headers": self.raw_headers})
+        if send_header_only:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            for head, (start, end) in zip(heads, ranges):
+                await send({"type": "http.response.body", "body": head, "more_body": True})
+                await self._send_file_range(send, file, start, end)
+                await send({"type": "http.response.body", "body": b"\r\n", "more_body": True})
+        await send({"type": "http.response.body", "body": tail, "more_body": False})
+
+
+def file_digest(path: Union[str, Path]) -> str:
+    """SHA-256 of a file's content, read in 1 MiB chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def stat_signature(stat: os.stat_result) -> Tuple[int, int]:
+    """What has to stay the same for a recorded digest to still describe the file"""
+    return stat.st_size, stat.st_mtime_ns
+
+
+def strong_etag(digest: str) -> str:
+    return f'"{digest[:32]}"'
+
+
+def version(digest: str) -> str:
+    """Short content version for ?v= in asset URLs"""
+    return digest[:16]
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match test: weak comparison against any listed tag, or *"""
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+
+class DigestCache:
+    """Content digests by file version, so repeat requests neither re-read checkpoints nor re-hash"""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[Tuple[int, int], str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path: Path, stat: os.stat_result, recorded: Optional[Callable[[], Optional[str]]] = None) -> str:
+        """Digest of path as of stat: cached, else recorded() (if given), else hashed. Blocking."""
+        key = str(path)
+        signature = stat_signature(stat)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == signature:
+                self._entries.move_to_end(key)
+                return entry[1]
+        digest = (recorded() if recorded is not None else None) or file_digest(path)
+        with self._lock:
+            self._entries[key] = (signature, digest)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return digest
@@ -0,0 +1,319 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple, Union
+
+from utils.scheduler import OUTCOMES, QuotaExceeded, SchedulingPolicy, decayed
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Job:
+    session_id: str
+    topic: str
+    attempts: int
+    status: Dict[str, Any]
+
+
+class JobQueue:
+    """Durable render queue shared by the API process and render workers.
+
+    A single SQLite file (WAL mode) holds one row per session: the API
+    enqueues and reads status, workers claim jobs, publish status and send
+    heartbeats. A job whose worker stops heartbeating is put back on the queue
+    and picked up by another worker, which resumes it from its checkpoint.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    session_id TEXT PRIMARY KEY,
+                    topic TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    worker_id TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    status TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    claimed_at REAL,
+                    heartbeat_at REAL,
+                    cancel_requested INTEGER NOT NULL DEFAULT 0,
+                    last_read_at REAL,
+                    client_id TEXT NOT NULL DEFAULT '',
+                    priority TEXT NOT NULL DEFAULT 'interactive'
+                )
+            """)
+            # Queues created before cancellation support or fair scheduling lack the newer columns
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "cancel_requested" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN cancel_requested INTEGER NOT NULL DEFAULT 0")
+            if "last_read_at" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN last_read_at REAL")
+            if "client_id" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN client_id TEXT NOT NULL DEFAULT ''")
+                conn.execute("ALTER TABLE jobs ADD COLUMN priority TEXT NOT NULL DEFAULT 'interactive'")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, created_at)")
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections must stay on the thread that opened them
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, session_id: str, topic: str, status: Dict[str, Any], client_id: str = "",
+                priority: str = "interactive", max_queued: Optional[int] = None):
+        """Queue a new session, or re-queue a finished one for resume.
+        
+        Raises QuotaExceeded if client_id already has max_queued jobs waiting.
+        """
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if max_queued is not None:
+                waiting = conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE state = 'queued' AND client_id = ?", (client_id,)
+                ).fetchone()[0]
+                if waiting >= max_queued:
+                    raise QuotaExceeded(f"{max_queued} jobs already waiting for this client")
+            conn.execute(
+                """
+                INSERT INTO jobs (session_id, topic, state, status, created_at, client_id, priority)
+                VALUES (?, ?, 'queued', ?, ?, ?, ?)
+                ON CONFLICT (session_id) DO UPDATE SET
+                    state = 'queued', topic = excluded.topic, status = excluded.status,
+                    worker_id = NULL, attempts = 0, created_at = excluded.created_at,
+                    cancel_requested = 0, last_read_at = NULL,
+                    client_id = excluded.client_id, priority = excluded.priority
+                """,
+                (session_id, topic, json.dumps(status), time.time(), client_id, priority)
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _pick_fair(self, conn: sqlite3.Connection, policy: SchedulingPolicy) -> Optional[str]:
+        """Session the policy starts next, judged on the whole queue's running jobs and recent claims"""
+        now = time.time()
+        waiting = conn.execute(
+            "SELECT session_id, client_id, priority, created_at FROM jobs "
+            "WHERE state = 'queued' ORDER BY created_at LIMIT 1000"
+        ).fetchall()
+        if not waiting:
+            return None
+        running: Dict[str, int] = {}
+        bulk_running = 0
+        for client_id, priority, count in conn.execute(
+            "SELECT client_id, priority, COUNT(*) FROM jobs WHERE state = 'running' GROUP BY client_id, priority"
+        ):
+            running[client_id] = running.get(client_id, 0) + count
+            bulk_running += count if priority == "bulk" else 0
+        recent: Dict[str, float] = {}
+        for client_id, claimed_at in conn.execute(
+            "SELECT client_id, claimed_at FROM jobs WHERE claimed_at > ?", (now - 8 * policy.usage_half_life,)
+        ):
+            recent[client_id] = recent.get(client_id, 0.0) + decayed(now - claimed_at, policy.usage_half_life)
+        return policy.pick(waiting, running, recent, bulk_running)
+
+    def claim(self, worker_id: str, policy: Optional[SchedulingPolicy] = None) -> Optional[Job]:
+        """Atomically take the job the policy picks, or the oldest queued job without one"""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if policy is not None:
+                session_id = self._pick_fair(conn, policy)
+                row = conn.execute(
+                    "SELECT session_id, topic, attempts, status FROM jobs WHERE session_id = ?", (session_id,)
+                ).fetchone() if session_id is not None else None
+            else:
+                row = conn.execute(
+                    "SELECT session_id, topic, attempts, status FROM jobs "
+                    "WHERE state = 'queued' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            now = time.time()
+            conn.execute(
+                "UPDATE jobs SET state = 'running', worker_id = ?, attempts = attempts + 1, "
+                "claimed_at = ?, heartbeat_at = ? WHERE session_id = ?",
+                (worker_id, now, now, row[0])
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return Job(session_id=row[0], topic=row[1], attempts=row[2] + 1, status=json.loads(row[3]))
+
+    def heartbeat(self, session_id: str, worker_id: str, status: Dict[str, Any]):
+        """Publish the job's current status; also proves the worker is alive"""
+        self._connection().execute(
+            "UPDATE jobs SET status = ?, heartbeat_at = ? WHERE session_id = ? AND worker_id = ?",
+            (json.dumps(status), time.time(), session_id, worker_id)
+        )
+
+    def finish(self, session_id: str, worker_id: str, status: Dict[str, Any]):
+        self._connection().execute(
+            "UPDATE jobs SET state = 'finished', status = ?, heartbeat_at = ? "
+            "WHERE session_id = ? AND worker_id = ?",
+            (json.dumps(status), time.time(), session_id, worker_id)
+        )
+
+    def release(self, session_id: str, worker_id: str):
+        """Hand a running job back to the queue (worker shutting down)"""
+        self._connection().execute(
+            "UPDATE jobs SET state = 'queued', worker_id = NULL, attempts = attempts - 1 "
+            "WHERE session_id = ? AND worker_id = ? AND state = 'running'",
+            (session_id, worker_id)
+        )
+
+    def request_cancel(self, session_id: str) -> Optional[str]:
+        """Cancel a job: queued ones at once, running ones via their worker's next heartbeat.
+
+        Returns "cancelled", "cancelling", "finished" (too late) or None if unknown.
+        """
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT state, status FROM jobs WHERE session_id = ?", (session_id,)).fetchone()
+            if row is None:
+                result = None
+            elif row[0] == "finished":
+                result = "finished"
+            elif row[0] == "queued":
+                status = json.loads(row[1])
+                status.update(status="cancelled", message="Generation cancelled")
+                conn.execute("UPDATE jobs SET state = 'finished', status = ? WHERE session_id = ?",
+                             (json.dumps(status), session_id))
+                result = "cancelled"
+            else:
+                conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE session_id = ?", (session_id,))
+                result = "cancelling"
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+
+    def cancel_requests(self, worker_id: str, idle_after: float = 0) -> List[Tuple[str, str]]:
+        """(session_id, reason) for this worker's jobs that were cancelled or nobody polls any more"""
+        rows = self._connection().execute(
+            "SELECT session_id, cancel_requested, MAX(COALESCE(last_read_at, 0), claimed_at) "
+            "FROM jobs WHERE state = 'running' AND worker_id = ?",
+            (worker_id,)
+        ).fetchall()
+        cutoff = time.time() - idle_after
+        requests = []
+        for session_id, cancel_requested, last_activity in rows:
+            if cancel_requested:
+                requests.append((session_id, "Generation cancelled"))
+            elif idle_after > 0 and last_activity < cutoff:
+                requests.append((session_id, f"Generation cancelled: no status requests for {idle_after:.0f}s"))
+        return requests
+
+    def requeue_stale(self, stale_after: float, max_attempts: int) -> int:
+        """Re-queue running jobs whose worker went silent; give up after max_attempts"""
+        conn = self._connection()
+        cutoff = time.time() - stale_after
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT session_id, attempts, status, cancel_requested FROM jobs "
+                "WHERE state = 'running' AND heartbeat_at < ?",
+                (cutoff,)
+            ).fetchall()
+            for session_id, attempts, status, cancel_requested in rows:
+                if cancel_requested:
+                    status = json.loads(status)
+                    status.update(status="cancelled", message="Generation cancelled")
+                    conn.execute(
+                        "UPDATE jobs SET state = 'finished', status = ? WHERE session_id = ?",
+                        (json.dumps(status), session_id)
+                    )
+                elif attempts >= max_attempts:
+                    status = json.loads(status)
+                    status.update(status="error", message=f"Error: render worker lost {attempts} times")
+                    conn.execute(
+                        "UPDATE jobs SET state = 'finished', status = ? WHERE session_id = ?",
+                        (json.dumps(status), session_id)
+                    )
+                    logger.error(f"Giving up on job {session_id} after {attempts} lost workers")
+                else:
+                    conn.execute("UPDATE jobs SET state = 'queued', worker_id = NULL WHERE session_id = ?",
+                                 (session_id,))
+                    logger.warning(f"Re-queued job {session_id} from a silent worker")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return len(rows)
+
+    def status(self, session_id: str, touch: bool = False) -> Optional[Dict[str, Any]]:
+        """Current status; touch marks the session as still watched by a client"""
+        conn = self._connection()
+        if touch:
+            conn.execute(
+                "UPDATE jobs SET last_read_at = ? WHERE session_id = ? AND state != 'finished'",
+                (time.time(), session_id)
+            )
+        row = conn.execute("SELECT status FROM jobs WHERE session_id = ?", (session_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def stats(self) -> Dict[str, int]:
+        rows = self._connection().execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        return {"queued": 0, "running": 0, "finished": 0, **dict(rows)}
+
+    def usage(self, client_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Per-client job counts and waiting/render time, over the sessions still in the queue file"""
+        query = (
+            "SELECT client_id, state, json_extract(status, '$.status'), COUNT(*), "
+            "SUM(CASE WHEN claimed_at >= created_at THEN claimed_at - created_at ELSE 0 END), "
+            "SUM(CASE WHEN state = 'finished' THEN COALESCE(heartbeat_at - claimed_at, 0) ELSE 0 END), "
+            "MAX(created_at) FROM jobs"
+        )
+        params: Tuple = ()
+        if client_id is not None:
+            query += " WHERE client_id = ?"
+            params = (client_id,)
+        clients: Dict[str, Dict[str, Any]] = {}
+        for client, state, outcome, count, waited, rendered, last_seen in self._connection().execute(
+            query + " GROUP BY client_id, state, 3", params
+        ):
+            usage = clients.setdefault(client, {
+                "client": client, "waiting": 0, "running": 0, **{o: 0 for o in OUTCOMES},
+                "wait_seconds": 0.0, "render_seconds": 0.0, "last_seen": None
+            })
+            if state == "queued":
+                usage["waiting"] += count
+            elif state == "running":
+                usage["running"] += count
+            else:
+                usage[outcome if outcome in OUTCOMES else "cancelled"] += count
+            usage["wait_seconds"] = round(usage["wait_seconds"] + waited, 2)
+            usage["render_seconds"] = round(usage["render_seconds"] + rendered, 2)
+            usage["last_seen"] = max(usage["last_seen"] or 0, last_seen)
+        return list(clients.values())
+
+
+_job_queue: Optional[JobQueue] = None
+
+
+def get_job_queue() -> JobQueue:
+    """Process-wide queue at JOB_QUEUE_PATH"""
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = JobQueue(os.environ.get("JOB_QUEUE_PATH", "generated/jobs.sqlite3"))
+    return _job_queue
@@ -0,0 +1,171 @@
+import os
+import sys
+import copy
+import json
+import queue
+import atexit
+import logging
+import logging.handlers
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+from utils.tracer import get_stage, get_tracer
+
+# Attributes every LogRecord has; anything else was passed through extra=
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "session_id", "stage", "sampled"}
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class SessionContextFilter(logging.Filter):
+    """Tags records with the session and pipeline stage they were logged from.
+
+    Runs on the thread that logs, where the session's context variables are
+    visible, before the record is handed to the writer thread.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        # Code logging on behalf of another context may pass session_id via extra=
+        if getattr(record, "session_id", None) is None:
+            tracer = get_tracer()
+            record.session_id = tracer.session_id if tracer else None
+        record.stage = get_stage()
+        return True
+
+
+class SessionSamplingFilter(logging.Filter):
+    """Thins out repetitive INFO/DEBUG messages within a session.
+
+    Each call site logs its first `burst` records of a session and then every
+    `every`-th one, so per-image and per-download messages stay readable for
+    large sessions; emitted records carry how many they stand for. Warnings
+    and errors, and records outside a session, are never dropped.
+    """
+
+    MAX_SESSIONS = 1000
+
+    def __init__(self, burst: int = 4, every: int = 10):
+        super().__init__()
+        self.burst = burst
+        self.every = max(1, every)
+        self._counts: Dict[str, Counter] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        session_id = getattr(record, "session_id", None)
+        if session_id is None or record.levelno >= logging.WARNING:
+            return True
+        counts = self._counts.get(session_id)
+        if counts is None:
+            if len(self._counts) >= self.MAX_SESSIONS:
+                del self._counts[next(iter(self._counts))]
+            counts = self._counts[session_id] = Counter()
+        site: Tuple[str, int] = (record.pathname, record.lineno)
+        counts[site] += 1
+        seen = counts[site]
+        if seen <= self.burst:
+            return True
+        if (seen - self.burst) % self.every:
+            return False
+        record.sampled = self.every
+        return True
+
+
+class SessionQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that keeps a traceback apart from the message it belongs to"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge args and render the traceback now: both may reference objects
+        # that change or disappear before the listener thread gets to them
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _plain_formatter.formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+
+_plain_formatter = logging.Formatter()
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with session_id and stage when logged inside a session"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "pid": record.process
+        }
+        for field in ("session_id", "stage", "sampled"):
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and key not in entry:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(log_file: Optional[str] = None, force: bool = False):
+    """Route all logging through a queue so records are written off the event loop.
+
+    The loop thread only tags, samples and enqueues each record; a listener
+    thread formats it and writes to stdout (and log_file). LOG_FORMAT picks
+    json (default) or text, LOG_LEVEL the root level, LOG_SAMPLE_BURST and
+    LOG_SAMPLE_EVERY the per-session sampling (burst 0 disables it). Does
+    nothing if already configured, unless force is set (e.g. in a forked
+    worker, which inherits the handlers but not the listener thread).
+    """
+    global _listener
+    root = logging.getLogger()
+    if _listener is not None and not force:
+        return
+    stop_logging()
+
+    if os.environ.get("LOG_FORMAT", "json").lower() == "text":
+        formatter = logging.Formatter(TEXT_FORMAT)
+    else:
+        formatter = JsonFormatter()
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, mode='a'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = SessionQueueHandler(records)
+    queue_handler.addFilter(SessionContextFilter())
+    burst = int(os.environ.get("LOG_SAMPLE_BURST", "4"))
+    if burst > 0:
+        queue_handler.addFilter(SessionSamplingFilter(burst, int(os.environ.get("LOG_SAMPLE_EVERY", "10"))))
+
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(os.environ.get("LOG_LEVEL", "INFO").upper())
+
+    _listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Write out queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        listener, _listener = _listener, None
+        try:
+            listener.stop()
+        except RuntimeError:
+            pass  # a forked worker inherits the listener but not its thread
@@ -0,0 +1,168 @@
+import os
+import sys
+import math
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional
+
+from utils.tracer import tracer_in
+
+logger = logging.getLogger(__name__)
+
+
+_HANDLE_RUN = asyncio.Handle._run.__code__
+
+
+def _percentile(ordered: List[float], pct: float) -> float:
+    rank = math.ceil(pct / 100 * len(ordered))
+    return ordered[max(0, min(len(ordered), rank) - 1)]
+
+
+class LoopMonitor:
+    """Measures event-loop lag continuously and attributes stalls to their code.
+
+    A heartbeat task sleeps for `interval` and records how late it wakes up.
+    A watchdog thread checks that the heartbeat keeps running; once it is more
+    than `threshold` overdue, the loop thread is stuck in a callback, and the
+    watchdog snapshots that thread's stack and the session it works for. The
+    stall's duration is filled in when the loop comes back.
+    """
+
+    STACK_DEPTH = 25
+
+    def __init__(self, threshold: float = 0.1, interval: float = 0.05, history: int = 50, window: int = 6000):
+        self.threshold = threshold
+        self.interval = interval
+        self.samples: deque = deque(maxlen=window)
+        self.stalls: deque = deque(maxlen=history)
+        self.stall_count = 0
+        self._lock = threading.Lock()
+        self._deadline: Optional[float] = None
+        self._captured_deadline: Optional[float] = None
+        self._open_stall: Optional[Dict[str, Any]] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start monitoring the running loop"""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._watchdog is not None:
+            await asyncio.to_thread(self._watchdog.join)
+
+    async def _heartbeat(self):
+        while True:
+            self._deadline = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.monotonic() - self._deadline)
+            self.samples.append(lag)
+            with self._lock:
+                stall, self._open_stall = self._open_stall, None
+            if stall is not None:
+                stall["duration_ms"] = round(lag * 1000, 1)
+                where = stall["stack"][-1].strip().splitlines()[0] if stall["stack"] else "unknown code"
+                logger.warning(
+                    f"Event loop blocked for {stall['duration_ms']:.0f} ms "
+                    f"(session {stall['session_id'] or 'none'}, task {stall['task'] or 'none'}): {where}",
+                    extra={"session_id": stall["session_id"]}
+                )
+
+    def _watch(self):
+        poll = max(0.005, self.threshold / 4)
+        while not self._stop.wait(poll):
+            deadline = self._deadline
+            if deadline is None or deadline == self._captured_deadline:
+                continue
+            if time.monotonic() - deadline > self.threshold:
+                self._captured_deadline = deadline
+                stall = self._capture()
+                with self._lock:
+                    self._open_stall = stall
+                    self.stalls.append(stall)
+                    self.stall_count += 1
+
+    def _capture(self) -> Dict[str, Any]:
+        """Snapshot what the (blocked) loop thread is running right now"""
+        frame = sys._current_frames().get(self._loop_thread_id)
+        task = asyncio.current_task(self._loop) if self._loop is not None else None
+        stack = traceback.format_stack(frame)[-self.STACK_DEPTH:] if frame is not None else []
+        return {
+            "at": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+            "duration_ms": None,
+            "session_id": self._session_of(frame),
+            "task": task.get_name() if task is not None else None,
+            "stack": stack
+        }
+
+    @staticmethod
+    def _session_of(frame) -> Optional[str]:
+        # Every callback (task steps included) runs inside Handle._run with the
+        # contextvars it was scheduled from, which carry the session's tracer.
+        # Failing that, the innermost frame with a session_id local names it.
+        found = None
+        while frame is not None:
+            code = frame.f_code
+            if code is _HANDLE_RUN:
+                handle = frame.f_locals.get("self")
+                context = getattr(handle, "_context", None)
+                tracer = tracer_in(context) if context is not None else None
+                if tracer is not None:
+                    return tracer.session_id
+            elif found is None and ("session_id" in code.co_varnames or "session_id" in code.co_freevars):
+                session_id = frame.f_locals.get("session_id")
+                if isinstance(session_id, str):
+                    found = session_id
+            frame = frame.f_back
+        return found
+
+    def report(self) -> Dict[str, Any]:
+        """Lag percentiles over the recent window plus the most recent stalls, newest first"""
+        ordered = sorted(self.samples)
+        lag: Dict[str, Any] = {"samples": len(ordered)}
+        if ordered:
+            lag.update({
+                "p50": round(_percentile(ordered, 50) * 1000, 2),
+                "p95": round(_percentile(ordered, 95) * 1000, 2),
+                "p99": round(_percentile(ordered, 99) * 1000, 2),
+                "max": round(ordered[-1] * 1000, 2)
+            })
+        with self._lock:
+            stalls = [dict(stall) for stall in reversed(self.stalls)]
+        return {
+            "threshold_ms": round(self.threshold * 1000, 1),
+            "interval_ms": round(self.interval * 1000, 1),
+            "lag_ms": lag,
+            "stalls_total": self.stall_count,
+            "stalls": stalls
+        }
+
+
+def loop_monitor_from_env() -> Optional[LoopMonitor]:
+    """Monitor configured by LOOP_MONITOR, LOOP_STALL_THRESHOLD_MS and LOOP_MONITOR_INTERVAL_MS"""
+    if os.environ.get("LOOP_MONITOR", "true").lower() not in ("1", "true", "yes"):
+        return None
+    return LoopMonitor(
+        threshold=float(os.environ.get("LOOP_STALL_THRESHOLD_MS", "100")) / 1000,
+        interval=float(os.environ.get("LOOP_MONITOR_INTERVAL_MS", "50")) / 1000
+    )
@@ -0,0 +1,229 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+import resource
+import tracemalloc
+from collections import deque
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+_MB = 1024 * 1024
+
+
+def current_rss_bytes() -> int:
+    """Resident set size of this process (ffmpeg and other children not included)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        # No procfs (macOS); the peak is the best available stand-in
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+def container_memory_limit() -> Optional[int]:
+    """Memory limit of the cgroup this process runs in, if it has one"""
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        # cgroup v1 reports "no limit" as a huge page-aligned number
+        if value.isdigit() and int(value) < 1 << 60:
+            return int(value)
+    return None
+
+
+class MemoryAccounting:
+    """Memory cost of each pipeline stage, tagged by session.
+
+    A stage records the process RSS when it starts and ends. With tracemalloc
+    enabled it also records the peak of Python allocations while it ran and
+    the call sites that grew most between snapshots. Both are process-wide:
+    with several sessions in flight a stage's numbers include whatever ran
+    alongside it. Snapshots are taken on the calling thread and cost time
+    proportional to the traced heap, so tracemalloc is a diagnostic mode.
+    """
+
+    TOP_SITES = 5
+
+    def __init__(self, tracemalloc_frames: int = 0, history: int = 200):
+        self.tracing = tracemalloc_frames > 0
+        if self.tracing and not tracemalloc.is_tracing():
+            tracemalloc.start(tracemalloc_frames)
+        self.records: deque = deque(maxlen=history)
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self._open = 0
+
+    def begin(self) -> Dict[str, Any]:
+        mark: Dict[str, Any] = {"rss": current_rss_bytes(), "started": time.monotonic()}
+        if self.tracing:
+            # The peak counter is shared, so it is only reset when no other stage is measuring
+            if self._open == 0:
+                tracemalloc.reset_peak()
+            mark["snapshot"] = tracemalloc.take_snapshot()
+        self._open += 1
+        return mark
+
+    def end(self, mark: Dict[str, Any], session_id: str, stage: str) -> Dict[str, Any]:
+        """Close a measurement; returns what was recorded, for the stage's trace span"""
+        self._open -= 1
+        rss = current_rss_bytes()
+        result: Dict[str, Any] = {
+            "rss_before_mb": round(mark["rss"] / _MB, 1),
+            "rss_after_mb": round(rss / _MB, 1),
+            "rss_delta_mb": round((rss - mark["rss"]) / _MB, 1)
+        }
+        if self.tracing:
+            result["traced_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / _MB, 1)
+            growth = tracemalloc.take_snapshot().compare_to(mark["snapshot"], "lineno")
+            result["top_allocations"] = [
+                f"{stat.traceback[0].filename}:{stat.traceback[0].lineno} {stat.size_diff / 1024:+.0f} KB"
+                for stat in growth[:self.TOP_SITES] if stat.size_diff > 0
+            ]
+
+        self.records.append({
+            "at": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+            "session_id": session_id,
+            "stage": stage,
+            "duration_s": round(time.monotonic() - mark["started"], 3),
+            **result
+        })
+        totals = self.stages.setdefault(stage, {"count": 0})
+        totals["count"] += 1
+        for key in ("rss_delta_mb", "rss_after_mb", "traced_peak_mb"):
+            if key in result:
+                totals[f"{key}_max"] = max(result[key], totals.get(f"{key}_max", result[key]))
+        return result
+
+    def report(self, session_id: Optional[str] = None) -> Dict[str, Any]:
+        """Per-stage maxima plus the most recent stage records (optionally of one session), newest first"""
+        records = [r for r in reversed(self.records) if session_id is None or r["session_id"] == session_id]
+        return {
+            "rss_mb": round(current_rss_bytes() / _MB, 1),
+            "tracemalloc": self.tracing,
+            "stages": self.stages,
+            "records": records
+        }
+
+
+class MemoryBudget:
+    """Admission control for memory-heavy work (overlays, downloads, encodes).
+
+    Work declares an estimate of what it needs before it starts and is
+    admitted while this process's RSS plus the estimates of admitted work
+    still running stays under the limit; ffmpeg children do not show in our
+    RSS, so their reservation is what accounts for them. Otherwise it waits,
+    re-checking whenever admitted work finishes and every `poll` seconds (RSS
+    also drops as memory is freed). Work is always admitted when nothing
+    else holds a reservation, so an oversized job runs alone instead of
+    waiting forever. A limit of None only counts.
+    """
+
+    def __init__(self, limit_bytes: Optional[int], estimates: Dict[str, int], poll: float = 0.25):
+        self.limit = limit_bytes
+        self.estimates = estimates
+        self.poll = poll
+        self.reserved = 0
+        self.holders = 0
+        self._waiters: deque = deque()
+        self.counters = {"admitted": 0, "delayed": 0, "delay_seconds": 0.0}
+
+    def _fits(self, estimate: int) -> bool:
+        if self.limit is None or self.holders == 0:
+            return True
+        return current_rss_bytes() + self.reserved + estimate <= self.limit
+
+    def _wake_all(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+
+    @asynccontextmanager
+    async def reserve(self, kind: str, estimate: Optional[int] = None):
+        """Hold an admission for kind ("overlay", "download", "encode") while the block runs"""
+        estimate = self.estimates.get(kind, 0) if estimate is None else estimate
+        loop = asyncio.get_running_loop()
+        waited_since = None
+        while not self._fits(estimate):
+            if waited_since is None:
+                waited_since = time.monotonic()
+                self.counters["delayed"] += 1
+                logger.info(
+                    f"Delaying {kind}: {current_rss_bytes() / _MB:.0f} MB resident + "
+                    f"{self.reserved / _MB:.0f} MB reserved + {estimate / _MB:.0f} MB "
+                    f"would exceed the {self.limit / _MB:.0f} MB memory budget"
+                )
+            waiter = loop.create_future()
+            self._waiters.append(waiter)
+            try:
+                await asyncio.wait([waiter], timeout=self.poll)
+            finally:
+                if not waiter.done():
+                    waiter.cancel()
+        if waited_since is not None:
+            self.counters["delay_seconds"] += time.monotonic() - waited_since
+
+        self.reserved += estimate
+        self.holders += 1
+        self.counters["admitted"] += 1
+        try:
+            yield
+        finally:
+            self.reserved -= estimate
+            self.holders -= 1
+            self._wake_all()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit_mb": round(self.limit / _MB) if self.limit is not None else None,
+            "rss_mb": round(current_rss_bytes() / _MB, 1),
+            "reserved_mb": round(self.reserved / _MB, 1),
+            "holders": self.holders,
+            "waiting": sum(1 for waiter in self._waiters if not waiter.done()),
+            "estimates_mb": {kind: round(size / _MB) for kind, size in self.estimates.items()},
+            **{key: round(value, 2) if isinstance(value, float) else value for key, value in self.counters.items()}
+        }
+
+
+_memory_accounting: Optional[MemoryAccounting] = None
+_memory_budget: Optional[MemoryBudget] = None
+
+
+def get_memory_accounting() -> MemoryAccounting:
+    """Process-wide stage accounting; MEMORY_TRACEMALLOC=true adds allocation tracing"""
+    global _memory_accounting
+    if _memory_accounting is None:
+        tracing = os.environ.get("MEMORY_TRACEMALLOC", "false").lower() in ("1", "true", "yes")
+        _memory_accounting = MemoryAccounting(tracemalloc_frames=1 if tracing else 0)
+    return _memory_accounting
+
+
+def get_memory_budget() -> MemoryBudget:
+    """Process-wide budget of MEMORY_BUDGET_MB (default 80% of the container limit, if any; 0 disables).
+
+    Per-operation estimates come from MEMORY_ESTIMATE_OVERLAY_MB,
+    MEMORY_ESTIMATE_DOWNLOAD_MB and MEMORY_ESTIMATE_ENCODE_MB; the stage
+    records of /debug/memory show what they should be on real workloads.
+    """
+    global _memory_budget
+    if _memory_budget is None:
+        configured = os.environ.get("MEMORY_BUDGET_MB")
+        if configured is not None:
+            limit = int(float(configured) * _MB) or None
+        else:
+            container = container_memory_limit()
+            limit = int(container * 0.8) if container else None
+        _memory_budget = MemoryBudget(limit, {
+            "overlay": int(float(os.environ.get("MEMORY_ESTIMATE_OVERLAY_MB", "48")) * _MB),
+            "download": int(float(os.environ.get("MEMORY_ESTIMATE_DOWNLOAD_MB", "16")) * _MB),
+            "encode": int(float(os.environ.get("MEMORY_ESTIMATE_ENCODE_MB", "256")) * _MB)
+        })
+    return _memory_budget
@@ -0,0 +1,25 @@
+import asyncio
+import subprocess
+from typing import List, Optional
+
+
+async def run_process(cmd: List[str], timeout: Optional[float] = None) -> subprocess.CompletedProcess:
+    """Run a child process without blocking the event loop.
+
+    The child is killed if it outlives timeout (asyncio.TimeoutError is
+    raised) or if the awaiting task is cancelled, so a cancelled session never
+    leaves ffmpeg or edge-tts running. stdout/stderr are returned as bytes.
+    """
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+    except BaseException:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        raise
+    return subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
@@ -0,0 +1,182 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Mapping, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def retry_after_seconds(headers: Optional[Mapping[str, str]], default: float = 1.0) -> float:
+    """Read the wait time from retry-after-ms / retry-after headers"""
+    if not headers:
+        return default
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return max(0.0, float(value) / 1000)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    return default
+
+
+class AdaptiveRateLimiter:
+    """Token bucket on request rate plus an AIMD window on concurrent requests.
+
+    Every success grows the request rate and the concurrency window additively;
+    every 429 shrinks both multiplicatively and pauses all callers until the
+    server's retry-after has passed. The configured rate and concurrency are
+    ceilings, so throughput converges on the account's real limits.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_rate_per_minute: float,
+        max_concurrency: int,
+        initial_concurrency: int = 3,
+        min_concurrency: int = 1,
+        min_rate_per_minute: float = 1.0,
+        decrease_factor: float = 0.5
+    ):
+        self.name = name
+        self.max_rate = max_rate_per_minute / 60
+        self.min_rate = min_rate_per_minute / 60
+        self.rate = self.max_rate
+        self.burst = max(1.0, float(initial_concurrency))
+        self.tokens = self.burst
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.concurrency = float(min(max(initial_concurrency, min_concurrency), max_concurrency))
+        self.decrease_factor = decrease_factor
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self._last_refill = time.monotonic()
+        self._waiters: deque = deque()
+        self.counters = {"acquired": 0, "succeeded": 0, "rate_limited": 0, "failed": 0}
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def _delay(self, now: float) -> Optional[float]:
+        """0 when a request may start now, seconds to wait, or None to wait for a release"""
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.in_flight >= int(self.concurrency):
+            return None
+        if self.tokens < 1:
+            return (1 - self.tokens) / self.rate
+        return 0.0
+
+    def _wake_next(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+    async def acquire(self):
+        """Wait for a token and a free slot in the concurrency window"""
+        loop = asyncio.get_running_loop()
+        while True:
+            now = time.monotonic()
+            self._refill(now)
+            delay = self._delay(now)
+            if delay == 0.0:
+                self.tokens -= 1
+                self.in_flight += 1
+                self.counters["acquired"] += 1
+                return
+            waiter = loop.create_future()
+            self._waiters.append(waiter)
+            try:
+                await asyncio.wait([waiter], timeout=delay)
+            except BaseException:
+                # Pass on a wake-up we were handed but can no longer use
+                if waiter.done() and not waiter.cancelled():
+                    self._wake_next()
+                raise
+            finally:
+                if not waiter.done():
+                    waiter.cancel()
+                    try:
+                        self._waiters.remove(waiter)
+                    except ValueError:
+                        pass
+
+    def release(self):
+        self.in_flight -= 1
+        self._wake_next()
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold a concurrency slot for the duration of one request"""
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def on_success(self):
+        """Additive increase: about one extra slot per window of successes"""
+        self.counters["succeeded"] += 1
+        self.concurrency = min(self.max_concurrency, self.concurrency + 1 / max(self.concurrency, 1))
+        self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+        self.burst = max(1.0, float(int(self.concurrency)))
+        self._wake_next()
+
+    def on_rate_limited(self, retry_after: float):
+        """Multiplicative decrease and a global pause honouring retry-after"""
+        self.counters["rate_limited"] += 1
+        self.concurrency = max(self.min_concurrency, self.concurrency * self.decrease_factor)
+        self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+        self.burst = max(1.0, float(int(self.concurrency)))
+        self.tokens = min(self.tokens, 0.0)
+        self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+        logger.warning(
+            f"{self.name} rate limited, backing off {retry_after:.1f}s "
+            f"(concurrency {self.concurrency:.1f}, {self.rate * 60:.1f}/min)"
+        )
+
+    def on_failure(self):
+        self.counters["failed"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "concurrency_limit": round(self.concurrency, 2),
+            "rate_per_minute": round(self.rate * 60, 2),
+            "in_flight": self.in_flight,
+            "waiting": sum(1 for w in self._waiters if not w.done()),
+            "blocked_for": round(max(0.0, self.blocked_until - time.monotonic()), 2),
+            **self.counters
+        }
+
+
+_image_rate_limiter: Optional[AdaptiveRateLimiter] = None
+
+
+def get_image_rate_limiter() -> AdaptiveRateLimiter:
+    """Process-wide limiter shared by every session's DALL-E calls"""
+    global _image_rate_limiter
+    if _image_rate_limiter is None:
+        _image_rate_limiter = AdaptiveRateLimiter(
+            "dall-e",
+            max_rate_per_minute=float(os.environ.get("IMAGE_RATE_LIMIT_PER_MINUTE", "50")),
+            max_concurrency=int(os.environ.get("IMAGE_MAX_CONCURRENCY", "8")),
+            initial_concurrency=int(os.environ.get("IMAGE_INITIAL_CONCURRENCY", "3"))
+        )
+    return _image_rate_limiter
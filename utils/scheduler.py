@@ -0,0 +1,249 @@
+import os
+import time
+import asyncio
+import hashlib
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, Any, Collection, FrozenSet, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Strict order: a waiting interactive job always starts before any bulk job
+PRIORITIES = ("interactive", "bulk")
+
+OUTCOMES = ("completed", "error", "cancelled")
+
+
+def api_keys_from_env() -> FrozenSet[str]:
+    """API_KEYS: comma-separated keys that identify a client of their own"""
+    return frozenset(key.strip() for key in os.environ.get("API_KEYS", "").split(",") if key.strip())
+
+
+def client_identity(api_key: Optional[str], address: Optional[str], api_keys: Collection[str] = ()) -> str:
+    """Who a request counts against: its API key if it is one of api_keys, else its address.
+
+    Keys are hashed so they never show in usage reports. Any other key is
+    ignored: if an arbitrary key earned its own quota, a client could send
+    a fresh one with every request and never hit it.
+    """
+    if api_key and api_key in api_keys:
+        return "key:" + hashlib.sha256(api_key.encode()).hexdigest()[:12]
+    return f"ip:{address or 'unknown'}"
+
+
+def decayed(age: float, half_life: float) -> float:
+    """Weight of a job started age seconds ago in a client's recent usage"""
+    return 0.5 ** (max(age, 0.0) / half_life)
+
+
+class QuotaExceeded(Exception):
+    """The client already has as many jobs waiting as it may"""
+
+
+@dataclass
+class SchedulingPolicy:
+    """Which waiting job runs next, shared by the inline scheduler and the job queue.
+
+    Interactive jobs go before bulk ones; a client never has more than
+    client_max_running jobs running or client_max_queued waiting; bulk jobs
+    together never hold more than bulk_max_running slots (None: no limit).
+    Between clients with work waiting, the next slot goes to the one with
+    the fewest running jobs per unit of weight, then the least recent usage
+    (starts, decaying with usage_half_life) per unit of weight, then the
+    oldest job: a client flooding the queue gets its share and no more,
+    and a client with weight 2 gets about twice the slots of one with 1.
+    """
+
+    client_max_running: int = 2
+    client_max_queued: int = 20
+    bulk_max_running: Optional[int] = None
+    weights: Dict[str, float] = field(default_factory=dict)
+    default_weight: float = 1.0
+    usage_half_life: float = 600.0
+
+    def weight(self, client: str) -> float:
+        return self.weights.get(client, self.default_weight)
+
+    def pick(self, waiting: Iterable[Tuple[str, str, str, float]], running: Dict[str, int],
+             recent: Dict[str, float], bulk_running: int) -> Optional[str]:
+        """Job to start out of waiting (job_id, client, priority, submitted_at), or None if none may start"""
+        best_key = None
+        best = None
+        for job_id, client, priority, submitted_at in waiting:
+            if running.get(client, 0) >= self.client_max_running:
+                continue
+            if priority == "bulk" and self.bulk_max_running is not None and bulk_running >= self.bulk_max_running:
+                continue
+            weight = self.weight(client)
+            key = (
+                PRIORITIES.index(priority) if priority in PRIORITIES else len(PRIORITIES),
+                running.get(client, 0) / weight,
+                recent.get(client, 0.0) / weight,
+                submitted_at
+            )
+            if best_key is None or key < best_key:
+                best_key, best = key, job_id
+        return best
+
+
+def _parse_weights(value: str) -> Dict[str, float]:
+    """CLIENT_WEIGHTS: "key:3f2a9c01d4e5=4,ip:10.0.0.7=2" (client ids as reported by /usage)"""
+    weights = {}
+    for item in value.split(","):
+        if "=" in item:
+            client, weight = item.rsplit("=", 1)
+            weights[client.strip()] = float(weight)
+    return weights
+
+
+def scheduling_policy_from_env() -> SchedulingPolicy:
+    """Policy from CLIENT_MAX_RUNNING, CLIENT_MAX_QUEUED, CLIENT_WEIGHTS and RENDER_BULK_MAX_RUNNING"""
+    bulk_max = os.environ.get("RENDER_BULK_MAX_RUNNING")
+    return SchedulingPolicy(
+        client_max_running=int(os.environ.get("CLIENT_MAX_RUNNING", "2")),
+        client_max_queued=int(os.environ.get("CLIENT_MAX_QUEUED", "20")),
+        bulk_max_running=int(bulk_max) if bulk_max else None,
+        weights=_parse_weights(os.environ.get("CLIENT_WEIGHTS", "")),
+        usage_half_life=float(os.environ.get("CLIENT_USAGE_HALF_LIFE", "600"))
+    )
+
+
+@dataclass
+class Ticket:
+    """One submitted job; the same object is handed back to turn() and finish()"""
+
+    job_id: str
+    client: str
+    priority: str
+    submitted_at: float
+    future: asyncio.Future
+    started_at: Optional[float] = None
+
+
+class FairScheduler:
+    """Render slots of this process, handed out by a SchedulingPolicy.
+
+    A job is submitted when its request arrives (which is where the queued
+    quota is enforced), waits in turn() until the policy picks it and
+    releases its slot in finish(). Unless the policy limits bulk jobs
+    itself, `interactive_reserve` slots are kept out of their reach so an
+    interactive job arriving behind a bulk backlog starts at once.
+    """
+
+    def __init__(self, slots: int, policy: SchedulingPolicy, interactive_reserve: int = 1):
+        self.slots = max(1, slots)
+        if policy.bulk_max_running is None:
+            policy.bulk_max_running = max(1, self.slots - interactive_reserve)
+        self.policy = policy
+        self._tickets: Dict[str, Ticket] = {}
+        self._recent: Dict[str, Tuple[float, float]] = {}
+        self.usage: Dict[str, Dict[str, Any]] = {}
+
+    @staticmethod
+    def _new_usage() -> Dict[str, Any]:
+        return {"submitted": 0, "rejected": 0, "started": 0, **{outcome: 0 for outcome in OUTCOMES},
+                "wait_seconds": 0.0, "render_seconds": 0.0, "last_seen": None}
+
+    def _usage(self, client: str) -> Dict[str, Any]:
+        return self.usage.setdefault(client, self._new_usage())
+
+    def _recent_usage(self, client: str, now: float) -> float:
+        value, at = self._recent.get(client, (0.0, now))
+        return value * decayed(now - at, self.policy.usage_half_life)
+
+    def waiting(self, client: Optional[str] = None) -> int:
+        return sum(1 for ticket in self._tickets.values()
+                   if ticket.started_at is None and (client is None or ticket.client == client))
+
+    def submit(self, job_id: str, client: str, priority: str) -> Ticket:
+        """Queue a job for a slot; QuotaExceeded if its client already has client_max_queued waiting"""
+        usage = self._usage(client)
+        usage["last_seen"] = time.time()
+        if self.waiting(client) >= self.policy.client_max_queued:
+            usage["rejected"] += 1
+            raise QuotaExceeded(f"{self.policy.client_max_queued} jobs already waiting for this client")
+        usage["submitted"] += 1
+        ticket = Ticket(job_id, client, priority, time.monotonic(), asyncio.get_running_loop().create_future())
+        self._tickets[job_id] = ticket
+        self._dispatch()
+        return ticket
+
+    async def turn(self, ticket: Ticket):
+        """Wait until the ticket's job may start"""
+        await ticket.future
+
+    def finish(self, ticket: Ticket, outcome: str):
+        """Release the job's slot (or its place in the queue) and record how it ended"""
+        if self._tickets.get(ticket.job_id) is not ticket:
+            return
+        del self._tickets[ticket.job_id]
+        if not ticket.future.done():
+            ticket.future.cancel()
+        usage = self._usage(ticket.client)
+        if ticket.started_at is not None:
+            usage["render_seconds"] += time.monotonic() - ticket.started_at
+        usage[outcome if outcome in OUTCOMES else "cancelled"] += 1
+        self._dispatch()
+
+    def _dispatch(self):
+        while True:
+            running: Dict[str, int] = {}
+            bulk_running = 0
+            for ticket in self._tickets.values():
+                if ticket.started_at is not None:
+                    running[ticket.client] = running.get(ticket.client, 0) + 1
+                    bulk_running += ticket.priority == "bulk"
+            if sum(running.values()) >= self.slots:
+                return
+            now = time.monotonic()
+            waiting = [(t.job_id, t.client, t.priority, t.submitted_at)
+                       for t in self._tickets.values() if t.started_at is None and not t.future.done()]
+            recent = {client: self._recent_usage(client, now) for client in {w[1] for w in waiting}}
+            job_id = self.policy.pick(waiting, running, recent, bulk_running)
+            if job_id is None:
+                return
+            ticket = self._tickets[job_id]
+            ticket.started_at = now
+            ticket.future.set_result(None)
+            self._recent[ticket.client] = (self._recent_usage(ticket.client, now) + 1.0, now)
+            usage = self._usage(ticket.client)
+            usage["started"] += 1
+            usage["wait_seconds"] += now - ticket.submitted_at
+
+    def client_stats(self, client: str) -> Dict[str, Any]:
+        usage = self.usage.get(client) or self._new_usage()
+        now = time.monotonic()
+        return {
+            "client": client,
+            "weight": self.policy.weight(client),
+            "waiting": self.waiting(client),
+            "running": sum(1 for t in self._tickets.values() if t.client == client and t.started_at is not None),
+            "recent_starts": round(self._recent_usage(client, now), 2),
+            **{key: round(value, 2) if isinstance(value, float) else value for key, value in usage.items()}
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "slots": self.slots,
+            "running": sum(1 for t in self._tickets.values() if t.started_at is not None),
+            "waiting": self.waiting(),
+            "client_max_running": self.policy.client_max_running,
+            "client_max_queued": self.policy.client_max_queued,
+            "bulk_max_running": self.policy.bulk_max_running,
+            "clients": [self.client_stats(client) for client in self.usage]
+        }
+
+
+_scheduler: Optional[FairScheduler] = None
+
+
+def get_scheduler() -> FairScheduler:
+    """Process-wide scheduler with RENDER_SLOTS slots, RENDER_INTERACTIVE_RESERVE of them kept from bulk jobs"""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = FairScheduler(
+            int(os.environ.get("RENDER_SLOTS", "4")),
+            scheduling_policy_from_env(),
+            interactive_reserve=int(os.environ.get("RENDER_INTERACTIVE_RESERVE", "1"))
+        )
+    return _scheduler
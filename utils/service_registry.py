@@ -0,0 +1,91 @@
+import time
+import asyncio
+import threading
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceRegistry:
+    """Builds each service, and imports its heavy dependencies, on first use.
+
+    Services are reached as attributes (registry.openai_service) so call sites
+    read the same as with module-level instances. Build time and failures are
+    recorded per service for the readiness endpoint and cold-start tuning.
+    """
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._instances: Dict[str, Any] = {}
+        self._errors: Dict[str, str] = {}
+        self._build_ms: Dict[str, float] = {}
+        self._lock = threading.RLock()
+
+    def register(self, name: str, factory: Callable[[], Any]):
+        self._factories[name] = factory
+
+    def get(self, name: str) -> Any:
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        if name not in self._factories:
+            raise KeyError(f"Unknown service: {name}")
+        with self._lock:
+            if name in self._instances:
+                return self._instances[name]
+            start = time.perf_counter()
+            try:
+                instance = self._factories[name]()
+            except Exception as e:
+                # Readiness probes retry failed builds; only log a new error once
+                if self._errors.get(name) != str(e):
+                    logger.error(f"Failed to initialize {name}: {str(e)}")
+                self._errors[name] = str(e)
+                raise
+            self._build_ms[name] = round((time.perf_counter() - start) * 1000, 1)
+            self._errors.pop(name, None)
+            self._instances[name] = instance
+            logger.info(f"Initialized {name} in {self._build_ms[name]} ms")
+            return instance
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        try:
+            return self.get(name)
+        except KeyError:
+            raise AttributeError(name)
+
+    def set(self, name: str, instance: Any):
+        """Install a ready-made instance (tests, benchmarks, alternative backends)"""
+        self._instances[name] = instance
+
+    def warm_up(self, names: Optional[List[str]] = None) -> Dict[str, str]:
+        """Build every (or the named) service; returns the failures by name"""
+        for name in names or list(self._factories):
+            try:
+                self.get(name)
+            except Exception:
+                pass
+        return {name: error for name, error in self._errors.items() if name not in self._instances}
+
+    async def warm_up_async(self, names: Optional[List[str]] = None) -> Dict[str, str]:
+        """warm_up in a worker thread so imports don't stall the event loop"""
+        if all(name in self._instances for name in names or self._factories):
+            return {}
+        return await asyncio.to_thread(self.warm_up, names)
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            name: {
+                "ready": name in self._instances,
+                "build_ms": self._build_ms.get(name),
+                "error": self._errors.get(name)
+            }
+            for name in self._factories
+        }
+
+    @property
+    def ready(self) -> bool:
+        return all(name in self._instances for name in self._factories)
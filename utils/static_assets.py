@@ -0,0 +1,237 @@
+"""
+Content-hashed, precompressed static frontend assets.
+
+    python -m utils.static_assets            # build
+    python -m utils.static_assets --check    # exit 1 unless the build matches static/
+
+The build writes static/build/ from static/: every asset but the HTML pages gets a
+content-hashed name (script.<version>.js), references to /static/<name> in
+pages, stylesheets and scripts are rewritten to the hashed names, and text
+assets get gzip and (with the brotli package installed) brotli variants.
+It is a build step (every deploy config runs it): the server only reads the
+result, and serves the sources unbuilt when there is none.
+"""
+
+import os
+import re
+import sys
+import gzip
+import json
+import shutil
+import hashlib
+import logging
+import argparse
+import mimetypes
+from pathlib import Path, PurePosixPath
+from typing import Dict, Any, Iterable, Optional
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import Scope
+
+from utils.http_cache import IMMUTABLE, REVALIDATE, etag_matches, stat_signature, version
+
+try:
+    import brotli
+except ImportError:  # gzip variants only
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+SOURCE_DIR = Path("static")
+BUILD_DIR = SOURCE_DIR / "build"
+MANIFEST = "manifest.json"
+
+COMPRESSIBLE = {".html", ".css", ".js", ".json", ".svg", ".txt", ".xml"}
+# Preference order when a client accepts several
+ENCODINGS = ("br", "gzip")
+ENCODING_SUFFIX = {"br": ".br", "gzip": ".gz"}
+
+STATIC_REFERENCE = re.compile(r"/static/([\w.-]+)")
+
+
+def _compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=11)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def _fingerprinted(name: str, digest: str) -> str:
+    path = PurePosixPath(name)
+    return f"{path.stem}.{version(digest)}{path.suffix}"
+
+
+def _sources(source: Path) -> Iterable[Path]:
+    # Assets first, then the stylesheets and scripts that may reference them, then the pages
+    files = [path for path in source.iterdir() if path.is_file() and not path.name.startswith(".")]
+    return sorted(files, key=lambda path: (path.suffix == ".html", path.suffix in (".css", ".js"), path.name))
+
+
+def build(source: Path = SOURCE_DIR, target: Path = BUILD_DIR) -> Dict[str, Any]:
+    """Write the fingerprinted and precompressed assets plus their manifest into target"""
+    staging = target.with_name(f".{target.name}-{os.getpid()}")
+    shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir(parents=True)
+
+    renames: Dict[str, str] = {}
+    assets: Dict[str, Dict[str, Any]] = {}
+    for path in _sources(source):
+        data = path.read_bytes()
+        if path.suffix in COMPRESSIBLE:
+            text = STATIC_REFERENCE.sub(lambda m: "/static/" + renames.get(m.group(1), m.group(1)), data.decode("utf-8"))
+            data = text.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        # Pages keep their names: those are the URLs people open, share and bookmark
+        served = path.name if path.suffix == ".html" else _fingerprinted(path.name, digest)
+        if served != path.name:
+            renames[path.name] = served
+        (staging / served).write_bytes(data)
+
+        sizes = {"identity": len(data)}
+        if path.suffix in COMPRESSIBLE:
+            for encoding in ENCODINGS:
+                if encoding == "br" and brotli is None:
+                    continue
+                compressed = _compress(data, encoding)
+                if len(compressed) < len(data):
+                    (staging / (served + ENCODING_SUFFIX[encoding])).write_bytes(compressed)
+                    sizes[encoding] = len(compressed)
+        assets[path.name] = {
+            "path": served,
+            "digest": digest,
+            "sizes": sizes,
+            "source": list(stat_signature(path.stat()))
+        }
+
+    manifest = {"assets": assets}
+    (staging / MANIFEST).write_text(json.dumps(manifest, indent=2))
+
+    # Swap the whole directory so a running server never sees half a build
+    previous = target.with_name(f".{target.name}-old-{os.getpid()}")
+    if target.exists():
+        target.rename(previous)
+    staging.rename(target)
+    shutil.rmtree(previous, ignore_errors=True)
+    return manifest
+
+
+def load_manifest(source: Path = SOURCE_DIR, target: Path = BUILD_DIR) -> Optional[Dict[str, Any]]:
+    """The build's manifest if it covers exactly the current sources, else None"""
+    try:
+        manifest = json.loads((target / MANIFEST).read_text())
+        current = {path.name: list(stat_signature(path.stat())) for path in _sources(source)}
+    except (OSError, ValueError):
+        return None
+    recorded = {name: asset["source"] for name, asset in manifest["assets"].items()}
+    return manifest if recorded == current else None
+
+
+def negotiate(accept_encoding: str, available: Iterable[str]) -> Optional[str]:
+    """Preferred encoding out of available that the Accept-Encoding header allows, or None for identity"""
+    accepted: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding.strip():
+            accepted[coding.strip().lower()] = quality
+    for encoding in ENCODINGS:
+        if encoding in available and accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+class StaticAssets(StaticFiles):
+    """StaticFiles serving the build of its directory.
+
+    Hashed names are immutable. Pages and the original names (for pages
+    cached before a deploy) are served with their current content and must
+    be revalidated; both carry a strong ETag per encoding and answer
+    If-None-Match with 304. The variant is picked by Accept-Encoding. The
+    server never builds: without a build matching the sources (run
+    `python -m utils.static_assets`, as the Dockerfiles do), the sources are
+    served as plain StaticFiles would, with revalidation.
+    """
+
+    def __init__(self, directory: Path = SOURCE_DIR, build_dir: Path = BUILD_DIR):
+        super().__init__(directory=directory)
+        self.build_dir = Path(build_dir)
+        manifest = load_manifest(Path(directory), self.build_dir)
+        if manifest is None:
+            logger.warning(f"No static build matching {directory}/, serving it unbuilt; "
+                           f"run `python -m utils.static_assets`")
+            manifest = {"assets": {}}
+        self.assets: Dict[str, Dict[str, Any]] = manifest["assets"]
+        self._by_path = {asset["path"]: asset for asset in self.assets.values()}
+
+    def url(self, name: str) -> str:
+        """Current URL of a source asset"""
+        asset = self.assets.get(name)
+        return f"/static/{asset['path'] if asset else name}"
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        asset = self.assets.get(path)
+        if asset is not None:
+            return self._asset_response(asset, scope, REVALIDATE)
+        asset = self._by_path.get(path)
+        if asset is not None:
+            return self._asset_response(asset, scope, IMMUTABLE)
+        response = await super().get_response(path, scope)
+        response.headers.setdefault("cache-control", REVALIDATE)
+        return response
+
+    def _asset_response(self, asset: Dict[str, Any], scope: Scope, cache_control: str) -> Response:
+        request_headers = Headers(scope=scope)
+        encodings = [encoding for encoding in asset["sizes"] if encoding != "identity"]
+        encoding = negotiate(request_headers.get("accept-encoding", ""), encodings)
+
+        tag = asset["digest"][:32]
+        headers = {
+            "ETag": f'"{tag}-{encoding}"' if encoding else f'"{tag}"',
+            "Cache-Control": cache_control
+        }
+        if encodings:
+            headers["Vary"] = "Accept-Encoding"
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is not None and etag_matches(if_none_match, headers["ETag"]):
+            return Response(status_code=304, headers=headers)
+
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        media_type = mimetypes.guess_type(asset["path"])[0] or "application/octet-stream"
+        return FileResponse(
+            self.build_dir / (asset["path"] + (ENCODING_SUFFIX[encoding] if encoding else "")),
+            media_type=media_type,
+            headers=headers
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the fingerprinted, precompressed static assets")
+    parser.add_argument("--check", action="store_true",
+                        help="only check that a build matching the sources exists (exit 1 if not)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if args.check:
+        if load_manifest() is None:
+            logger.error(f"No static build matching {SOURCE_DIR}/; run `python -m utils.static_assets`")
+            sys.exit(1)
+        logger.info(f"{BUILD_DIR}/ matches {SOURCE_DIR}/")
+        return
+    manifest = build()
+    for name, asset in manifest["assets"].items():
+        sizes = ", ".join(f"{encoding} {size} B" for encoding, size in asset["sizes"].items())
+        logger.info(f"{name} -> {asset['path']} ({sizes})")
+    if brotli is None:
+        logger.info("brotli is not installed: gzip variants only")
+
+
+if __name__ == "__main__":
+    main()
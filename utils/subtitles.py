@@ -0,0 +1,91 @@
+import re
+import textwrap
+from pathlib import Path
+from typing import List, NamedTuple, Union
+
+# Caption layout: at most MAX_LINES lines of LINE_WIDTH characters per cue
+LINE_WIDTH = 42
+MAX_LINES = 2
+MIN_CUE_SECONDS = 0.8
+
+_SENTENCE_END = re.compile(r'(?<=[.!?…])["\')\]]*\s+')
+
+
+class Cue(NamedTuple):
+    start: float
+    end: float
+    text: str
+
+
+def split_sentences(text: str) -> List[str]:
+    return [sentence.strip() for sentence in _SENTENCE_END.split(text.strip()) if sentence.strip()]
+
+
+def _caption_chunks(sentence: str) -> List[str]:
+    """Break a sentence into cues that fit on screen"""
+    lines = textwrap.wrap(sentence, LINE_WIDTH)
+    return ["\n".join(lines[i:i + MAX_LINES]) for i in range(0, len(lines), MAX_LINES)]
+
+
+def _cue_lengths(chunks: List[str], duration: float) -> List[float]:
+    """Seconds per chunk, proportional to its length but at least MIN_CUE_SECONDS, summing to duration.
+
+    Time a short cue is padded with comes out of the longer ones. When the
+    audio is too short for every cue to get MIN_CUE_SECONDS, they all get
+    an equal share instead: every caption still shows.
+    """
+    minimum = min(MIN_CUE_SECONDS, duration / len(chunks))
+    padded = set()
+    while True:
+        free_time = duration - minimum * len(padded)
+        free_chars = sum(len(chunk) for i, chunk in enumerate(chunks) if i not in padded)
+        if not free_chars:
+            break
+        short = {i for i, chunk in enumerate(chunks)
+                 if i not in padded and free_time * len(chunk) / free_chars < minimum}
+        if not short:
+            break
+        padded |= short
+    return [minimum if i in padded else free_time * len(chunk) / free_chars for i, chunk in enumerate(chunks)]
+
+
+def build_cues(script: str, duration: float) -> List[Cue]:
+    """One cue per sentence (or screenful of a long sentence) spread over the voiceover.
+
+    The TTS output carries no word timings, so each cue gets a share of the
+    audio duration proportional to its length in characters, which tracks
+    narration speed closely for a single voice.
+    """
+    chunks = [chunk for sentence in split_sentences(script) for chunk in _caption_chunks(sentence)]
+    if not chunks or duration <= 0:
+        return []
+
+    cues = []
+    start = 0.0
+    for chunk, length in zip(chunks, _cue_lengths(chunks, duration)):
+        cues.append(Cue(start, start + length, chunk))
+        start += length
+    # Absorb rounding so the last caption stays up until the narration ends
+    cues[-1] = cues[-1]._replace(end=duration)
+    return cues
+
+
+def _timestamp(seconds: float) -> str:
+    millis = int(round(seconds * 1000))
+    hours, millis = divmod(millis, 3600000)
+    minutes, millis = divmod(millis, 60000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d},{millis:03d}"
+
+
+def format_srt(cues: List[Cue]) -> str:
+    return "\n".join(
+        f"{i}\n{_timestamp(cue.start)} --> {_timestamp(cue.end)}\n{cue.text}\n"
+        for i, cue in enumerate(cues, 1)
+    )
+
+
+def write_srt(script: str, duration: float, path: Union[str, Path]) -> Path:
+    path = Path(path)
+    path.write_text(format_srt(build_cues(script, duration)), encoding="utf-8")
+    return path
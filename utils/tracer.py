@@ -0,0 +1,178 @@
+import os
+import json
+import time
+import threading
+import contextvars
+import logging
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Union
+
+from utils.memory import get_memory_accounting
+
+logger = logging.getLogger(__name__)
+
+# Tracer for the session currently running in this context. asyncio tasks copy
+# the context when they are created, so every service call made on behalf of a
+# session sees that session's tracer without it being passed around.
+_current_tracer: contextvars.ContextVar[Optional["SessionTracer"]] = contextvars.ContextVar(
+    "session_tracer", default=None
+)
+# Innermost open "stage" span in this context, for tagging log records
+_current_stage: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("pipeline_stage", default=None)
+
+
+class Span:
+    """A single traced operation; extra args can be attached while it runs"""
+
+    def __init__(self, name: str, category: str, args: Dict[str, Any]):
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def set(self, **args):
+        """Attach extra arguments (byte counts, sizes, return codes, ...)"""
+        self.args.update(args)
+
+
+class _NullSpan(Span):
+    def __init__(self):
+        super().__init__("", "", {})
+
+    def set(self, **args):
+        pass
+
+
+class SessionTracer:
+    """Collects spans for one generation session as Chrome trace events"""
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.events: List[Dict[str, Any]] = []
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self._busy_lanes = set()
+        self._active: Dict[str, int] = {}
+
+    def _now_us(self) -> float:
+        return (time.perf_counter() - self._origin) * 1_000_000
+
+    def _acquire_lane(self) -> int:
+        # Overlapping spans must live on separate rows in the trace viewer,
+        # so each open span takes the lowest free lane.
+        lane = 1
+        while lane in self._busy_lanes:
+            lane += 1
+        self._busy_lanes.add(lane)
+        return lane
+
+    @contextmanager
+    def span(self, name: str, category: str = "pipeline", **args):
+        """Record a complete ("X") event around the wrapped block"""
+        span = Span(name, category, dict(args))
+        with self._lock:
+            lane = self._acquire_lane()
+            self._active[category] = self._active.get(category, 0) + 1
+            span.args["concurrency"] = self._active[category]
+        stage_token = _current_stage.set(name) if category == "stage" else None
+        # Stages also record what they cost in memory, in the span and in /debug/memory
+        memory_mark = get_memory_accounting().begin() if category == "stage" else None
+        start = self._now_us()
+        try:
+            yield span
+        except BaseException as e:
+            span.args["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            end = self._now_us()
+            if stage_token is not None:
+                _current_stage.reset(stage_token)
+            if memory_mark is not None:
+                span.args.update(get_memory_accounting().end(memory_mark, self.session_id, name))
+            with self._lock:
+                self._busy_lanes.discard(lane)
+                self._active[category] -= 1
+                self.events.append({
+                    "name": name,
+                    "cat": category,
+                    "ph": "X",
+                    "ts": round(start, 1),
+                    "dur": round(end - start, 1),
+                    "pid": 1,
+                    "tid": lane,
+                    "args": span.args
+                })
+
+    def instant(self, name: str, category: str = "pipeline", **args):
+        """Record a point-in-time marker"""
+        with self._lock:
+            self.events.append({
+                "name": name,
+                "cat": category,
+                "ph": "i",
+                "s": "p",
+                "ts": round(self._now_us(), 1),
+                "pid": 1,
+                "tid": 0,
+                "args": args
+            })
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Build the Chrome/Perfetto JSON trace document"""
+        with self._lock:
+            events = list(self.events)
+        lanes = sorted({event["tid"] for event in events})
+        metadata = [{
+            "name": "process_name", "ph": "M", "pid": 1, "tid": 0,
+            "args": {"name": f"session {self.session_id}"}
+        }]
+        for lane in lanes:
+            metadata.append({
+                "name": "thread_name", "ph": "M", "pid": 1, "tid": lane,
+                "args": {"name": "markers" if lane == 0 else f"lane {lane}"}
+            })
+        return {
+            "traceEvents": metadata + sorted(events, key=lambda e: e["ts"]),
+            "displayTimeUnit": "ms",
+            "otherData": {"session_id": self.session_id, "pid": os.getpid()}
+        }
+
+    def save(self, path: Union[str, Path]) -> Path:
+        """Write the trace as JSON"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f)
+        logger.info(f"Saved trace with {len(self.events)} events: {path}")
+        return path
+
+
+def get_tracer() -> Optional[SessionTracer]:
+    """Return the tracer of the session running in this context, if any"""
+    return _current_tracer.get()
+
+
+def tracer_in(context: contextvars.Context) -> Optional[SessionTracer]:
+    """Tracer active in another context, e.g. the callback an event loop is running"""
+    return context.get(_current_tracer)
+
+
+def get_stage() -> Optional[str]:
+    """Name of the pipeline stage running in this context, if any"""
+    return _current_stage.get()
+
+
+def use_tracer(tracer: Optional[SessionTracer]) -> contextvars.Token:
+    """Make tracer the active one for the current context"""
+    return _current_tracer.set(tracer)
+
+
+@contextmanager
+def trace_span(name: str, category: str = "pipeline", **args):
+    """Span on the active session tracer; a no-op outside a traced session"""
+    tracer = _current_tracer.get()
+    if tracer is None:
+        yield _NullSpan()
+        return
+    with tracer.span(name, category, **args) as span:
+        yield span
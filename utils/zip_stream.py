@@ -0,0 +1,53 @@
+import zipfile
+from pathlib import Path
+from typing import Iterable, Iterator, List, Tuple
+
+CHUNK_SIZE = 256 * 1024
+
+# Already compressed: deflating them again costs CPU and saves next to nothing
+STORED_SUFFIXES = {".mp4", ".mp3", ".m4a", ".aac", ".png", ".jpg", ".jpeg", ".webp", ".gif", ".zip", ".gz"}
+
+
+class _Sink:
+    """Write-only file object collecting what ZipFile writes until the generator hands it on"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> Iterator[bytes]:
+        if self._chunks:
+            data = b"".join(self._chunks)
+            self._chunks.clear()
+            yield data
+
+
+def stream_zip(entries: Iterable[Tuple[str, Path]]) -> Iterator[bytes]:
+    """ZIP archive of (name in archive, file) pairs, produced as it is read.
+
+    Media are stored, everything else deflated. The output cannot seek back
+    to patch local headers, so each entry's CRC and sizes follow its data
+    in a data descriptor, as ZipFile does for any unseekable file. At most
+    one CHUNK_SIZE read (plus deflate's small window) is held at a time,
+    whatever the size of the archive. Blocking: iterate it in a thread.
+    """
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w") as archive:
+        for name, path in entries:
+            info = zipfile.ZipInfo.from_file(path, name)
+            info.compress_type = (
+                zipfile.ZIP_STORED if path.suffix.lower() in STORED_SUFFIXES else zipfile.ZIP_DEFLATED
+            )
+            with open(path, "rb") as source, archive.open(info, "w") as target:
+                yield from sink.drain()
+                while chunk := source.read(CHUNK_SIZE):
+                    target.write(chunk)
+                    yield from sink.drain()
+            yield from sink.drain()
+    yield from sink.drain()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Render worker for RunHistory.log Generator
+
+Runs the generation pipeline for jobs the API enqueued (RENDER_MODE=queue),
+so Pillow overlays and ffmpeg encodes never share a process with the web tier.
+Start it from the same directory as the API so both see generated/ and the
+job queue:
+
+    RENDER_MODE=queue python start.py
+    python worker.py --workers 4
+"""
+
+import os
+import sys
+import time
+import signal
+import socket
+import asyncio
+import argparse
+import logging
+import multiprocessing
+from pathlib import Path
+from typing import Dict, Set
+
+from utils.logging_setup import configure_logging, stop_logging
+
+configure_logging(log_file='worker.log')
+
+logger = logging.getLogger(__name__)
+
+# Status is published (and the worker proven alive) every HEARTBEAT_INTERVAL;
+# running jobs without a heartbeat for STALE_AFTER are handed to another worker
+HEARTBEAT_INTERVAL = float(os.environ.get("WORKER_HEARTBEAT_INTERVAL", "2"))
+STALE_AFTER = float(os.environ.get("WORKER_STALE_AFTER", "60"))
+MAX_ATTEMPTS = int(os.environ.get("WORKER_MAX_ATTEMPTS", "3"))
+RESTART_BACKOFF = 10.0
+# Jobs whose status nobody has polled for this long are cancelled (0 disables)
+IDLE_CANCEL_SECONDS = float(os.environ.get("IDLE_CANCEL_SECONDS", "0"))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Render worker for RunHistory.log Generator")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WORKERS", os.cpu_count() or 1)),
+                        help="worker processes to run (default: CPU count)")
+    parser.add_argument("--jobs", type=int, default=int(os.environ.get("WORKER_JOBS", "1")),
+                        help="pipelines each worker process runs at once")
+    parser.add_argument("--poll-interval", type=float, default=1.0,
+                        help="seconds between queue polls while idle")
+    return parser.parse_args()
+
+async def publish_status(queue, worker_id: str, running: Dict[str, asyncio.Task], cancelled: Set[str],
+                         generation_status):
+    """Heartbeat loop: push each running job's status, apply cancellations and recover jobs of dead workers"""
+    while True:
+        for session_id in list(running):
+            status = generation_status.get(session_id)
+            if status is not None:
+                await asyncio.to_thread(queue.heartbeat, session_id, worker_id, status.model_dump())
+        for session_id, reason in await asyncio.to_thread(queue.cancel_requests, worker_id, IDLE_CANCEL_SECONDS):
+            task = running.get(session_id)
+            if task is not None and session_id not in cancelled:
+                logger.info(f"[{worker_id}] Cancelling {session_id}: {reason}")
+                cancelled.add(session_id)
+                task.cancel(reason)
+        await asyncio.to_thread(queue.requeue_stale, STALE_AFTER, MAX_ATTEMPTS)
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+async def run_job(queue, worker_id: str, job, cancelled: Set[str]):
+    from main import generate_video_task, generation_status
+    from models.models import GenerationStatus
+
+    generation_status[job.session_id] = GenerationStatus(**job.status)
+    logger.info(f"[{worker_id}] Rendering {job.session_id} (attempt {job.attempts})")
+    try:
+        await generate_video_task(job.session_id, job.topic)
+    except asyncio.CancelledError:
+        if job.session_id in cancelled:
+            status = generation_status[job.session_id]
+            await asyncio.shield(asyncio.to_thread(queue.finish, job.session_id, worker_id, status.model_dump()))
+            logger.info(f"[{worker_id}] Cancelled {job.session_id}")
+        else:
+            # Shutting down: let another worker resume the job from its checkpoint
+            await asyncio.shield(asyncio.to_thread(queue.release, job.session_id, worker_id))
+            logger.info(f"[{worker_id}] Released {job.session_id} back to the queue")
+        raise
+    else:
+        status = generation_status[job.session_id]
+        await asyncio.to_thread(queue.finish, job.session_id, worker_id, status.model_dump())
+        logger.info(f"[{worker_id}] Finished {job.session_id}: {status.status}")
+    finally:
+        generation_status.pop(job.session_id, None)
+        cancelled.discard(job.session_id)
+
+async def run_worker(jobs: int, poll_interval: float):
+    from main import generation_status, registry
+    from utils.job_queue import get_job_queue
+    from utils.loop_monitor import loop_monitor_from_env
+    from utils.scheduler import scheduling_policy_from_env
+
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    failures = await registry.warm_up_async()
+    if failures:
+        logger.error(f"[{worker_id}] Cannot start, services unavailable: {failures}")
+        sys.exit(1)
+
+    queue = get_job_queue()
+    # Every worker applies the same per-client caps and fair-share order to the shared queue
+    policy = scheduling_policy_from_env()
+    stop = asyncio.Event()
+    wake = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, lambda: (stop.set(), wake.set()))
+
+    # Stalls are logged with their stack's location and session
+    monitor = loop_monitor_from_env()
+    if monitor is not None:
+        monitor.start()
+
+    running: Dict[str, asyncio.Task] = {}
+    cancelled: Set[str] = set()
+    heartbeat = asyncio.create_task(publish_status(queue, worker_id, running, cancelled, generation_status))
+    logger.info(f"[{worker_id}] Waiting for jobs in {queue.path}")
+
+    while not stop.is_set():
+        while len(running) < jobs:
+            job = await asyncio.to_thread(queue.claim, worker_id, policy)
+            if job is None:
+                break
+            task = asyncio.create_task(run_job(queue, worker_id, job, cancelled))
+            running[job.session_id] = task
+            task.add_done_callback(lambda _, session_id=job.session_id: (running.pop(session_id, None), wake.set()))
+        try:
+            await asyncio.wait_for(wake.wait(), poll_interval)
+        except asyncio.TimeoutError:
+            pass
+        wake.clear()
+
+    logger.info(f"[{worker_id}] Stopping, releasing {len(running)} running job(s)")
+    for task in list(running.values()):
+        task.cancel()
+    await asyncio.gather(*running.values(), return_exceptions=True)
+    heartbeat.cancel()
+    if monitor is not None:
+        await monitor.stop()
+
+def worker_process(jobs: int, poll_interval: float):
+    # Drop the supervisor's handlers inherited through fork; run_worker installs its own
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    # A forked child has the log queue but not the thread that writes it out
+    configure_logging(log_file='worker.log', force=True)
+    try:
+        asyncio.run(run_worker(jobs, poll_interval))
+    finally:
+        stop_logging()
+
+def main():
+    """Start and supervise the worker processes"""
+    args = parse_args()
+    Path("generated").mkdir(exist_ok=True)
+    os.environ.setdefault("PYTHONUNBUFFERED", "1")
+
+    if args.workers <= 1:
+        worker_process(args.jobs, args.poll_interval)
+        return
+
+    logger.info(f"Starting {args.workers} render workers, {args.jobs} job(s) each")
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    def spawn() -> multiprocessing.Process:
+        process = multiprocessing.Process(target=worker_process, args=(args.jobs, args.poll_interval))
+        process.start()
+        started[process.pid] = time.monotonic()
+        return process
+
+    started: Dict[int, float] = {}
+    processes = [spawn() for _ in range(args.workers)]
+    while not stopping:
+        for i, process in enumerate(processes):
+            if process.exitcode is None or stopping:
+                continue
+            # A worker that dies right after starting (e.g. missing API key) is retried slowly
+            if time.monotonic() - started[process.pid] < RESTART_BACKOFF:
+                continue
+            logger.warning(f"Worker {process.pid} exited with {process.exitcode}, restarting")
+            started.pop(process.pid, None)
+            processes[i] = spawn()
+        time.sleep(1)
+
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+    for process in processes:
+        process.join()
+
+if __name__ == "__main__":
+    main()